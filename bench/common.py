@@ -0,0 +1,29 @@
+import statistics
+import subprocess
+
+# Utilidades compartidas por bench.run y bench.startup
+
+
+def summarize(muestras):
+    # Estadísticas de una lista de latencias (segundos)
+    ordenadas = sorted(muestras)
+    p95 = ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * 0.95))]
+    return {
+        "n": len(muestras),
+        "min": ordenadas[0],
+        "mediana": statistics.median(ordenadas),
+        "p95": p95,
+        "max": ordenadas[-1],
+        "media": statistics.fmean(ordenadas),
+    }
+
+
+def git_commit(ruta):
+    # Commit actual del proyecto, para saber qué se midió; None fuera de git
+    try:
+        salida = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ruta, capture_output=True, text=True, check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return salida.stdout.strip()
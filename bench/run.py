@@ -0,0 +1,236 @@
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import datetime
+from contextlib import redirect_stdout
+from core.context_manager import Session
+from core.version_control import VersionControl
+from core.pipeline import DEFAULT_WORKERS
+from users.user_manager import UserManager
+from utils import metrics
+from bench.common import git_commit, summarize
+from bench.synthetic import generate_tree, mutate_tree, generate_users, disk_usage
+
+# Uso (desde la raíz del proyecto):
+#   python -m bench.run --archivos 2000 --salida resultados.json
+#   python -m bench.run --comparar base.json --salida nuevos.json
+# Cada ejecución trabaja en una carpeta temporal propia (repo_root y data
+# se crean allí), así no toca los datos reales del proyecto.
+
+DUENO = "dueno"
+LECTOR = "lector"
+
+
+class Bench:
+    def __init__(self, args):
+        self.args = args
+        self.resultados = {}
+
+    def medir(self, nombre, funcion, repeticiones=1, preparar=None, archivos=None, bytes_=None):
+        # Ejecuta la operación `repeticiones` veces y guarda su latencia. La
+        # salida por pantalla de las operaciones se descarta.
+        muestras = []
+        for i in range(repeticiones):
+            if preparar:
+                with redirect_stdout(io.StringIO()):
+                    preparar(i)
+            with redirect_stdout(io.StringIO()):
+                inicio = time.perf_counter()
+                funcion()
+                muestras.append(time.perf_counter() - inicio)
+        resultado = summarize(muestras)
+        if archivos:
+            resultado["archivos_por_s"] = archivos / resultado["mediana"]
+        if bytes_:
+            resultado["mb_por_s"] = bytes_ / resultado["mediana"] / 1e6
+        self.resultados[nombre] = resultado
+        print(f"{nombre:28s} mediana {resultado['mediana'] * 1000:10.2f} ms   p95 {resultado['p95'] * 1000:10.2f} ms")
+        return resultado
+
+    def run(self):
+        a = self.args
+        um = UserManager()
+        with redirect_stdout(io.StringIO()):
+            um.create_user(DUENO)
+            um.create_user(LECTOR)
+            um.assign_permission(DUENO, LECTOR, "read")
+        vc = VersionControl(Session(DUENO, DUENO), um, workers=a.hilos)
+        temporal = vc.ctx.get_context()["path"]
+
+        rutas = generate_tree(temporal, a.archivos, a.tamano, a.profundidad, a.semilla)
+        total_bytes = disk_usage(temporal)
+
+        # Commit inicial: todos los archivos son nuevos
+        self.medir("commit_inicial", vc.commit, archivos=len(rutas), bytes_=total_bytes)
+        self.medir("commit_sin_cambios", vc.commit, a.repeticiones)
+
+        estado = {"rutas": rutas}
+
+        def cambiar(i):
+            estado["rutas"] = mutate_tree(temporal, estado["rutas"], a.cambios, a.semilla + i + 1)
+
+        self.medir("commit_incremental", vc.commit, a.repeticiones, preparar=cambiar)
+
+        versiones = vc._log(DUENO).names()
+        primera = versiones[0]
+
+        lector = VersionControl(Session(LECTOR, DUENO), um, workers=a.hilos)
+        destino_lector = lector.ctx.get_context()["path"]
+        self.medir(
+            "update_en_frio",
+            lector.update,
+            a.repeticiones,
+            preparar=lambda i: shutil.rmtree(destino_lector, ignore_errors=True),
+            archivos=len(estado["rutas"]),
+        )
+        self.medir("update_sin_cambios", lector.update, a.repeticiones)
+
+        self.medir("recover_version", lambda: vc.recover(primera), a.repeticiones, archivos=len(rutas))
+        self.medir("recover_version_actual", lambda: vc.recover(versiones[-1]), a.repeticiones)
+        archivo = random.Random(a.semilla).choice(rutas)
+        self.medir("recover_archivo", lambda: vc.recover(primera, archivo, is_file=True), a.repeticiones)
+
+        self.medir("list_versions", vc.list_versions, a.repeticiones)
+        self.medir("list_files_in_version", lambda: vc.list_files_in_version(primera), a.repeticiones)
+
+        nombres = generate_users(um, a.usuarios, a.permisos, a.semilla)
+        rng = random.Random(a.semilla)
+        pares = [tuple(rng.sample(nombres, 2)) for _ in range(a.consultas)]
+
+        def consultar():
+            for actual, destino in pares:
+                um.has_write_permission(actual, destino)
+                um.has_read_permission(actual, destino)
+
+        r = self.medir("permisos", consultar, a.repeticiones)
+        r["consultas_por_s"] = 2 * len(pares) / r["mediana"]
+
+        repo = os.path.join(vc.base_repo, DUENO)
+        disco = {"trabajo": total_bytes, "repositorio": disk_usage(repo)}
+        if a.grande:
+            disco.update(self.run_large(vc, temporal, os.path.join(repo, "objetos")))
+        for sub in ("objetos", "versiones", "permanente"):
+            disco[sub] = disk_usage(os.path.join(repo, sub))
+        disco["versiones_guardadas"] = len(vc._log(DUENO).names())
+        return disco
+
+    def run_large(self, vc, temporal, objetos):
+        # Un archivo binario grande: commit completo y después, con unos pocos
+        # bytes insertados en el medio, solo deberían guardarse los fragmentos
+        # cercanos a la edición.
+        tamano = self.args.grande * 1024 * 1024
+        path = os.path.join(temporal, "grande.bin")
+        with open(path, "wb") as f:
+            f.write(random.Random(self.args.semilla).randbytes(tamano))
+        antes = disk_usage(objetos)
+        self.medir("commit_grande", vc.commit, bytes_=tamano)
+        completo = disk_usage(objetos) - antes
+        version = vc._log(DUENO).names()[-1]
+
+        def insertar(i):
+            with open(path, "rb") as f:
+                data = f.read()
+            # Archivo nuevo en lugar de escribir sobre un posible enlace al blob
+            os.remove(path)
+            with open(path, "wb") as f:
+                f.write(data[:tamano // 2] + b"edicion" * (i + 1) + data[tamano // 2:])
+
+        antes = disk_usage(objetos)
+        self.medir("commit_grande_editado", vc.commit, preparar=insertar, bytes_=tamano)
+        editado = disk_usage(objetos) - antes
+        self.medir("recover_grande", lambda: vc.recover(version, "grande.bin", is_file=True), bytes_=tamano)
+        return {"grande_commit_bytes": completo, "grande_edicion_bytes": editado}
+
+
+def compare(base, nuevo, tolerancia):
+    # Devuelve las operaciones cuya mediana empeoró más que la tolerancia
+    regresiones = []
+    for nombre, actual in nuevo["operaciones"].items():
+        previo = base.get("operaciones", {}).get(nombre)
+        if not previo or not previo["mediana"]:
+            continue
+        ratio = actual["mediana"] / previo["mediana"]
+        if ratio > 1 + tolerancia:
+            regresiones.append({"operacion": nombre, "antes": previo["mediana"], "ahora": actual["mediana"], "ratio": ratio})
+    return regresiones
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m bench.run", description="Mediciones de rendimiento")
+    parser.add_argument("--archivos", type=int, default=1000, help="Archivos del repositorio sintético")
+    parser.add_argument("--tamano", type=int, default=4096, help="Tamaño medio de cada archivo en bytes")
+    parser.add_argument("--profundidad", type=int, default=3, help="Niveles de carpetas como máximo")
+    parser.add_argument("--cambios", type=float, default=0.05, help="Proporción de archivos cambiados por commit")
+    parser.add_argument("--usuarios", type=int, default=1000)
+    parser.add_argument("--permisos", type=int, default=5000)
+    parser.add_argument("--consultas", type=int, default=10000, help="Consultas de permisos por repetición")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--grande", type=int, default=0, help="Medir también un archivo binario de N MB editado en el medio")
+    parser.add_argument("--hilos", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--backend", choices=("json", "sqlite"), default="json", help="Almacenamiento de usuarios")
+    parser.add_argument("--salida", help="Archivo JSON de resultados (por defecto, solo por pantalla)")
+    parser.add_argument("--comparar", help="Resultados anteriores contra los que comparar")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="Empeoramiento admitido al comparar (0.2 = 20%%)")
+    parser.add_argument("--conservar", action="store_true", help="No borrar la carpeta temporal")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    proyecto = os.getcwd()
+    salida = os.path.abspath(args.salida) if args.salida else None
+    comparar = os.path.abspath(args.comparar) if args.comparar else None
+
+    carpeta = tempfile.mkdtemp(prefix="vcs-bench-")
+    os.environ["VCS_USERS_BACKEND"] = args.backend
+    try:
+        os.chdir(carpeta)
+        os.makedirs("data", exist_ok=True)
+        bench = Bench(args)
+        disco = bench.run()
+    finally:
+        os.chdir(proyecto)
+        if args.conservar:
+            print(f"Carpeta de trabajo conservada en {carpeta}")
+        else:
+            shutil.rmtree(carpeta, ignore_errors=True)
+
+    resultado = {
+        "fecha": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(proyecto),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "parametros": {k: v for k, v in vars(args).items() if k not in ("salida", "comparar", "conservar")},
+        "operaciones": bench.resultados,
+        "disco": disco,
+        "metricas": metrics.snapshot(),
+    }
+    print(f"Disco: {disco}")
+
+    codigo = 0
+    if comparar:
+        with open(comparar, "r", encoding="utf-8") as f:
+            regresiones = compare(json.load(f), resultado, args.tolerancia)
+        resultado["regresiones"] = regresiones
+        for r in regresiones:
+            print(f"REGRESIÓN {r['operacion']}: {r['antes'] * 1000:.2f} ms -> {r['ahora'] * 1000:.2f} ms (x{r['ratio']:.2f})")
+        codigo = 1 if regresiones else 0
+
+    if salida:
+        with open(salida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+        print(f"Resultados guardados en {salida}")
+    return codigo
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+import os
+import sys
+import json
+import time
+import shlex
+import shutil
+import argparse
+import platform
+import tempfile
+import datetime
+import subprocess
+from bench.common import git_commit, summarize
+
+# Uso (desde la raíz del proyecto):
+#   python -m bench.startup --repeticiones 30
+#   python -m bench.startup --objetivo 40 --comando "log --ultimas 1"
+# Mide el arranque en frío de main.py: cada muestra es un proceso nuevo, como
+# cuando un script lo invoca miles de veces. Se descuenta el arranque del propio
+# intérprete (python -c pass) y termina con código 1 si la mediana de algún
+# comando supera el objetivo.
+
+COMANDOS = ("users", "status", "log --ultimas 1")
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+
+
+def _ejecutar(argv, carpeta):
+    inicio = time.perf_counter()
+    subprocess.run(argv, cwd=carpeta, stdout=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - inicio
+
+
+def _preparar(carpeta):
+    # Un repositorio con una versión, para que los comandos tengan algo que leer
+    for comando in ("user-add ana beto", "grant ana beto read", "use ana ana"):
+        _ejecutar([sys.executable, MAIN] + comando.split(), carpeta)
+    with open(os.path.join(carpeta, "repo_root", "ana", "temporal", "notas.txt"), "w") as f:
+        f.write("arranque\n")
+    _ejecutar([sys.executable, MAIN, "commit"], carpeta)
+
+
+def medir(argv, carpeta, repeticiones):
+    # La primera ejecución compila los .pyc y no se cuenta
+    _ejecutar(argv, carpeta)
+    return summarize([_ejecutar(argv, carpeta) for _ in range(repeticiones)])
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m bench.startup", description="Tiempo de arranque de main.py")
+    parser.add_argument("--repeticiones", type=int, default=20)
+    parser.add_argument("--comando", action="append", help="Comando a medir (se puede repetir); por defecto: "
+                        + ", ".join(COMANDOS))
+    parser.add_argument("--objetivo", type=float, default=40.0,
+                        help="Milisegundos admitidos por encima de 'python -c pass' (mediana)")
+    parser.add_argument("--backend", choices=("json", "sqlite"), default="json", help="Almacenamiento de usuarios")
+    parser.add_argument("--salida", help="Archivo JSON de resultados (por defecto, solo por pantalla)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    comandos = args.comando or list(COMANDOS)
+    salida = os.path.abspath(args.salida) if args.salida else None
+
+    carpeta = tempfile.mkdtemp(prefix="vcs-startup-")
+    os.environ["VCS_USERS_BACKEND"] = args.backend
+    try:
+        _preparar(carpeta)
+        base = medir([sys.executable, "-c", "pass"], carpeta, args.repeticiones)
+        print(f"{'python -c pass':<24} mediana {base['mediana'] * 1000:7.2f} ms")
+        operaciones = {}
+        excedidos = []
+        for comando in comandos:
+            r = medir([sys.executable, MAIN] + shlex.split(comando), carpeta, args.repeticiones)
+            r["sobre_python"] = r["mediana"] - base["mediana"]
+            operaciones[comando] = r
+            print(f"{comando:<24} mediana {r['mediana'] * 1000:7.2f} ms "
+                  f"(+{r['sobre_python'] * 1000:.2f} ms sobre python, p95 {r['p95'] * 1000:.2f} ms)")
+            if r["sobre_python"] * 1000 > args.objetivo:
+                excedidos.append(comando)
+    finally:
+        shutil.rmtree(carpeta, ignore_errors=True)
+
+    for comando in excedidos:
+        print(f"OBJETIVO SUPERADO {comando}: +{operaciones[comando]['sobre_python'] * 1000:.2f} ms "
+              f"(objetivo {args.objetivo:.2f} ms)")
+
+    if salida:
+        resultado = {
+            "fecha": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(os.path.dirname(MAIN)),
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "parametros": {k: v for k, v in vars(args).items() if k != "salida"},
+            "python_vacio": base,
+            "operaciones": operaciones,
+            "excedidos": excedidos,
+        }
+        with open(salida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+        print(f"Resultados guardados en {salida}")
+    return 1 if excedidos else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+import os
+import random
+
+# Generador de repositorios sintéticos para las mediciones. Todo es
+# determinista a partir de la semilla, así dos ejecuciones miden lo mismo.
+
+PALABRAS = (
+    "version", "archivo", "usuario", "permiso", "commit", "carpeta", "datos",
+    "registro", "cambio", "objeto", "manifiesto", "lectura", "escritura",
+)
+
+
+def _contenido(rng, tamano):
+    lineas = []
+    total = 0
+    while total < tamano:
+        linea = " ".join(rng.choice(PALABRAS) for _ in range(rng.randint(4, 12))) + "\n"
+        lineas.append(linea)
+        total += len(linea)
+    return "".join(lineas)[:tamano].encode("utf-8")
+
+
+def _carpeta(rng, profundidad, ancho=4):
+    partes = [f"dir{rng.randrange(ancho)}" for _ in range(rng.randint(0, profundidad))]
+    return "/".join(partes)
+
+
+def generate_tree(base_path, archivos, tamano, profundidad, semilla=0):
+    # Crea `archivos` archivos de texto de unos `tamano` bytes repartidos en
+    # carpetas de hasta `profundidad` niveles. Devuelve las rutas relativas.
+    rng = random.Random(semilla)
+    rutas = []
+    for i in range(archivos):
+        carpeta = _carpeta(rng, profundidad)
+        rel = f"{carpeta}/f{i:06d}.txt" if carpeta else f"f{i:06d}.txt"
+        full = os.path.join(base_path, *rel.split("/"))
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+        # Tamaños variables alrededor del valor pedido
+        with open(full, "wb") as f:
+            f.write(_contenido(rng, max(1, int(tamano * rng.uniform(0.5, 1.5)))))
+        rutas.append(rel)
+    return rutas
+
+
+def mutate_tree(base_path, rutas, proporcion, semilla=0):
+    # Modifica una fracción de los archivos: la mayoría cambia unas líneas y
+    # algunos se reemplazan por archivos nuevos. Devuelve las rutas actuales.
+    rng = random.Random(semilla)
+    cantidad = max(1, int(len(rutas) * proporcion)) if proporcion > 0 else 0
+    elegidas = rng.sample(rutas, min(cantidad, len(rutas)))
+    rutas = list(rutas)
+    for n, rel in enumerate(elegidas):
+        full = os.path.join(base_path, *rel.split("/"))
+        if n % 10 == 9:
+            os.remove(full)
+            rutas.remove(rel)
+            nueva = f"{os.path.dirname(rel) + '/' if '/' in rel else ''}n{semilla}_{n}.txt"
+            with open(os.path.join(base_path, *nueva.split("/")), "wb") as f:
+                f.write(_contenido(rng, 512))
+            rutas.append(nueva)
+            continue
+        with open(full, "ab") as f:
+            f.write(_contenido(rng, 64))
+    return rutas
+
+
+def generate_users(user_manager, usuarios, permisos, semilla=0):
+    # Crea `usuarios` usuarios y asigna `permisos` permisos aleatorios
+    rng = random.Random(semilla)
+    nombres = [f"u{i:05d}" for i in range(usuarios)]
+    existentes = user_manager.load_users()
+    cambios = []
+    for _ in range(permisos):
+        dueno, usuario = rng.sample(nombres, 2)
+        cambios.append(("grant", dueno, usuario, rng.choice(("read", "write"))))
+    # Una sola escritura en lugar de una por usuario
+    user_manager.bulk([n for n in nombres if n not in existentes], cambios)
+    return nombres
+
+
+def disk_usage(path):
+    total = 0
+    vistos = set()
+    for root, _, filenames in os.walk(path):
+        for name in filenames:
+            st = os.lstat(os.path.join(root, name))
+            # Los enlaces duros ocupan disco una sola vez
+            if (st.st_dev, st.st_ino) in vistos:
+                continue
+            vistos.add((st.st_dev, st.st_ino))
+            total += st.st_size
+    return total
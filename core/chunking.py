@@ -0,0 +1,169 @@
+import io
+import os
+import re
+import zlib
+from bisect import bisect_right
+from itertools import accumulate
+
+# Los archivos desde este tamaño se guardan por fragmentos
+CHUNKED_MIN_SIZE = 8 * 1024 * 1024
+CHUNK_MIN = 512 * 1024
+CHUNK_MAX = 8 * 1024 * 1024
+READ_SIZE = 16 * 1024 * 1024
+
+# Los cortes dependen del contenido, así al insertar o borrar bytes solo cambian
+# los fragmentos vecinos a la edición; el resto vuelve a cortarse en los mismos
+# puntos y no se guarda otra vez. Todo se busca en C, mucho más rápido que un
+# hash rodante byte a byte en Python, y en dos etapas para servir con cualquier
+# distribución de bytes (binarios, CSV, JSON, texto):
+# 1) cada byte se reduce a su paridad (cantidad de bits en 1) y una expresión
+#    regular busca una secuencia fija de 10 paridades (~1 de cada 1024 bytes);
+# 2) de esos candidatos se corta en los que el crc32 de los 32 bytes previos
+#    tiene en 0 los bits de CUT_MASK (~1 de cada 512): un corte cada ~0,5 MB
+#    pasado CHUNK_MIN. La secuencia no tiene bordes (ningún prefijo es sufijo),
+#    así las apariciones no se solapan y no dependen de dónde empieza la búsqueda.
+# Solo los datos sin variación (p. ej. todos ceros) se cortan cada CHUNK_MAX.
+_PARITY = bytes(b"01"[bin(i).count("1") & 1] for i in range(256))
+_CANDIDATE = re.compile(rb"0010111011")
+CUT_WINDOW = 32
+CUT_MASK = (1 << 9) - 1
+
+COMPRESSION_ENV = "VCS_CHUNK_COMPRESSION"
+COMPRESSION_MODES = ("auto", "zstd", "zlib", "none")
+# Primer byte de cada fragmento guardado: cómo está comprimido
+RAW, ZLIB, ZSTD = b"N", b"Z", b"S"
+# Si la muestra no se reduce al menos a esta fracción, se guarda sin comprimir
+MIN_RATIO = 0.9
+SAMPLE_SIZE = 64 * 1024
+
+# zstandard se importa la primera vez que se comprime o descomprime un fragmento
+_zstd = []
+
+
+def _zstandard():
+    if not _zstd:
+        try:
+            import zstandard
+        except ImportError:
+            zstandard = None
+        _zstd.append(zstandard)
+    return _zstd[0]
+
+
+def _find_cut(buffer, paridades, desde, hasta):
+    for candidato in _CANDIDATE.finditer(paridades, desde, hasta):
+        fin = candidato.end()
+        if not zlib.crc32(buffer[fin - CUT_WINDOW:fin]) & CUT_MASK:
+            return fin
+    return None
+
+
+def split_chunks(f):
+    # Fragmentos (bytes) del archivo binario f, leído por bloques
+    buffer = bytearray()
+    paridades = bytearray()
+    pos = 0
+    eof = False
+    while True:
+        if not eof and len(buffer) - pos < CHUNK_MAX:
+            del buffer[:pos]
+            pos = 0
+            while not eof and len(buffer) < CHUNK_MAX + READ_SIZE:
+                data = f.read(READ_SIZE)
+                if data:
+                    buffer += data
+                else:
+                    eof = True
+            paridades = buffer.translate(_PARITY)
+        if pos >= len(buffer):
+            return
+        corte = _find_cut(buffer, paridades, pos + CHUNK_MIN, pos + CHUNK_MAX)
+        if corte is None:
+            corte = min(pos + CHUNK_MAX, len(buffer))
+        yield bytes(buffer[pos:corte])
+        pos = corte
+
+
+def compression_mode():
+    modo = os.environ.get(COMPRESSION_ENV, "auto")
+    if modo not in COMPRESSION_MODES:
+        raise ValueError(f"Compresión desconocida: {modo}")
+    if modo == "auto":
+        return "zstd" if _zstandard() is not None else "zlib"
+    if modo == "zstd" and _zstandard() is None:
+        raise RuntimeError("La compresión zstd requiere el paquete zstandard (pip install zstandard).")
+    return modo
+
+
+def _compress(data, modo):
+    if modo == "zstd":
+        return ZSTD + _zstandard().ZstdCompressor(level=3).compress(data)
+    return ZLIB + zlib.compress(data, 1)
+
+
+def compress_chunk(data, modo):
+    if modo == "none":
+        return RAW + data
+    # Los datos ya comprimidos (imágenes, archivos .zip, ...) no se reducen:
+    # se prueba con una muestra antes de comprimir el fragmento entero.
+    muestra = data[:SAMPLE_SIZE]
+    if len(_compress(muestra, modo)) > len(muestra) * MIN_RATIO:
+        return RAW + data
+    comprimido = _compress(data, modo)
+    return comprimido if len(comprimido) < len(data) else RAW + data
+
+
+def decompress_chunk(blob):
+    tipo, datos = blob[:1], blob[1:]
+    if tipo == RAW:
+        return datos
+    if tipo == ZLIB:
+        return zlib.decompress(datos)
+    if tipo == ZSTD:
+        zstandard = _zstandard()
+        if zstandard is None:
+            raise RuntimeError("Este fragmento está comprimido con zstd: instale el paquete zstandard.")
+        return zstandard.ZstdDecompressor().decompress(datos)
+    raise ValueError(f"Fragmento con formato desconocido: {tipo!r}")
+
+
+class ChunkedFile(io.RawIOBase):
+    # Lectura de un archivo fragmentado: cada fragmento se lee y descomprime
+    # solo cuando se llega a él, y seek salta directamente al que corresponde.
+    def __init__(self, fragmentos, read_chunk):
+        self.fragmentos = fragmentos
+        self.read_chunk = read_chunk
+        self.inicios = list(accumulate([0] + [size for _, size in fragmentos]))
+        self.size = self.inicios[-1]
+        self.pos = 0
+        self._actual = (None, b"")
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.pos = max(0, offset)
+        return self.pos
+
+    def readinto(self, b):
+        if self.pos >= self.size:
+            return 0
+        i = bisect_right(self.inicios, self.pos) - 1
+        if self._actual[0] != i:
+            self._actual = (i, self.read_chunk(self.fragmentos[i][0]))
+        data = self._actual[1]
+        desde = self.pos - self.inicios[i]
+        n = min(len(b), len(data) - desde)
+        b[:n] = data[desde:desde + n]
+        self.pos += n
+        return n
@@ -1,53 +1,97 @@
-import json
 import os
 import logging
+from utils.atomic_io import atomic_write_json, read_json
+from utils import metrics
 
 CONTEXT_FILE = "data/context.json"
+CONTEXT_KEYS = ("usuario_actual", "usuario_destino", "path")
 
-class ContextManager:
-    def __init__(self):
-        os.makedirs("data", exist_ok=True)
-        if not os.path.exists(CONTEXT_FILE):
-            with open(CONTEXT_FILE, "w") as f:
-                json.dump({}, f)
 
+def make_context(usuario_actual, usuario_destino):
+    if usuario_actual == usuario_destino:
+        path = os.path.join("repo_root", usuario_actual, "temporal")
+    else:
+        path = os.path.join("repo_root", usuario_destino, f"temp_{usuario_actual}")
+    return {
+        "usuario_actual": usuario_actual,
+        "usuario_destino": usuario_destino,
+        "path": path
+    }
+
+class ContextManager:
+    # No crea nada al iniciar: read_json completa un journal pendiente y trata
+    # el archivo inexistente como contexto vacío; la carpeta se crea al guardar.
+    @metrics.timed("context_manager")
     def load_context(self):
-        try:
-            with open(CONTEXT_FILE, "r") as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            logging.error("El archivo de contexto está dañado. Se reiniciará.")
-            return {}
+        return read_json(CONTEXT_FILE, {})
 
+    @metrics.timed("context_manager")
     def save_context(self, context):
-        with open(CONTEXT_FILE, "w") as f:
-            json.dump(context, f, indent=2)
+        os.makedirs(os.path.dirname(CONTEXT_FILE), exist_ok=True)
+        atomic_write_json(CONTEXT_FILE, context, indent=2)
 
     def set_context(self, usuario_actual, usuario_destino):
         if not usuario_actual or not usuario_destino:
             print("Faltan datos de contexto.")
             return
 
-        if usuario_actual == usuario_destino:
-            path = os.path.join("repo_root", usuario_actual, "temporal")
-        else:
-            path = os.path.join("repo_root", usuario_destino, f"temp_{usuario_actual}")
-
-        context = {
-            "usuario_actual": usuario_actual,
-            "usuario_destino": usuario_destino,
-            "path": path
-        }
-
+        context = make_context(usuario_actual, usuario_destino)
         self.save_context(context)
         logging.info(f"Contexto cambiado a: {context}")
 
     def get_context(self):
         ctx = self.load_context()
-        if not all(k in ctx for k in ("usuario_actual", "usuario_destino", "path")):
+        if not all(k in ctx for k in CONTEXT_KEYS):
             return None
         return ctx
 
     def get_user(self):
         ctx = self.get_context()
         return ctx["usuario_actual"] if ctx else None
+
+
+class Session:
+    # Contexto de trabajo en memoria. Se pasa explícitamente a VersionControl,
+    # de modo que las operaciones no leen data/context.json. Si tiene un
+    # ContextManager asociado, solo escribe en disco cuando el contexto cambia.
+    def __init__(self, usuario_actual=None, usuario_destino=None, manager=None):
+        self.manager = manager
+        self._context = None
+        self._loaded = True
+        if usuario_actual and usuario_destino:
+            self._context = make_context(usuario_actual, usuario_destino)
+
+    @classmethod
+    def load(cls, manager=None):
+        # El contexto persistido se lee una sola vez, cuando se usa por primera
+        # vez: los comandos que no lo necesitan (user-add, grant...) no lo leen.
+        session = cls(manager=manager or ContextManager())
+        session._loaded = False
+        return session
+
+    def _load(self):
+        if not self._loaded:
+            self._context = self.manager.get_context()
+            self._loaded = True
+        return self._context
+
+    def set_context(self, usuario_actual, usuario_destino):
+        if not usuario_actual or not usuario_destino:
+            print("Faltan datos de contexto.")
+            return
+
+        context = make_context(usuario_actual, usuario_destino)
+        if context == self._load():
+            return
+        self._context = context
+        if self.manager is not None:
+            self.manager.save_context(context)
+        logging.info(f"Contexto cambiado a: {context}")
+
+    def get_context(self):
+        context = self._load()
+        return dict(context) if context else None
+
+    def get_user(self):
+        context = self._load()
+        return context["usuario_actual"] if context else None
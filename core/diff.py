@@ -0,0 +1,265 @@
+import difflib
+import hashlib
+from contextlib import ExitStack
+from collections import defaultdict
+
+CONTEXT_LINES = 3
+BINARY_SNIFF = 8000
+# Los archivos de texto más grandes no se comparan línea a línea
+MAX_DIFF_SIZE = 8 * 1024 * 1024
+# Myers guarda una copia de v por paso: tiempo y memoria crecen con D². Por
+# encima de esta distancia de edición la parte central se compara con difflib,
+# que no da siempre el diff mínimo pero es casi lineal en archivos reescritos.
+MAX_EDIT_DISTANCE = 500
+
+
+def _parent(rel):
+    return rel.rpartition("/")[0]
+
+
+def tree_hashes(archivos):
+    # Hash de cada directorio a partir de sus hijos (como los árboles de git):
+    # dos subárboles con el mismo hash tienen exactamente el mismo contenido.
+    hijos = defaultdict(list)
+    dirs = {""}
+    for rel, entry in archivos.items():
+        parent, _, name = rel.rpartition("/")
+        hijos[parent].append((name, "f", entry["hash"]))
+        while parent and parent not in dirs:
+            dirs.add(parent)
+            parent = _parent(parent)
+
+    hashes = {}
+    for d in sorted(dirs, key=lambda x: x.count("/") + (1 if x else 0), reverse=True):
+        contenido = "\n".join(f"{tipo} {digest} {name}" for name, tipo, digest in sorted(hijos[d]))
+        hashes[d] = hashlib.sha256(contenido.encode("utf-8")).hexdigest()
+        if d:
+            parent, _, name = d.rpartition("/")
+            hijos[parent].append((name, "d", hashes[d]))
+    return hashes
+
+
+def diff_trees(antes, despues, dirs_antes=None, dirs_despues=None):
+    # Compara dos árboles ruta -> {hash, size}; los directorios con el mismo
+    # hash se saltan sin mirar sus archivos.
+    dirs_antes = dirs_antes or tree_hashes(antes)
+    dirs_despues = dirs_despues or tree_hashes(despues)
+    cambios = {"nuevos": [], "modificados": [], "eliminados": []}
+    if dirs_antes.get("") == dirs_despues.get(""):
+        return cambios
+
+    distintos = {
+        d for d in dirs_antes.keys() | dirs_despues.keys()
+        if dirs_antes.get(d) != dirs_despues.get(d)
+    }
+    for rel, entry in despues.items():
+        if _parent(rel) not in distintos:
+            continue
+        previo = antes.get(rel)
+        if previo is None:
+            cambios["nuevos"].append(rel)
+        elif previo["hash"] != entry["hash"]:
+            cambios["modificados"].append(rel)
+    for rel in antes:
+        if _parent(rel) in distintos and rel not in despues:
+            cambios["eliminados"].append(rel)
+    for lista in cambios.values():
+        lista.sort()
+    return cambios
+
+
+def is_binary(data):
+    return b"\0" in data[:BINARY_SNIFF]
+
+
+def _myers(a, b):
+    # Algoritmo O(ND) de Myers. Devuelve los pares (i, j) de líneas iguales
+    # de la secuencia de edición más corta, o None si D supera el límite.
+    n, m = len(a), len(b)
+    limite = min(n + m, MAX_EDIT_DISTANCE)
+    offset = limite + 1
+    v = [0] * (2 * limite + 3)
+    trace = []
+    for d in range(limite + 1):
+        trace.append(v[offset - d - 1:offset + d + 2])
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                x = v[offset + k + 1]
+            else:
+                x = v[offset + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x += 1
+                y += 1
+            v[offset + k] = x
+            if x >= n and y >= m:
+                return _backtrack(trace, a, b, d)
+    return None
+
+
+def _backtrack(trace, a, b, d_final):
+    iguales = []
+    x, y = len(a), len(b)
+    for d in range(d_final, 0, -1):
+        v = trace[d]
+        base = d + 1  # v[base + k] corresponde a la diagonal k en el paso d
+        k = x - y
+        if k == -d or (k != d and v[base + k - 1] < v[base + k + 1]):
+            prev_k = k + 1
+        else:
+            prev_k = k - 1
+        prev_x = v[base + prev_k]
+        prev_y = prev_x - prev_k
+        while x > prev_x and y > prev_y:
+            x -= 1
+            y -= 1
+            iguales.append((x, y))
+        x, y = prev_x, prev_y
+    while x > 0 and y > 0:
+        x -= 1
+        y -= 1
+        iguales.append((x, y))
+    iguales.reverse()
+    return iguales
+
+
+def _middle_opcodes(a, b, iguales, di, dj):
+    ops = []
+    i = j = 0
+    for x, y in iguales + [(len(a), len(b))]:
+        if i < x and j < y:
+            ops.append(("replace", di + i, di + x, dj + j, dj + y))
+        elif i < x:
+            ops.append(("delete", di + i, di + x, dj + j, dj + j))
+        elif j < y:
+            ops.append(("insert", di + i, di + i, dj + j, dj + y))
+        if x < len(a) and y < len(b):
+            ops.append(("equal", di + x, di + x + 1, dj + y, dj + y + 1))
+        i, j = x + 1, y + 1
+    return ops
+
+
+def opcodes(a, b):
+    # Operaciones al estilo difflib: (tag, i1, i2, j1, j2). El prefijo y el
+    # sufijo comunes se recortan antes de ejecutar Myers sobre la parte central.
+    inicio = 0
+    while inicio < len(a) and inicio < len(b) and a[inicio] == b[inicio]:
+        inicio += 1
+    fin = 0
+    while fin < len(a) - inicio and fin < len(b) - inicio and a[-1 - fin] == b[-1 - fin]:
+        fin += 1
+
+    # Se comparan enteros en vez de cadenas: cada línea distinta recibe un id
+    ids = {}
+    medio_a = [ids.setdefault(linea, len(ids)) for linea in a[inicio:len(a) - fin]]
+    medio_b = [ids.setdefault(linea, len(ids)) for linea in b[inicio:len(b) - fin]]
+    iguales = _myers(medio_a, medio_b)
+
+    crudas = []
+    if inicio:
+        crudas.append(("equal", 0, inicio, 0, inicio))
+    if iguales is not None:
+        crudas += _middle_opcodes(medio_a, medio_b, iguales, inicio, inicio)
+    else:
+        matcher = difflib.SequenceMatcher(None, medio_a, medio_b)
+        crudas += [
+            (tag, inicio + i1, inicio + i2, inicio + j1, inicio + j2)
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        ]
+    if fin:
+        crudas.append(("equal", len(a) - fin, len(a), len(b) - fin, len(b)))
+
+    # Se fusionan las líneas iguales consecutivas en una sola operación
+    ops = []
+    for op in crudas:
+        if ops and op[0] == "equal" and ops[-1][0] == "equal" and ops[-1][2] == op[1]:
+            ops[-1] = ("equal", ops[-1][1], op[2], ops[-1][3], op[4])
+        else:
+            ops.append(op)
+    return ops
+
+
+def _grouped(ops, n=CONTEXT_LINES):
+    # Agrupa las operaciones en bloques con n líneas de contexto (como difflib)
+    if not ops:
+        return
+    if ops[0][0] == "equal":
+        tag, i1, i2, j1, j2 = ops[0]
+        ops[0] = (tag, max(i1, i2 - n), i2, max(j1, j2 - n), j2)
+    if ops[-1][0] == "equal":
+        tag, i1, i2, j1, j2 = ops[-1]
+        ops[-1] = (tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n))
+
+    grupo = []
+    for tag, i1, i2, j1, j2 in ops:
+        if tag == "equal" and i2 - i1 > 2 * n:
+            grupo.append((tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)))
+            yield grupo
+            grupo = []
+            i1, j1 = max(i1, i2 - n), max(j1, j2 - n)
+        grupo.append((tag, i1, i2, j1, j2))
+    if grupo and not (len(grupo) == 1 and grupo[0][0] == "equal"):
+        yield grupo
+
+
+def _rango(inicio, fin):
+    largo = fin - inicio
+    if largo == 1:
+        return f"{inicio + 1}"
+    if not largo:
+        inicio -= 1
+    return f"{inicio + 1},{largo}"
+
+
+def unified_diff(a, b, nombre_a, nombre_b, n=CONTEXT_LINES):
+    # Generador: produce el diff línea a línea sin construirlo entero en memoria
+    ops = opcodes(a, b)
+    if all(op[0] == "equal" for op in ops):
+        return
+    yield f"--- {nombre_a}\n"
+    yield f"+++ {nombre_b}\n"
+    for grupo in _grouped(ops, n):
+        primero, ultimo = grupo[0], grupo[-1]
+        yield f"@@ -{_rango(primero[1], ultimo[2])} +{_rango(primero[3], ultimo[4])} @@\n"
+        for tag, i1, i2, j1, j2 in grupo:
+            if tag == "equal":
+                for linea in a[i1:i2]:
+                    yield " " + _terminada(linea)
+                continue
+            for linea in a[i1:i2]:
+                yield "-" + _terminada(linea)
+            for linea in b[j1:j2]:
+                yield "+" + _terminada(linea)
+
+
+def _terminada(linea):
+    return linea if linea.endswith("\n") else linea + "\n\\ No newline at end of file\n"
+
+
+def diff_contents(data_a, data_b, nombre_a, nombre_b, n=CONTEXT_LINES):
+    if is_binary(data_a) or is_binary(data_b):
+        yield f"Los archivos binarios {nombre_a} y {nombre_b} son distintos\n"
+        return
+    a = data_a.decode("utf-8", errors="replace").splitlines(keepends=True)
+    b = data_b.decode("utf-8", errors="replace").splitlines(keepends=True)
+    yield from unified_diff(a, b, nombre_a, nombre_b, n)
+
+
+def diff_files(abrir_a, abrir_b, nombre_a, nombre_b, n=CONTEXT_LINES):
+    # Como diff_contents, pero abrir_a/abrir_b devuelven el archivo binario de
+    # cada lado (None si no existe en ese lado). Se mira el comienzo de los dos
+    # antes de leerlos: los binarios y los de más de MAX_DIFF_SIZE no se cargan.
+    with ExitStack() as pila:
+        archivos = [pila.enter_context(abrir()) if abrir else None for abrir in (abrir_a, abrir_b)]
+        inicios = [f.read(BINARY_SNIFF) if f else b"" for f in archivos]
+        if any(is_binary(inicio) for inicio in inicios):
+            yield f"Los archivos binarios {nombre_a} y {nombre_b} son distintos\n"
+            return
+        datos = []
+        for f, inicio in zip(archivos, inicios):
+            data = inicio + f.read(MAX_DIFF_SIZE + 1 - len(inicio)) if f else b""
+            if len(data) > MAX_DIFF_SIZE:
+                yield f"Los archivos {nombre_a} y {nombre_b} son distintos (demasiado grandes para compararlos)\n"
+                return
+            datos.append(data)
+    yield from diff_contents(datos[0], datos[1], nombre_a, nombre_b, n)
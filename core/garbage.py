@@ -0,0 +1,205 @@
+import os
+import json
+import time
+import logging
+from core.object_store import read_manifest
+from core.materialize import LINKS_DIR
+from core.pack import OBJ_DELTA, PackReader, PackWriter
+from core.version_log import VersionLog
+from utils.atomic_io import atomic_write_json, read_json
+from utils import metrics
+
+GC_STATE_FILE = "gc.json"
+# Un objeto sin referencias más reciente que esto puede pertenecer a un commit
+# en curso (los blobs se guardan antes que el manifiesto): no se borra todavía.
+GRACE_SECONDS = 3600
+
+
+class GarbageCollector:
+    # Marca y barrido por partes: cada unidad es una carpeta de objetos sueltos
+    # (objetos/00 ... objetos/ff), un pack o la carpeta de manifiestos. El
+    # avance se guarda en gc.json, así una pasada puede repartirse en varias
+    # llamadas cortas que no bloquean los commits durante mucho tiempo.
+    def __init__(self, store, repo_path, gracia=GRACE_SECONDS):
+        self.store = store
+        self.repo_path = repo_path
+        self.gracia = gracia
+        self.state_path = os.path.join(repo_path, GC_STATE_FILE)
+        self.log = VersionLog(repo_path)
+
+    def _units(self):
+        unidades = [f"sueltos:{i:02x}" for i in range(256)] + ["fragmentos", "enlaces"]
+        if os.path.isdir(self.store.pack_dir):
+            unidades += [f"pack:{n}" for n in sorted(os.listdir(self.store.pack_dir)) if n.endswith(".pack")]
+        unidades.append("manifiestos")
+        # Orden alfabético: el cursor sigue siendo válido aunque desaparezca un pack
+        return sorted(unidades)
+
+    def reachable(self):
+        alcanzables = set()
+        for entrada in self.log.entries():
+            if not entrada["manifiesto"]:
+                continue
+            path = os.path.join(self.repo_path, *entrada["manifiesto"].split("/"))
+            if os.path.exists(path):
+                alcanzables.update(e["hash"] for e in read_manifest(path)["archivos"].values())
+        return alcanzables
+
+    def run(self, presupuesto=None, max_unidades=None):
+        # presupuesto: segundos como máximo; max_unidades: unidades como máximo.
+        # Sin límites se completa la pasada entera.
+        inicio = time.monotonic()
+        estado = read_json(self.state_path, {})
+        unidades = self._units()
+        cursor = estado.get("cursor")
+        pendientes = [u for u in unidades if cursor is None or u > cursor]
+
+        resultado = {"objetos": 0, "bytes": 0, "packs": 0, "manifiestos": 0, "unidades": 0, "completo": False}
+        alcanzables = self.reachable()
+        ahora = time.time()
+        for unidad in pendientes:
+            if max_unidades is not None and resultado["unidades"] >= max_unidades:
+                break
+            if presupuesto is not None and resultado["unidades"] and time.monotonic() - inicio >= presupuesto:
+                break
+            tipo, _, nombre = unidad.partition(":")
+            if tipo == "sueltos":
+                self._sweep_loose(nombre, alcanzables, ahora, resultado)
+            elif tipo == "pack":
+                self._sweep_pack(os.path.join(self.store.pack_dir, nombre), alcanzables, resultado)
+            elif tipo == "fragmentos":
+                self._sweep_chunked(alcanzables, ahora, resultado)
+            elif tipo == "enlaces":
+                self._sweep_links(ahora, resultado)
+            else:
+                self._sweep_manifests(ahora, resultado)
+            resultado["unidades"] += 1
+            cursor = unidad
+        else:
+            resultado["completo"] = True
+            cursor = None
+
+        atomic_write_json(self.state_path, {"cursor": cursor}, journal=False)
+        metrics.inc("gc_objetos_eliminados", resultado["objetos"])
+        metrics.inc("gc_bytes_liberados", resultado["bytes"])
+        logging.info(f"GC de {self.repo_path}: {resultado}")
+        return resultado
+
+    def _sweep_loose(self, prefijo, alcanzables, ahora, resultado):
+        carpeta = os.path.join(self.store.root, prefijo)
+        try:
+            entradas = list(os.scandir(carpeta))
+        except FileNotFoundError:
+            return
+        for entry in entradas:
+            st = entry.stat(follow_symlinks=False)
+            if ahora - st.st_mtime < self.gracia:
+                continue
+            # Temporales abandonados por un proceso que se cayó
+            es_temporal = entry.name.endswith(".tmp")
+            if not es_temporal and prefijo + entry.name in alcanzables:
+                continue
+            if not es_temporal and len(entry.name) != 62:
+                continue
+            os.remove(entry.path)
+            resultado["objetos"] += 1
+            resultado["bytes"] += st.st_size
+        try:
+            os.rmdir(carpeta)
+        except OSError:
+            pass
+
+    def _sweep_pack(self, pack_path, alcanzables, resultado):
+        if not os.path.exists(pack_path[:-len(".pack")] + ".idx"):
+            return
+        reader = PackReader(pack_path)
+        offsets = {digest: reader.find(digest) for digest in reader.digests()}
+        if all(digest in alcanzables for digest in offsets):
+            return
+
+        # Se conservan los objetos alcanzables y las bases de sus deltas
+        conservar = {}
+        pendientes = [d for d in offsets if d in alcanzables]
+        while pendientes:
+            digest = pendientes.pop()
+            if digest in conservar:
+                continue
+            conservar[digest] = reader.raw_entry(offsets[digest])
+            tipo, base, _ = conservar[digest]
+            if tipo == OBJ_DELTA and base not in conservar:
+                pendientes.append(base)
+
+        antes = os.path.getsize(pack_path)
+        nuevo = None
+        if conservar:
+            writer = PackWriter(self.store.pack_dir)
+            try:
+                # Las entradas se copian tal cual, sin descomprimir ni recalcular deltas
+                for digest in sorted(conservar, key=offsets.get):
+                    tipo, base, comprimido = conservar[digest]
+                    writer.add_raw(digest, tipo, base, comprimido)
+                nuevo = writer.finish()
+            except BaseException:
+                writer.abort()
+                raise
+        if nuevo != pack_path:
+            self.store.remove_pack(pack_path)
+        self.store.refresh_packs()
+        resultado["packs"] += 1
+        resultado["objetos"] += len(offsets) - len(conservar)
+        resultado["bytes"] += antes - (os.path.getsize(nuevo) if nuevo else 0)
+
+    def _sweep_chunked(self, alcanzables, ahora, resultado):
+        # Primero las recetas sin referencias; después los fragmentos que no usa
+        # ninguna de las recetas que quedan.
+        usados = set()
+        for path, digest, st in _scan(self.store.recipe_dir):
+            if digest in alcanzables or ahora - st.st_mtime < self.gracia:
+                with open(path, "r") as f:
+                    usados.update(h for h, _ in json.load(f)["fragmentos"])
+                continue
+            os.remove(path)
+            resultado["objetos"] += 1
+            resultado["bytes"] += st.st_size
+        for path, digest, st in _scan(self.store.chunk_dir):
+            if digest in usados or ahora - st.st_mtime < self.gracia:
+                continue
+            os.remove(path)
+            resultado["objetos"] += 1
+            resultado["bytes"] += st.st_size
+
+    def _sweep_links(self, ahora, resultado):
+        # Copias del modo hardlink que ya no enlaza ningún archivo de trabajo
+        for path, _, st in _scan(os.path.join(self.repo_path, LINKS_DIR)):
+            if st.st_nlink > 1 or ahora - st.st_ctime < self.gracia:
+                continue
+            os.remove(path)
+            resultado["bytes"] += st.st_size
+
+    def _sweep_manifests(self, ahora, resultado):
+        # Manifiestos que ya no figuran en el registro (una poda interrumpida)
+        nombres = set(self.log.names())
+        version_dir = os.path.join(self.repo_path, "versiones")
+        if not os.path.isdir(version_dir):
+            return
+        for entry in os.scandir(version_dir):
+            if not entry.name.endswith(".json") or entry.name[:-len(".json")] in nombres:
+                continue
+            st = entry.stat()
+            if ahora - st.st_mtime < self.gracia:
+                continue
+            os.remove(entry.path)
+            resultado["manifiestos"] += 1
+            resultado["bytes"] += st.st_size
+
+
+def _scan(carpeta):
+    # (ruta, hash, stat) de cada objeto de carpeta/xx/resto
+    if not os.path.isdir(carpeta):
+        return
+    for prefijo in os.scandir(carpeta):
+        if not prefijo.is_dir():
+            continue
+        for entry in os.scandir(prefijo.path):
+            if len(entry.name) == 62 and not entry.name.endswith(".tmp"):
+                yield entry.path, prefijo.name + entry.name, entry.stat(follow_symlinks=False)
@@ -0,0 +1,88 @@
+import threading
+from contextlib import contextmanager
+
+
+class RWLock:
+    # Varios lectores o un único escritor. Un escritor en espera bloquea a los
+    # lectores nuevos para que los commits no esperen indefinidamente.
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    def acquire_read(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+
+    def release_read(self):
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+
+    def release_write(self):
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+
+    @contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class LockRegistry:
+    # Un RWLock por repositorio y un Lock por carpeta de trabajo. Para evitar
+    # interbloqueos siempre se toma primero el del repositorio.
+    def __init__(self):
+        self._guard = threading.Lock()
+        self._repos = {}
+        self._workdirs = {}
+
+    def repo(self, usuario):
+        with self._guard:
+            return self._repos.setdefault(usuario, RWLock())
+
+    def workdir(self, path):
+        with self._guard:
+            return self._workdirs.setdefault(path, threading.Lock())
+
+    @contextmanager
+    def reading(self, usuario, workdir=None):
+        with self.repo(usuario).read():
+            if workdir is None:
+                yield
+            else:
+                with self.workdir(workdir):
+                    yield
+
+    @contextmanager
+    def writing(self, usuario, workdir=None):
+        with self.repo(usuario).write():
+            if workdir is None:
+                yield
+            else:
+                with self.workdir(workdir):
+                    yield
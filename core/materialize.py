@@ -0,0 +1,177 @@
+import os
+import shutil
+import logging
+import threading
+from core.object_store import from_rel
+from core.work_index import WorkIndex
+from core.pipeline import DEFAULT_WORKERS, parallel_map
+from utils import metrics
+
+MODES = ("auto", "reflink", "hardlink", "copy")
+MODE_ENV = "VCS_MATERIALIZE"
+# En modo hardlink los archivos de trabajo se enlazan a copias guardadas aquí,
+# nunca a los blobs del almacén: una escritura en sitio no puede cambiar el
+# historial. Las copias tienen mtime 0; si una edición las modificó, se rehacen.
+LINKS_DIR = "enlaces"
+
+# ioctl FICLONE de Linux (btrfs, xfs, ...): clona el archivo con copy-on-write
+FICLONE = 0x40049409
+
+
+def _reflink(src, dest):
+    import fcntl
+    with open(src, "rb") as fsrc, open(dest, "wb") as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+
+
+def default_mode():
+    return os.environ.get(MODE_ENV, "auto")
+
+
+class Materializer:
+    # auto prueba reflink (copia con copy-on-write) y si no está disponible
+    # copia. hardlink solo se usa si se pide explícitamente: los archivos de
+    # trabajo de un mismo repositorio con igual contenido comparten el inodo.
+    def __init__(self, store, mode="auto", workers=DEFAULT_WORKERS):
+        if mode not in MODES:
+            raise ValueError(f"Modo de materialización inválido: {mode}")
+        self.store = store
+        self.mode = mode
+        self.workers = workers
+        # En modo auto se recuerdan los métodos que el sistema de archivos no soporta
+        self._descartados = set()
+
+    def _metodos(self):
+        if self.mode == "auto":
+            return [m for m in ("reflink", "copy") if m not in self._descartados]
+        if self.mode == "copy":
+            return ["copy"]
+        return [self.mode, "copy"]
+
+    def link_path(self, digest):
+        return os.path.join(self.store.repo_path, LINKS_DIR, digest[:2], digest[2:])
+
+    def _link_source(self, digest, src):
+        path = self.link_path(digest)
+        try:
+            if os.stat(path).st_mtime_ns == 0:
+                return path
+        except FileNotFoundError:
+            pass
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copyfile(src, tmp)
+        os.utime(tmp, ns=(0, 0))
+        os.replace(tmp, path)
+        return path
+
+    def place(self, digest, dest):
+        src = self.store.object_path(digest)
+        os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+        tmp = f"{dest}.{os.getpid()}.{threading.get_ident()}.tmp"
+        if not self.store.is_loose(digest):
+            # Los objetos empaquetados no se pueden enlazar: se reconstruyen
+            try:
+                self.store.export(digest, tmp)
+                os.replace(tmp, dest)
+            except BaseException:
+                # Un objeto faltante o dañado no deja un temporal en la carpeta
+                if os.path.lexists(tmp):
+                    os.remove(tmp)
+                raise
+            metrics.add_files("materialize", 1, "pack")
+            return "copy"
+        for metodo in self._metodos():
+            try:
+                if metodo == "reflink":
+                    _reflink(src, tmp)
+                elif metodo == "hardlink":
+                    os.link(self._link_source(digest, src), tmp)
+                else:
+                    shutil.copyfile(src, tmp)
+                os.replace(tmp, dest)
+                if os.path.lexists(tmp):
+                    # rename() no hace nada si tmp y dest ya son enlaces al mismo inodo
+                    os.remove(tmp)
+                metrics.add_files("materialize", 1, metodo)
+                return metodo
+            except (OSError, ImportError) as e:
+                if os.path.lexists(tmp):
+                    os.remove(tmp)
+                if metodo == "copy":
+                    raise
+                logging.info(f"Materialización '{metodo}' no disponible ({e}), se usará otro método.")
+                if self.mode == "auto":
+                    self._descartados.add(metodo)
+        return None
+
+    def _clear_conflicts(self, pendientes, dest, index):
+        # Quita lo que ocupa el lugar de un archivo a escribir: una carpeta en
+        # su ruta o un archivo donde hace falta una de sus carpetas (p. ej. un
+        # archivo fuera del alcance de un update parcial).
+        vistas = set()
+        for rel in pendientes:
+            partes = rel.split("/")
+            for i in range(1, len(partes)):
+                padre = "/".join(partes[:i])
+                if padre in vistas:
+                    continue
+                vistas.add(padre)
+                path = from_rel(dest, padre)
+                if os.path.lexists(path) and not os.path.isdir(path):
+                    os.remove(path)
+                    index.entradas.pop(padre, None)
+            target = from_rel(dest, rel)
+            if os.path.isdir(target):
+                shutil.rmtree(target)
+                for viejo in [r for r in index.entradas if r.startswith(rel + "/")]:
+                    del index.entradas[viejo]
+
+    def checkout(self, archivos, dest, repo_path, alcance=None, perfil=None):
+        # Deja dest igual al árbol archivos tocando solo lo que difiere. Con
+        # alcance(rel) solo se eliminan los archivos sobrantes dentro de él.
+        # perfil: patrones del perfil de rutas aplicado, que se anotan en el
+        # índice ([] = árbol completo; None = no cambia).
+        os.makedirs(dest, exist_ok=True)
+        index = WorkIndex(repo_path, dest)
+        if perfil is not None:
+            index.perfil = list(perfil)
+        actuales, _ = index.refresh(self.workers)
+
+        pendientes = [
+            rel for rel, entry in archivos.items()
+            if rel not in actuales or actuales[rel]["hash"] != entry["hash"]
+        ]
+
+        # Primero se eliminan los archivos sobrantes: así una ruta puede pasar
+        # de archivo a carpeta (x -> x/y) o al revés en la misma operación.
+        eliminados = 0
+        for rel in actuales:
+            if rel not in archivos and (alcance is None or alcance(rel)):
+                os.remove(from_rel(dest, rel))
+                index.entradas.pop(rel, None)
+                eliminados += 1
+        if eliminados:
+            _prune_empty_dirs(dest)
+        self._clear_conflicts(pendientes, dest, index)
+
+        def escribir(rel):
+            self.place(archivos[rel]["hash"], from_rel(dest, rel))
+            return os.stat(from_rel(dest, rel))
+
+        for rel, st in zip(pendientes, parallel_map(escribir, pendientes, self.workers)):
+            index.record(rel, st, archivos[rel]["hash"])
+        escritos = len(pendientes)
+
+        index.save()
+        logging.info(f"Materializado {dest}: {escritos} escritos, {eliminados} eliminados")
+        return escritos, eliminados
+
+
+def _prune_empty_dirs(base_path):
+    for root, _, _ in os.walk(base_path, topdown=False):
+        if root != base_path and not os.listdir(root):
+            try:
+                os.rmdir(root)
+            except OSError:
+                pass
@@ -0,0 +1,290 @@
+import io
+import os
+import json
+import shutil
+import hashlib
+import logging
+import threading
+from core.pack import PACK_DIR, OBJ_DELTA, PackReader, apply_delta
+from core.chunking import (
+    CHUNKED_MIN_SIZE, ChunkedFile, compress_chunk, compression_mode, decompress_chunk, split_chunks,
+)
+from utils.atomic_io import atomic_write_json
+from utils import metrics
+
+OBJECTS_DIR = "objetos"
+# Archivos grandes: receta (lista de fragmentos) y fragmentos comprimidos
+CHUNKS_DIR = "fragmentos"
+RECIPES_DIR = "recetas"
+CHUNK_SIZE = 1024 * 1024
+
+# Los índices de pack se leen una sola vez por proceso
+_pack_readers = {}
+_pack_lock = threading.Lock()
+
+
+class ContentChangedError(ValueError):
+    # El archivo cambió entre el cálculo de su hash y la copia al almacén
+    pass
+
+
+def hash_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _copy_hashed(src, dest):
+    # Copia y calcula el hash en la misma lectura: lo que se guarda es
+    # exactamente lo que se verificó
+    h = hashlib.sha256()
+    with open(src, "rb") as fsrc, open(dest, "wb") as fdst:
+        while True:
+            chunk = fsrc.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+            fdst.write(chunk)
+    return h.hexdigest()
+
+
+def _changed(src, digest):
+    return ContentChangedError(f"'{src}' cambió mientras se guardaba (se esperaba {digest[:12]}).")
+
+
+def to_rel(path):
+    # Las rutas de los manifiestos siempre usan "/" como separador
+    return path.replace(os.sep, "/")
+
+
+def from_rel(base, rel):
+    return os.path.join(base, *rel.split("/"))
+
+
+class ObjectStore:
+    def __init__(self, repo_path):
+        self.repo_path = repo_path
+        self.root = os.path.join(repo_path, OBJECTS_DIR)
+        self.pack_dir = os.path.join(self.root, PACK_DIR)
+        self.chunk_dir = os.path.join(self.root, CHUNKS_DIR)
+        self.recipe_dir = os.path.join(self.root, RECIPES_DIR)
+        self._packs = None
+
+    def object_path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:])
+
+    def is_loose(self, digest):
+        return os.path.exists(self.object_path(digest))
+
+    def chunk_path(self, digest):
+        return os.path.join(self.chunk_dir, digest[:2], digest[2:])
+
+    def recipe_path(self, digest):
+        return os.path.join(self.recipe_dir, digest[:2], digest[2:])
+
+    def is_chunked(self, digest):
+        return os.path.exists(self.recipe_path(digest))
+
+    def is_packed(self, digest):
+        # Solo en los packs ya conocidos: no vuelve a listar la carpeta
+        if self._packs is None:
+            self.refresh_packs()
+        return any(reader.find(digest) is not None for reader in self._packs)
+
+    def has(self, digest):
+        return self.is_loose(digest) or self.is_chunked(digest) or self._find_packed(digest) is not None
+
+    def recipe(self, digest):
+        with open(self.recipe_path(digest), "r") as f:
+            return json.load(f)
+
+    def read_chunk(self, digest):
+        with open(self.chunk_path(digest), "rb") as f:
+            blob = f.read()
+        metrics.add_bytes("object_store", leidos=len(blob))
+        return decompress_chunk(blob)
+
+    def refresh_packs(self):
+        packs = []
+        if os.path.isdir(self.pack_dir):
+            for name in sorted(os.listdir(self.pack_dir)):
+                if not name.endswith(".idx"):
+                    continue
+                pack_path = os.path.join(self.pack_dir, name[:-len(".idx")] + ".pack")
+                with _pack_lock:
+                    reader = _pack_readers.get(pack_path)
+                    if reader is None:
+                        reader = _pack_readers[pack_path] = PackReader(pack_path)
+                packs.append(reader)
+        self._packs = packs
+        return packs
+
+    def _find_packed(self, digest):
+        if self._packs is None:
+            self.refresh_packs()
+        for reader in self._packs:
+            offset = reader.find(digest)
+            if offset is not None:
+                return reader, offset
+        # Otro proceso pudo haber escrito un pack nuevo desde la última lectura
+        for reader in self.refresh_packs():
+            offset = reader.find(digest)
+            if offset is not None:
+                return reader, offset
+        return None
+
+    def read(self, digest):
+        if self.is_loose(digest):
+            with open(self.object_path(digest), "rb") as f:
+                data = f.read()
+            metrics.add_bytes("object_store", leidos=len(data))
+            return data
+        if self.is_chunked(digest):
+            return b"".join(self.read_chunk(h) for h, _ in self.recipe(digest)["fragmentos"])
+        encontrado = self._find_packed(digest)
+        if encontrado is None:
+            raise FileNotFoundError(f"Objeto no encontrado: {digest}")
+        reader, offset = encontrado
+        tipo, base, data = reader.read_entry(offset)
+        if tipo == OBJ_DELTA:
+            return apply_delta(self.read(base), data)
+        return data
+
+    def export(self, digest, dest):
+        if self.is_loose(digest):
+            shutil.copyfile(self.object_path(digest), dest)
+            return
+        if self.is_chunked(digest):
+            # Fragmento a fragmento: nunca se tiene el archivo entero en memoria
+            with open(dest, "wb") as f:
+                for h, _ in self.recipe(digest)["fragmentos"]:
+                    f.write(self.read_chunk(h))
+            return
+        with open(dest, "wb") as f:
+            f.write(self.read(digest))
+
+    def remove_loose(self, digest):
+        try:
+            os.remove(self.object_path(digest))
+        except FileNotFoundError:
+            pass
+
+    def remove_pack(self, pack_path):
+        # Primero el índice: sin él ningún lector vuelve a abrir el pack
+        index_path = pack_path[:-len(".pack")] + ".idx"
+        with _pack_lock:
+            _pack_readers.pop(pack_path, None)
+        for path in (index_path, pack_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._packs = None
+
+    def store_file(self, src, digest=None):
+        if digest is None:
+            digest = hash_file(src)
+        dest = self.object_path(digest)
+        if self.is_loose(digest):
+            # Se actualiza la fecha: el GC no borra objetos usados recientemente
+            try:
+                os.utime(dest)
+            except OSError:
+                pass
+            return digest
+        if self.is_chunked(digest):
+            try:
+                os.utime(self.recipe_path(digest))
+            except OSError:
+                pass
+            return digest
+        # Un contenido que ya está en un pack se guarda otra vez suelto: los packs
+        # no tienen período de gracia y, si solo lo usaba una versión podada, el
+        # GC podría descartarlo antes de que se escriba el manifiesto del commit.
+        if os.path.getsize(src) >= CHUNKED_MIN_SIZE:
+            return self._store_chunked(src, digest)
+
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp = f"{dest}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            # El hash se calculó en otra lectura (índice de la carpeta de
+            # trabajo): si el archivo cambió entre medio, no se guarda un
+            # contenido bajo un hash que no le corresponde.
+            if _copy_hashed(src, tmp) != digest:
+                raise _changed(src, digest)
+            # Los blobs son de solo lectura: nunca se modifican en sitio
+            os.chmod(tmp, 0o444)
+            os.replace(tmp, dest)
+        except BaseException:
+            if os.path.lexists(tmp):
+                os.remove(tmp)
+            raise
+        metrics.add_bytes("object_store", escritos=os.path.getsize(dest))
+        logging.info(f"Objeto almacenado: {digest}")
+        return digest
+
+    def _store_chunked(self, src, digest):
+        # Solo se escriben los fragmentos que no estaban ya guardados (por esta
+        # u otra versión de cualquier archivo del repositorio).
+        modo = compression_mode()
+        fragmentos = []
+        nuevos = escritos = 0
+        total = hashlib.sha256()
+        with open(src, "rb") as f:
+            for data in split_chunks(f):
+                total.update(data)
+                h = hashlib.sha256(data).hexdigest()
+                fragmentos.append([h, len(data)])
+                path = self.chunk_path(h)
+                if os.path.exists(path):
+                    try:
+                        os.utime(path)
+                    except OSError:
+                        pass
+                    continue
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp, "wb") as out:
+                    escritos += out.write(compress_chunk(data, modo))
+                os.chmod(tmp, 0o444)
+                os.replace(tmp, path)
+                nuevos += 1
+
+        # Los fragmentos ya escritos son correctos (cada uno bajo su propio hash);
+        # la receta solo si el archivo entero es el que se esperaba
+        if total.hexdigest() != digest:
+            raise _changed(src, digest)
+        # La receta se escribe al final: sin ella el archivo no figura como guardado
+        path = self.recipe_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tamano = sum(size for _, size in fragmentos)
+        atomic_write_json(path, {"size": tamano, "fragmentos": fragmentos}, journal=False)
+        metrics.add_bytes("object_store", escritos=escritos)
+        metrics.inc("fragmentos", nuevos, resultado="nuevo")
+        metrics.inc("fragmentos", len(fragmentos) - nuevos, resultado="reutilizado")
+        logging.info(f"Objeto fragmentado: {digest} ({len(fragmentos)} fragmentos, {nuevos} nuevos, "
+                     f"{escritos} de {tamano} bytes escritos)")
+        return digest
+
+    def open(self, digest):
+        if self.is_loose(digest):
+            return open(self.object_path(digest), "rb")
+        if self.is_chunked(digest):
+            raw = ChunkedFile(self.recipe(digest)["fragmentos"], self.read_chunk)
+            return io.BufferedReader(raw, CHUNK_SIZE)
+        return io.BytesIO(self.read(digest))
+
+
+def write_manifest(path, manifest):
+    # El manifiesto no existía antes: basta con temporal + rename, sin journal
+    atomic_write_json(path, manifest, journal=False, indent=2, sort_keys=True)
+
+
+def read_manifest(path):
+    with open(path, "r") as f:
+        return json.load(f)
@@ -0,0 +1,292 @@
+import os
+import zlib
+import struct
+import hashlib
+import logging
+
+PACK_DIR = "pack"
+PACK_MAGIC = b"VCSP"
+INDEX_MAGIC = b"VCSI"
+PACK_VERSION = 1
+
+OBJ_FULL = 1
+OBJ_DELTA = 2
+
+# Cada registro del índice: digest (32 bytes) + desplazamiento en el pack (8 bytes)
+INDEX_RECORD = struct.Struct(">32sQ")
+INDEX_HEADER = struct.Struct(">4sII")
+PACK_HEADER = struct.Struct(">4sII")
+
+DELTA_BLOCK = 16
+DELTA_MAX_SIZE = 16 * 1024 * 1024
+MAX_CHAIN = 10
+
+
+def _write_varint(n):
+    out = bytearray()
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _read_varint(data, pos):
+    n = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        n |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return n, pos
+        shift += 7
+
+
+def _match_len(base, bi, target, ti):
+    # Longitud de la coincidencia a partir de base[bi] y target[ti]
+    limite = min(len(base) - bi, len(target) - ti)
+    n = 0
+    paso = 4096
+    while paso:
+        while n + paso <= limite and base[bi + n:bi + n + paso] == target[ti + n:ti + n + paso]:
+            n += paso
+        paso //= 8
+    return n
+
+
+def create_delta(base, target):
+    # Delta binario: copias de rangos de base + inserciones literales
+    bloques = {}
+    for i in range(0, len(base) - DELTA_BLOCK + 1, DELTA_BLOCK):
+        bloques.setdefault(base[i:i + DELTA_BLOCK], i)
+
+    out = bytearray(_write_varint(len(base)) + _write_varint(len(target)))
+    literal_desde = 0
+    i = 0
+    n = len(target)
+    while i + DELTA_BLOCK <= n:
+        j = bloques.get(target[i:i + DELTA_BLOCK])
+        if j is None:
+            i += 1
+            continue
+        largo = _match_len(base, j, target, i)
+        if i > literal_desde:
+            literal = target[literal_desde:i]
+            out += b"\x02" + _write_varint(len(literal)) + literal
+        out += b"\x01" + _write_varint(j) + _write_varint(largo)
+        i += largo
+        literal_desde = i
+    if literal_desde < n:
+        literal = target[literal_desde:]
+        out += b"\x02" + _write_varint(len(literal)) + literal
+    return bytes(out)
+
+
+def apply_delta(base, delta):
+    base_len, pos = _read_varint(delta, 0)
+    target_len, pos = _read_varint(delta, pos)
+    if base_len != len(base):
+        raise ValueError("La base no corresponde al delta.")
+    out = bytearray()
+    while pos < len(delta):
+        op = delta[pos]
+        pos += 1
+        if op == 1:
+            offset, pos = _read_varint(delta, pos)
+            largo, pos = _read_varint(delta, pos)
+            out += base[offset:offset + largo]
+        elif op == 2:
+            largo, pos = _read_varint(delta, pos)
+            out += delta[pos:pos + largo]
+            pos += largo
+        else:
+            raise ValueError(f"Operación de delta desconocida: {op}")
+    if len(out) != target_len:
+        raise ValueError("El delta produjo un tamaño inesperado.")
+    return bytes(out)
+
+
+class PackReader:
+    def __init__(self, pack_path):
+        self.pack_path = pack_path
+        self.index_path = pack_path[:-len(".pack")] + ".idx"
+        with open(self.index_path, "rb") as f:
+            data = f.read()
+        magic, version, count = INDEX_HEADER.unpack_from(data, 0)
+        if magic != INDEX_MAGIC or version != PACK_VERSION:
+            raise ValueError(f"Índice de pack inválido: {self.index_path}")
+        self._index = memoryview(data)[INDEX_HEADER.size:]
+        self.count = count
+
+    def _record(self, i):
+        return INDEX_RECORD.unpack_from(self._index, i * INDEX_RECORD.size)
+
+    def find(self, digest):
+        # Búsqueda binaria sobre los registros ordenados del índice: O(log n)
+        clave = bytes.fromhex(digest)
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            actual, offset = self._record(mid)
+            if actual < clave:
+                lo = mid + 1
+            elif actual > clave:
+                hi = mid
+            else:
+                return offset
+        return None
+
+    def digests(self):
+        for i in range(self.count):
+            yield self._record(i)[0].hex()
+
+    def __contains__(self, digest):
+        return self.find(digest) is not None
+
+    def raw_entry(self, offset):
+        # (tipo, base, contenido comprimido) tal como está en el pack
+        with open(self.pack_path, "rb") as f:
+            f.seek(offset)
+            tipo = f.read(1)[0]
+            base = f.read(32).hex() if tipo == OBJ_DELTA else None
+            cabecera = f.read(10)
+            largo, usados = _read_varint(cabecera, 0)
+            f.seek(offset + 1 + (32 if base else 0) + usados)
+            return tipo, base, f.read(largo)
+
+    def read_entry(self, offset):
+        tipo, base, comprimido = self.raw_entry(offset)
+        return tipo, base, zlib.decompress(comprimido)
+
+
+class PackWriter:
+    # Escribe las entradas directamente al archivo temporal para no retener
+    # en memoria el contenido de todo el pack.
+    def __init__(self, pack_dir):
+        self.pack_dir = pack_dir
+        self.offsets = []
+        self._hash = hashlib.sha256()
+        self._tmp = None
+        self._file = None
+        self._pos = 0
+
+    def _open(self):
+        os.makedirs(self.pack_dir, exist_ok=True)
+        self._tmp = os.path.join(self.pack_dir, f"tmp-{os.getpid()}-{id(self)}.pack")
+        self._file = open(self._tmp, "wb")
+        # El número de objetos se completa al cerrar el pack
+        self._file.write(PACK_HEADER.pack(PACK_MAGIC, PACK_VERSION, 0))
+        self._pos = PACK_HEADER.size
+
+    def add(self, digest, data, base_digest=None, base_data=None):
+        tipo = OBJ_FULL
+        contenido = data
+        if base_digest is not None and len(data) <= DELTA_MAX_SIZE:
+            delta = create_delta(base_data, data)
+            # Solo compensa guardar el delta si es claramente más pequeño
+            if len(delta) < len(data) // 2:
+                tipo = OBJ_DELTA
+                contenido = delta
+
+        self.add_raw(digest, tipo, base_digest, zlib.compress(contenido, 6))
+        return tipo == OBJ_DELTA
+
+    def add_raw(self, digest, tipo, base_digest, comprimido):
+        # Copia una entrada ya comprimida (al reescribir un pack sin descomprimir)
+        if self._file is None:
+            self._open()
+        registro = bytes([tipo])
+        if tipo == OBJ_DELTA:
+            registro += bytes.fromhex(base_digest)
+        registro += _write_varint(len(comprimido)) + comprimido
+        self._file.write(registro)
+        self._hash.update(bytes.fromhex(digest))
+        self.offsets.append((bytes.fromhex(digest), self._pos))
+        self._pos += len(registro)
+
+    def abort(self):
+        if self._file is not None:
+            self._file.close()
+            os.remove(self._tmp)
+            self._file = None
+
+    def finish(self):
+        if self._file is None:
+            return None
+        self._file.seek(0)
+        self._file.write(PACK_HEADER.pack(PACK_MAGIC, PACK_VERSION, len(self.offsets)))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+
+        nombre = f"pack-{self._hash.hexdigest()[:40]}"
+        pack_path = os.path.join(self.pack_dir, nombre + ".pack")
+        index_path = os.path.join(self.pack_dir, nombre + ".idx")
+        self.offsets.sort()
+        tmp_index = index_path + ".tmp"
+        with open(tmp_index, "wb") as f:
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, PACK_VERSION, len(self.offsets)))
+            for clave, offset in self.offsets:
+                f.write(INDEX_RECORD.pack(clave, offset))
+            f.flush()
+            os.fsync(f.fileno())
+        # El pack se publica antes que su índice: un lector solo ve packs completos
+        os.replace(self._tmp, pack_path)
+        os.replace(tmp_index, index_path)
+        logging.info(f"Pack escrito: {pack_path} ({len(self.offsets)} objetos)")
+        return pack_path
+
+
+def pack_objects(store, manifests, keep_recent=1):
+    # Empaqueta los objetos que solo usan las versiones antiguas. Los manifiestos
+    # llegan en orden cronológico; cada versión de una ruta se guarda como delta
+    # de la versión anterior de esa misma ruta (si está en el mismo pack).
+    recientes = manifests[-keep_recent:] if keep_recent else []
+    antiguas = manifests[:len(manifests) - len(recientes)]
+    mantener = {e["hash"] for m in recientes for e in m["archivos"].values()}
+
+    writer = PackWriter(os.path.join(store.root, PACK_DIR))
+    profundidad = {}
+    ultimo_por_ruta = {}
+    # Objetos sueltos guardados otra vez por un commit aunque ya estaban empaquetados
+    duplicados = set()
+    try:
+        for manifest in antiguas:
+            for rel, entry in sorted(manifest["archivos"].items()):
+                digest = entry["hash"]
+                if digest in profundidad:
+                    ultimo_por_ruta[rel] = digest
+                    continue
+                if digest in mantener or not store.is_loose(digest):
+                    continue
+                if store.is_packed(digest):
+                    duplicados.add(digest)
+                    continue
+
+                data = store.read(digest)
+                base = ultimo_por_ruta.get(rel)
+                es_delta = False
+                if base is not None and profundidad[base] < MAX_CHAIN:
+                    es_delta = writer.add(digest, data, base, store.read(base))
+                else:
+                    writer.add(digest, data)
+                profundidad[digest] = profundidad[base] + 1 if es_delta else 0
+                ultimo_por_ruta[rel] = digest
+        pack_path = writer.finish()
+    except BaseException:
+        writer.abort()
+        raise
+
+    for digest in duplicados:
+        store.remove_loose(digest)
+    if pack_path is None:
+        return 0
+    store.refresh_packs()
+    for digest in profundidad:
+        store.remove_loose(digest)
+    return len(profundidad)
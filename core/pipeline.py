@@ -0,0 +1,14 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Con muchos archivos pequeños el coste está en la latencia de cada syscall
+# (open/read/rename), no en la CPU: un pool de hilos la solapa.
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+
+
+def parallel_map(func, items, workers=DEFAULT_WORKERS):
+    items = list(items)
+    if workers <= 1 or len(items) < 2:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(workers, len(items))) as pool:
+        return list(pool.map(func, items))
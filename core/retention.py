@@ -0,0 +1,124 @@
+import os
+import datetime
+from utils.atomic_io import atomic_write_json, read_json
+
+POLICY_FILE = "retencion.json"
+POLICY_KEYS = ("ultimas", "diarias", "semanales", "mensuales", "max_dias", "max_bytes")
+
+
+def _fecha(entrada):
+    try:
+        return datetime.datetime.fromisoformat(entrada["fecha"]) if entrada.get("fecha") else None
+    except ValueError:
+        return None
+
+
+PERIODOS = (
+    ("diarias", lambda f: f.date()),
+    ("semanales", lambda f: f.isocalendar()[:2]),
+    ("mensuales", lambda f: (f.year, f.month)),
+)
+
+
+class RetentionPolicy:
+    # Qué versiones se conservan. Las reglas "ultimas", "diarias", "semanales" y
+    # "mensuales" se suman (una versión se conserva si alguna la elige); después
+    # "max_dias" y "max_bytes" descartan las más antiguas. La última versión
+    # siempre se conserva. Sin ninguna regla no se elimina nada.
+    def __init__(self, ultimas=None, diarias=None, semanales=None, mensuales=None, max_dias=None, max_bytes=None):
+        self.ultimas = ultimas
+        self.diarias = diarias
+        self.semanales = semanales
+        self.mensuales = mensuales
+        self.max_dias = max_dias
+        self.max_bytes = max_bytes
+
+    def to_dict(self):
+        return {k: getattr(self, k) for k in POLICY_KEYS if getattr(self, k) is not None}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{k: data[k] for k in POLICY_KEYS if data.get(k) is not None})
+
+    def is_empty(self):
+        return not self.to_dict()
+
+    def select(self, entradas, ahora=None, archivos_de=None):
+        # entradas: registro de versiones en orden cronológico. archivos_de(nombre)
+        # devuelve los archivos del manifiesto (para max_bytes) o None.
+        # Devuelve los nombres de las versiones a eliminar, de la más antigua a la más nueva.
+        if not entradas:
+            return []
+        nombres = [e["version"] for e in entradas]
+        reglas = [self.ultimas, self.diarias, self.semanales, self.mensuales]
+        if all(r is None for r in reglas):
+            conservar = set(nombres)
+        else:
+            conservar = set(nombres[-self.ultimas:]) if self.ultimas else set()
+            for clave, periodo in PERIODOS:
+                cantidad = getattr(self, clave)
+                if not cantidad:
+                    continue
+                # La versión más reciente de cada uno de los últimos N periodos
+                vistos = set()
+                for entrada in reversed(entradas):
+                    fecha = _fecha(entrada)
+                    if fecha is None or periodo(fecha) in vistos:
+                        continue
+                    vistos.add(periodo(fecha))
+                    conservar.add(entrada["version"])
+                    if len(vistos) >= cantidad:
+                        break
+
+        head = nombres[-1]
+        if self.max_dias is not None:
+            limite = (ahora or datetime.datetime.now()) - datetime.timedelta(days=self.max_dias)
+            for entrada in entradas:
+                fecha = _fecha(entrada)
+                if entrada["version"] != head and (fecha is None or fecha < limite):
+                    conservar.discard(entrada["version"])
+        conservar.add(head)
+
+        if self.max_bytes is not None:
+            conservar = self._limit_bytes([e for e in entradas if e["version"] in conservar], archivos_de)
+
+        return [n for n in nombres if n not in conservar]
+
+    def _limit_bytes(self, entradas, archivos_de):
+        # Los objetos compartidos entre versiones cuentan una sola vez: se
+        # lleva la cuenta de cuántas versiones usan cada objeto.
+        usos = {}
+        tamanos = {}
+        propios = {}
+        for entrada in entradas:
+            archivos = archivos_de(entrada["version"]) if archivos_de else None
+            if archivos is None:
+                propios[entrada["version"]] = entrada["bytes"]
+                continue
+            for e in archivos.values():
+                usos[e["hash"]] = usos.get(e["hash"], 0) + 1
+                tamanos[e["hash"]] = e["size"]
+        total = sum(tamanos.values()) + sum(propios.values())
+
+        conservar = [e["version"] for e in entradas]
+        for entrada in entradas[:-1]:
+            if total <= self.max_bytes:
+                break
+            nombre = entrada["version"]
+            conservar.remove(nombre)
+            if nombre in propios:
+                total -= propios[nombre]
+                continue
+            for e in (archivos_de(nombre) or {}).values():
+                usos[e["hash"]] -= 1
+                if not usos[e["hash"]]:
+                    total -= tamanos[e["hash"]]
+        return set(conservar)
+
+
+def load_policy(repo_path):
+    return RetentionPolicy.from_dict(read_json(os.path.join(repo_path, POLICY_FILE), {}))
+
+
+def save_policy(repo_path, policy):
+    atomic_write_json(os.path.join(repo_path, POLICY_FILE), policy.to_dict(), indent=2)
@@ -0,0 +1,306 @@
+import os
+import codecs
+import sqlite3
+import logging
+import threading
+from core.diff import BINARY_SNIFF, is_binary
+from core.object_store import read_manifest
+from core.version_log import VersionLog
+from utils import metrics
+
+SEARCH_DB = os.path.join("indices", "busqueda.db")
+# Los archivos más grandes no se indexan: se revisan completos en cada búsqueda
+MAX_INDEX_SIZE = 8 * 1024 * 1024
+# Al buscar, los archivos se leen por bloques de este tamaño
+SCAN_BLOCK = 1024 * 1024
+# De una línea más larga (p. ej. un archivo sin saltos de línea) se muestra el comienzo
+MAX_LINE = 64 * 1024
+
+# Se cambia cuando cambia qué se guarda: un índice de otro formato se rehace
+INDEX_FORMAT = 2
+
+# Una sola actualización del índice a la vez por base de datos
+_update_locks = {}
+_update_guard = threading.Lock()
+
+
+def _lock_for(path):
+    with _update_guard:
+        return _update_locks.setdefault(os.path.abspath(path), threading.Lock())
+
+
+def fold(texto):
+    # Minúsculas de cualquier alfabeto (Ñ/ñ, É/é), igual en el índice y al verificar
+    return texto.casefold()
+
+
+def trigrams(data):
+    # Trigramas de bytes del texto en minúsculas (UTF-8), como enteros de 24
+    # bits. El índice no distingue mayúsculas; la verificación posterior sí,
+    # si se pide.
+    data = fold(data.decode("utf-8", errors="replace")).encode("utf-8")
+    return {(a << 16) | (b << 8) | c for a, b, c in set(zip(data, data[1:], data[2:]))}
+
+
+class SearchIndex:
+    # Índice invertido por contenido (blob): un mismo contenido se indexa una
+    # sola vez aunque aparezca en muchas versiones o rutas. Para cada ruta se
+    # guardan los tramos de versiones consecutivas en que tuvo un mismo blob,
+    # así el historial largo no multiplica las filas.
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS blobs (
+            id INTEGER PRIMARY KEY,
+            hash TEXT NOT NULL UNIQUE,
+            indexado INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS postings (
+            tri INTEGER NOT NULL,
+            blob INTEGER NOT NULL,
+            PRIMARY KEY (tri, blob)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS versiones (
+            orden INTEGER PRIMARY KEY,
+            nombre TEXT NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS apariciones (
+            blob INTEGER NOT NULL,
+            ruta TEXT NOT NULL,
+            desde INTEGER NOT NULL,
+            hasta INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS apariciones_blob ON apariciones(blob);
+        CREATE INDEX IF NOT EXISTS apariciones_abiertas ON apariciones(ruta) WHERE hasta IS NULL;
+    """
+
+    def __init__(self, store, repo_path):
+        self.store = store
+        self.repo_path = repo_path
+        self.path = os.path.join(repo_path, SEARCH_DB)
+        self.log = VersionLog(repo_path)
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._conn() as conn:
+            conn.executescript(self.SCHEMA)
+            if conn.execute("PRAGMA user_version").fetchone()[0] != INDEX_FORMAT:
+                for tabla in ("postings", "apariciones", "versiones", "blobs"):
+                    conn.execute(f"DELETE FROM {tabla}")
+                conn.execute(f"PRAGMA user_version = {INDEX_FORMAT}")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _blob_ids(self, conn, hashes):
+        ids = {}
+        lista = list(hashes)
+        for i in range(0, len(lista), 500):
+            parte = lista[i:i + 500]
+            marcas = ",".join("?" * len(parte))
+            ids.update(conn.execute(f"SELECT hash, id FROM blobs WHERE hash IN ({marcas})", parte))
+        return ids
+
+    def index_blob(self, conn, digest, data, grande=False):
+        if is_binary(data):
+            indexado = -1
+        elif grande or len(data) > MAX_INDEX_SIZE:
+            indexado = 0
+        else:
+            indexado = 1
+        cursor = conn.execute("INSERT OR IGNORE INTO blobs(hash, indexado) VALUES (?, ?)", (digest, indexado))
+        if not cursor.rowcount:
+            return
+        if indexado == 1:
+            blob_id = cursor.lastrowid
+            conn.executemany(
+                "INSERT OR IGNORE INTO postings(tri, blob) VALUES (?, ?)",
+                ((tri, blob_id) for tri in trigrams(data)),
+            )
+        metrics.inc("busqueda_blobs_indexados")
+
+    def update(self):
+        # Indexa las versiones del registro que aún no están en el índice. El
+        # orden de cada versión es su posición en el registro; los tramos
+        # suponen que las versiones se indexan en ese orden.
+        with _lock_for(self.path):
+            conn = self._conn()
+            indexadas = dict(conn.execute("SELECT nombre, orden FROM versiones"))
+            entradas = self.log.entries()
+            posiciones = {e["version"]: i for i, e in enumerate(entradas)}
+            nuevas = [(i, e) for i, e in enumerate(entradas) if e["version"] not in indexadas and e["manifiesto"]]
+            movidas = any(posiciones.get(nombre) != orden for nombre, orden in indexadas.items())
+            if movidas or (nuevas and nuevas[0][0] < max(indexadas.values(), default=-1)):
+                # Una poda corrió las posiciones o pack convirtió una versión
+                # antigua: se rehacen los tramos en orden. Los blobs y sus
+                # trigramas no dependen de las versiones y se conservan.
+                with conn:
+                    conn.execute("DELETE FROM apariciones")
+                    conn.execute("DELETE FROM versiones")
+                nuevas = [(i, e) for i, e in enumerate(entradas) if e["manifiesto"]]
+            for orden, entrada in nuevas:
+                path = os.path.join(self.repo_path, *entrada["manifiesto"].split("/"))
+                if not os.path.exists(path):
+                    continue
+                with conn:
+                    self._index_version(conn, orden, entrada["version"], read_manifest(path)["archivos"])
+            if nuevas:
+                logging.info(f"Índice de búsqueda de {self.repo_path}: {len(nuevas)} versiones nuevas")
+            return len(nuevas)
+
+    def _index_version(self, conn, orden, nombre, archivos):
+        conn.execute("INSERT INTO versiones(orden, nombre) VALUES (?, ?)", (orden, nombre))
+        tamanos = {e["hash"]: e["size"] for e in archivos.values()}
+        hashes = set(tamanos)
+        ids = self._blob_ids(conn, hashes)
+        for digest in hashes - ids.keys():
+            try:
+                if tamanos[digest] > MAX_INDEX_SIZE:
+                    # Sin leerlo entero: basta el comienzo para saber si es binario
+                    with self.store.open(digest) as f:
+                        self.index_blob(conn, digest, f.read(BINARY_SNIFF), grande=True)
+                    continue
+                data = self.store.read(digest)
+            except FileNotFoundError:
+                continue
+            self.index_blob(conn, digest, data)
+        ids = self._blob_ids(conn, hashes)
+
+        # Tramos abiertos (ruta -> blob) de la versión anterior
+        abiertas = dict(conn.execute("SELECT ruta, blob FROM apariciones WHERE hasta IS NULL"))
+        for ruta, blob_id in abiertas.items():
+            entry = archivos.get(ruta)
+            if entry is None or ids.get(entry["hash"]) != blob_id:
+                conn.execute(
+                    "UPDATE apariciones SET hasta = ? WHERE ruta = ? AND hasta IS NULL", (orden - 1, ruta)
+                )
+        for ruta, entry in archivos.items():
+            blob_id = ids.get(entry["hash"])
+            if blob_id is not None and abiertas.get(ruta) != blob_id:
+                conn.execute(
+                    "INSERT INTO apariciones(blob, ruta, desde, hasta) VALUES (?, ?, ?, NULL)", (blob_id, ruta, orden)
+                )
+
+    def candidates(self, texto):
+        # Hashes de los blobs que contienen todos los trigramas del texto
+        # buscado, más los que no se pudieron indexar por tamaño.
+        conn = self._conn()
+        tris = trigrams(texto.encode("utf-8"))
+        if not tris:
+            # Menos de tres caracteres: cualquier blob de texto es candidato
+            return {h for (h,) in conn.execute("SELECT hash FROM blobs WHERE indexado >= 0")}
+        grandes = {h for (h,) in conn.execute("SELECT hash FROM blobs WHERE indexado = 0")}
+        resultado = None
+        # Primero los trigramas menos frecuentes: la intersección se reduce antes
+        frecuencias = sorted(
+            (conn.execute("SELECT count(*) FROM postings WHERE tri = ?", (tri,)).fetchone()[0], tri) for tri in tris
+        )
+        for _, tri in frecuencias:
+            blobs = {b for (b,) in conn.execute("SELECT blob FROM postings WHERE tri = ?", (tri,))}
+            resultado = blobs if resultado is None else resultado & blobs
+            if not resultado:
+                break
+        hashes = set()
+        lista = list(resultado or ())
+        for i in range(0, len(lista), 500):
+            parte = lista[i:i + 500]
+            marcas = ",".join("?" * len(parte))
+            hashes.update(h for (h,) in conn.execute(f"SELECT hash FROM blobs WHERE id IN ({marcas})", parte))
+        return hashes | grandes
+
+    def occurrences(self, hashes, solo_ultima=False):
+        # (hash, ruta, [versiones]) de cada blob candidato, por ruta y en orden cronológico
+        conn = self._conn()
+        nombres = dict(conn.execute("SELECT orden, nombre FROM versiones"))
+        existentes = set(self.log.names())
+        ultima = max(nombres) if nombres else None
+        ids = self._blob_ids(conn, hashes)
+        por_id = {v: k for k, v in ids.items()}
+        resultado = []
+        lista = list(por_id)
+        for i in range(0, len(lista), 500):
+            parte = lista[i:i + 500]
+            marcas = ",".join("?" * len(parte))
+            filas = conn.execute(
+                f"SELECT blob, ruta, desde, hasta FROM apariciones WHERE blob IN ({marcas})", parte
+            ).fetchall()
+            for blob_id, ruta, desde, hasta in filas:
+                hasta = ultima if hasta is None else hasta
+                if solo_ultima and hasta != ultima:
+                    continue
+                rango = range(ultima, ultima + 1) if solo_ultima else range(desde, hasta + 1)
+                # Las versiones podadas siguen numeradas en el índice: se omiten
+                versiones = [nombres[o] for o in rango if o in nombres and nombres[o] in existentes]
+                if versiones:
+                    resultado.append((ruta, desde, por_id[blob_id], versiones))
+        resultado.sort()
+        return [(digest, ruta, versiones) for ruta, _, digest, versiones in resultado]
+
+    def missing(self, hashes):
+        return set(hashes) - self._blob_ids(self._conn(), hashes).keys()
+
+    def add_files(self, rutas):
+        # rutas: hash -> ruta (archivos de la carpeta de trabajo). Se leen de a
+        # uno; de los que no se indexan por tamaño solo se lee el comienzo.
+        with _lock_for(self.path):
+            conn = self._conn()
+            with conn:
+                for digest, path in rutas.items():
+                    try:
+                        grande = os.path.getsize(path) > MAX_INDEX_SIZE
+                        with open(path, "rb") as f:
+                            data = f.read(BINARY_SNIFF if grande else -1)
+                    except FileNotFoundError:
+                        continue
+                    self.index_blob(conn, digest, data, grande)
+
+
+def matching_lines(f, texto, ignorar_mayusculas=False):
+    # (número de línea, línea) de cada línea del archivo binario f que contiene
+    # el texto. Se lee por bloques de SCAN_BLOCK: la memoria no depende del
+    # tamaño del archivo. De cada línea se guardan hasta MAX_LINE caracteres y
+    # una cola de len(texto) - 1 para las coincidencias entre dos bloques; los
+    # bloques sin coincidencias solo se usan para contar líneas.
+    buscado = fold(texto) if ignorar_mayusculas else texto
+    comparable = fold if ignorar_mayusculas else (lambda t: t)
+    largo_cola = len(buscado) - 1
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    resultados = []
+    numero = 1
+    linea = cola = ""
+    coincide = False
+    fin = False
+    while not fin:
+        bloque = f.read(SCAN_BLOCK)
+        fin = not bloque
+        datos = decoder.decode(bloque, final=fin)
+        if coincide or buscado in cola + comparable(datos):
+            partes = datos.split("\n")
+        else:
+            # Sin coincidencias en el bloque: se cuentan sus saltos de línea y
+            # solo se conserva la última línea, que puede seguir en el próximo
+            ultimo = datos.rfind("\n")
+            if ultimo < 0:
+                partes = [datos]
+            else:
+                numero += datos.count("\n") - 1
+                partes = ["", datos[ultimo + 1:]]
+        for i, parte in enumerate(partes):
+            if i:
+                if coincide:
+                    resultados.append((numero, linea.rstrip("\r")))
+                numero += 1
+                linea = cola = ""
+                coincide = False
+            if not coincide:
+                ventana = cola + comparable(parte)
+                coincide = buscado in ventana
+                cola = ventana[-largo_cola:] if largo_cola else ""
+            if len(linea) < MAX_LINE:
+                linea += parte[:MAX_LINE - len(linea)]
+    if coincide:
+        resultados.append((numero, linea.rstrip("\r")))
+    return resultados
@@ -0,0 +1,328 @@
+import io
+import base64
+import sys
+import json
+import time
+import asyncio
+import logging
+import threading
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from core.context_manager import Session
+from core.locks import LockRegistry
+from core.version_control import VersionControl
+from core.retention import RetentionPolicy, POLICY_KEYS
+from users.user_manager import UserManager
+from utils import metrics
+
+# Protocolo: una petición JSON por línea y una respuesta JSON por línea.
+#   {"op": "use", "usuario": "beto", "destino": "ana"}
+#   {"op": "commit"}
+#   {"op": "log", "ultimas": 5}
+# Respuesta: {"ok": true, "resultado": ..., "salida": "<lo que se imprimió>"}
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+
+class _ThreadLocalStdout:
+    # Redirige print() al búfer de la petición que se ejecuta en cada hilo
+    def __init__(self, original):
+        self.original = original
+        self.local = threading.local()
+
+    def write(self, data):
+        buffer = getattr(self.local, "buffer", None)
+        return (buffer or self.original).write(data)
+
+    def flush(self):
+        buffer = getattr(self.local, "buffer", None)
+        (buffer or self.original).flush()
+
+    def __getattr__(self, name):
+        return getattr(self.original, name)
+
+
+class ClientSession:
+    def __init__(self, session_id, user_manager, workers):
+        self.id = session_id
+        self.ctx = Session()
+        self.vc = VersionControl(self.ctx, user_manager, workers=workers)
+
+
+class VCSServer:
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_path=None, max_workers=16, user_manager=None):
+        self.host = host
+        self.port = port
+        self.unix_path = unix_path
+        self.um = user_manager or UserManager()
+        self.locks = LockRegistry()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="vcs")
+        # Cada operación usa un solo hilo del pool; el paralelismo está entre sesiones
+        self.vc_workers = 1
+        self._users_lock = threading.Lock()
+        self._next_id = 0
+        self._stdout = None
+
+    async def handle(self, reader, writer):
+        self._next_id += 1
+        session = ClientSession(self._next_id, self.um, self.vc_workers)
+        logging.info(f"Sesión {session.id} abierta.")
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                linea = await reader.readline()
+                if not linea:
+                    break
+                try:
+                    peticion = json.loads(linea)
+                    if not isinstance(peticion, dict):
+                        raise ValueError("se esperaba un objeto")
+                except ValueError as e:
+                    peticion = {}
+                    respuesta = {"ok": False, "error": f"Petición inválida: {e}"}
+                else:
+                    respuesta = await loop.run_in_executor(self.executor, self.execute, session, peticion)
+                writer.write((json.dumps(respuesta, ensure_ascii=False) + "\n").encode("utf-8"))
+                await writer.drain()
+                if peticion.get("op") == "quit":
+                    break
+        finally:
+            writer.close()
+            logging.info(f"Sesión {session.id} cerrada.")
+
+    def execute(self, session, peticion):
+        op = peticion.get("op")
+        metodo = getattr(self, f"_op_{str(op).replace('-', '_')}", None)
+        if metodo is None:
+            return {"ok": False, "error": f"Operación desconocida: {op}"}
+
+        buffer = io.StringIO()
+        self._stdout.local.buffer = buffer
+        inicio = time.perf_counter()
+        try:
+            ok, resultado = metodo(session, peticion)
+            respuesta = {"ok": ok, "resultado": resultado}
+        except Exception as e:
+            logging.exception(f"Error en la operación {op} (sesión {session.id})")
+            respuesta = {"ok": False, "error": str(e)}
+        finally:
+            self._stdout.local.buffer = None
+            metrics.observe("server", str(op), time.perf_counter() - inicio)
+        respuesta["salida"] = buffer.getvalue()
+        return respuesta
+
+    def _target(self, session):
+        ctx = session.ctx.get_context()
+        if not ctx:
+            return None, None
+        return ctx["usuario_destino"], ctx["path"]
+
+    def _reading(self, session, workdir=True):
+        destino, path = self._target(session)
+        if destino is None:
+            return nullcontext()
+        return self.locks.reading(destino, path if workdir else None)
+
+    def _writing(self, session, workdir=True):
+        destino, path = self._target(session)
+        if destino is None:
+            return nullcontext()
+        return self.locks.writing(destino, path if workdir else None)
+
+    def _op_ping(self, session, peticion):
+        return True, "pong"
+
+    def _op_quit(self, session, peticion):
+        return True, None
+
+    def _op_metrics(self, session, peticion):
+        if peticion.get("formato") == "json":
+            return True, metrics.snapshot()
+        return True, metrics.render_prometheus()
+
+    def _op_use(self, session, peticion):
+        actual = peticion.get("usuario")
+        destino = peticion.get("destino") or actual
+        if not self.um.user_exists(actual) or not self.um.user_exists(destino):
+            print("Uno de los usuarios no existe.")
+            return False, None
+        if not self.um.has_any_permission(actual, destino):
+            print(f"No tienes permisos para acceder al repositorio de {destino}.")
+            return False, None
+        session.ctx.set_context(actual, destino)
+        return True, session.ctx.get_context()
+
+    def _op_users(self, session, peticion):
+        return True, sorted(self.um.load_users())
+
+    def _op_user_add(self, session, peticion):
+        with self._users_lock:
+            return bool(self.um.create_user(peticion["nombre"])), None
+
+    def _op_bulk(self, session, peticion):
+        # {"op": "bulk", "usuarios": [...], "cambios": [["grant", dueño, usuario, permiso], ...]}
+        cambios = [tuple(c) for c in peticion.get("cambios", [])]
+        if any(len(c) != 4 for c in cambios):
+            print("Cada cambio debe ser [accion, dueño, usuario, permiso].")
+            return False, None
+        with self._users_lock:
+            resumen = self.um.bulk(peticion.get("usuarios", []), cambios, bool(peticion.get("simular")))
+        return resumen is not None, resumen
+
+    def _op_grant(self, session, peticion):
+        with self._users_lock, self.locks.writing(peticion["dueno"]):
+            ok = self.um.assign_permission(peticion["dueno"], peticion["usuario"], peticion["permiso"])
+        return bool(ok), None
+
+    def _op_revoke(self, session, peticion):
+        with self._users_lock, self.locks.writing(peticion["dueno"]):
+            ok = self.um.remove_permission(peticion["dueno"], peticion["usuario"], peticion["permiso"])
+        return bool(ok), None
+
+    def _op_groups(self, session, peticion):
+        datos = self.um.list_groups()
+        return True, dict(datos, proyectos=self.um.groups.load_projects())
+
+    def _op_group(self, session, peticion):
+        with self._users_lock:
+            if peticion.get("eliminar"):
+                return bool(self.um.delete_group(peticion["nombre"])), None
+            return bool(self.um.define_group(peticion["nombre"], peticion.get("miembros", []))), None
+
+    def _op_project(self, session, peticion):
+        with self._users_lock:
+            return bool(self.um.define_project(peticion["nombre"], peticion["repos"])), None
+
+    def _op_group_grant(self, session, peticion):
+        with self._users_lock:
+            ok = self.um.grant_group(peticion["grupo"], peticion["rol"], peticion.get("repo"), peticion.get("proyecto"))
+        return bool(ok), None
+
+    def _op_group_revoke(self, session, peticion):
+        with self._users_lock:
+            ok = self.um.revoke_group(peticion["grupo"], peticion.get("repo"), peticion.get("proyecto"))
+        return bool(ok), None
+
+    def _op_commit(self, session, peticion):
+        with self._writing(session):
+            version = session.vc.commit()
+        return version is not None, version
+
+    def _op_update(self, session, peticion):
+        with self._reading(session):
+            return bool(session.vc.update(peticion.get("rutas"))), None
+
+    def _op_sparse(self, session, peticion):
+        with self._reading(session, workdir=False):
+            patrones = session.vc.sparse(peticion.get("rutas"), bool(peticion.get("limpiar")))
+        return patrones is not None, patrones
+
+    def _op_status(self, session, peticion):
+        with self._reading(session):
+            cambios = session.vc.status()
+        return cambios is not None, cambios
+
+    def _op_recover(self, session, peticion):
+        archivo = peticion.get("archivo")
+        with self._reading(session):
+            ok = session.vc.recover(peticion["version"], archivo, is_file=bool(archivo), patrones=peticion.get("rutas"))
+        return bool(ok), None
+
+    def _op_log(self, session, peticion):
+        with self._reading(session, workdir=False):
+            if peticion.get("ultimas"):
+                versiones = session.vc.latest_versions(int(peticion["ultimas"]))
+            elif peticion.get("desde") or peticion.get("hasta"):
+                versiones = session.vc.versions_between(peticion.get("desde"), peticion.get("hasta"))
+            else:
+                versiones = session.vc.list_versions()
+        return True, versiones
+
+    def _op_files(self, session, peticion):
+        with self._reading(session, workdir=False):
+            return True, session.vc.list_files_in_version(peticion["version"])
+
+    def _op_diff(self, session, peticion):
+        workdir = peticion.get("version_b") is None
+        with self._reading(session, workdir=workdir):
+            cambios = session.vc.diff(
+                peticion["version_a"],
+                peticion.get("version_b"),
+                peticion.get("ruta"),
+                contenido=not peticion.get("resumen", False),
+            )
+        return cambios is not None, cambios
+
+    def _op_prune(self, session, peticion):
+        valores = {k: peticion[k] for k in POLICY_KEYS if peticion.get(k) is not None}
+        policy = RetentionPolicy(**valores) if valores else None
+        with self._writing(session, workdir=False):
+            eliminadas = session.vc.prune(
+                policy,
+                simular=bool(peticion.get("simular")),
+                guardar=bool(peticion.get("guardar")),
+                recolectar=not peticion.get("sin_gc"),
+            )
+        return eliminadas is not None, eliminadas
+
+    def _op_gc(self, session, peticion):
+        # Con "presupuesto" el cliente puede repetir la petición hasta "completo"
+        with self._writing(session, workdir=False):
+            resultado = session.vc.gc(peticion.get("presupuesto"))
+        return resultado is not None, resultado
+
+    def _op_search(self, session, peticion):
+        alcance = peticion.get("en", "todas")
+        with self._reading(session, workdir=alcance == "temporal"):
+            resultados = session.vc.search(peticion["texto"], alcance, bool(peticion.get("ignorar_mayusculas")))
+        return resultados is not None, resultados
+
+    def _op_stat(self, session, peticion):
+        with self._reading(session, workdir=False):
+            info = session.vc.stat_file(peticion["version"], peticion.get("ruta", ""))
+        return info is not None, info
+
+    def _op_read(self, session, peticion):
+        # Un tramo de un archivo de una versión, en base64
+        with self._reading(session, workdir=False):
+            data = session.vc.read_file(
+                peticion["version"],
+                peticion["ruta"],
+                int(peticion.get("offset", 0)),
+                int(peticion.get("size", -1)),
+            )
+        if data is None:
+            return False, None
+        return True, {"size": len(data), "datos": base64.b64encode(data).decode("ascii")}
+
+    def _op_pack(self, session, peticion):
+        with self._writing(session, workdir=False):
+            empaquetados = session.vc.pack(keep_recent=int(peticion.get("mantener", 1)))
+        return empaquetados is not None, empaquetados
+
+    async def serve_forever(self):
+        self._stdout = _ThreadLocalStdout(sys.stdout)
+        sys.stdout = self._stdout
+        try:
+            if self.unix_path:
+                server = await asyncio.start_unix_server(self.handle, path=self.unix_path)
+                destino = self.unix_path
+            else:
+                server = await asyncio.start_server(self.handle, self.host, self.port)
+                destino = f"{self.host}:{self.port}"
+            logging.info(f"Servidor escuchando en {destino}")
+            print(f"Servidor escuchando en {destino}", file=self._stdout.original, flush=True)
+            async with server:
+                await server.serve_forever()
+        finally:
+            sys.stdout = self._stdout.original
+            self.executor.shutdown(wait=True)
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, unix_path=None, max_workers=16):
+    server = VCSServer(host, port, unix_path, max_workers)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        logging.info("Servidor detenido.")
@@ -0,0 +1,77 @@
+import os
+import re
+from utils.atomic_io import atomic_write_json, read_json
+
+SPARSE_DIR = "sparse"
+
+
+def _glob_regex(patron):
+    # "*" y "?" no cruzan carpetas; "**" sí. Un patrón que nombra una carpeta
+    # incluye todo lo que hay debajo.
+    partes = []
+    i = 0
+    while i < len(patron):
+        c = patron[i]
+        if patron.startswith("**", i):
+            partes.append(".*")
+            i += 2
+            if patron.startswith("/", i):
+                # "a/**/b" también encaja con "a/b"
+                partes[-1] = "(?:.*/)?"
+                i += 1
+            continue
+        if c == "*":
+            partes.append("[^/]*")
+        elif c == "?":
+            partes.append("[^/]")
+        else:
+            partes.append(re.escape(c))
+        i += 1
+    return "".join(partes) + "(?:/.*)?"
+
+
+def normalize(patron):
+    return patron.strip().replace(os.sep, "/").strip("/")
+
+
+class SparseProfile:
+    # Rutas de trabajo de un usuario en un repositorio: prefijos ("docs",
+    # "src/app.py") o patrones glob ("src/**/*.py"). Los que empiezan con "!"
+    # excluyen. Un perfil vacío incluye todo.
+    def __init__(self, patrones=()):
+        self.patrones = [normalize(p) for p in patrones if normalize(p).lstrip("!")]
+        incluir = [p for p in self.patrones if not p.startswith("!")]
+        excluir = [p[1:] for p in self.patrones if p.startswith("!")]
+        self._incluir = re.compile("|".join(map(_glob_regex, incluir))) if incluir else None
+        self._excluir = re.compile("|".join(map(_glob_regex, excluir))) if excluir else None
+
+    def __bool__(self):
+        return bool(self.patrones)
+
+    def matches(self, rel):
+        if self._incluir is not None and not self._incluir.fullmatch(rel):
+            return False
+        return self._excluir is None or not self._excluir.fullmatch(rel)
+
+    def filter(self, archivos):
+        if not self:
+            return archivos
+        return {rel: entry for rel, entry in archivos.items() if self.matches(rel)}
+
+
+def _profile_path(repo_path, usuario):
+    return os.path.join(repo_path, SPARSE_DIR, f"{usuario}.json")
+
+
+def load_profile(repo_path, usuario):
+    return SparseProfile(read_json(_profile_path(repo_path, usuario), {}).get("patrones", []))
+
+
+def save_profile(repo_path, usuario, profile):
+    path = _profile_path(repo_path, usuario)
+    if not profile:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    atomic_write_json(path, {"patrones": profile.patrones}, indent=2)
@@ -2,15 +2,99 @@ import os
 import shutil
 import datetime
 import logging
-from core.context_manager import ContextManager
+import threading
+from core.context_manager import Session
+from core.object_store import (
+    CHUNK_SIZE, ContentChangedError, ObjectStore, from_rel, read_manifest, write_manifest,
+)
+from core.work_index import WorkIndex, compare_trees
+from core.materialize import Materializer, default_mode
+from core.pack import pack_objects
+from core.diff import tree_hashes, diff_trees, diff_files, is_binary, BINARY_SNIFF
+from core.retention import load_policy, save_policy
+from core.sparse import SparseProfile, load_profile, save_profile
+from core.version_log import VersionLog
+from core.pipeline import DEFAULT_WORKERS, parallel_map
 from users.user_manager import UserManager
+from utils import metrics
+
+MANIFEST_EXT = ".json"
 
 class VersionControl:
-    def __init__(self):
-        self.ctx = ContextManager()
-        self.um = UserManager()
+    def __init__(self, session=None, um=None, materialize_mode=None, workers=DEFAULT_WORKERS):
+        # session: contexto explícito (core.context_manager.Session); por defecto
+        # el contexto persistido en data/context.json, leído una sola vez.
+        self.ctx = session or Session.load()
+        self.um = um or UserManager()
         self.base_repo = "repo_root"
-
+        # VCS_MATERIALIZE=hardlink activa los enlaces; por defecto reflink o copia
+        self.materialize_mode = materialize_mode or default_mode()
+        self.workers = workers
+        # Vistas de solo lectura de las versiones, por repositorio
+        self._trees = {}
+
+    def _store(self, usuario):
+        return ObjectStore(os.path.join(self.base_repo, usuario))
+
+    def _checkout(self, usuario, archivos, dest, alcance=None, perfil=None):
+        materializer = Materializer(self._store(usuario), self.materialize_mode, self.workers)
+        return materializer.checkout(archivos, dest, os.path.join(self.base_repo, usuario), alcance, perfil)
+
+    def _manifest_path(self, usuario, version_name):
+        return os.path.join(self.base_repo, usuario, "versiones", version_name + MANIFEST_EXT)
+
+    def _load_manifest(self, usuario, version_name):
+        # Los nombres llegan del usuario (menú, línea de comandos, servidor): solo
+        # se arma la ruta de las versiones registradas en el historial.
+        if not self._log(usuario).has(version_name):
+            return None
+        path = self._manifest_path(usuario, version_name)
+        if not os.path.exists(path):
+            return None
+        return read_manifest(path)
+
+    def _log(self, usuario):
+        return VersionLog(os.path.join(self.base_repo, usuario))
+
+    def _version_names(self, usuario):
+        log = self._log(usuario)
+        if not os.path.exists(log.path) and not os.path.exists(log.version_dir):
+            return None
+        return log.names()
+
+    def _work_tree(self, usuario_actual, usuario_destino, temp_path, head):
+        # Árbol de la carpeta de trabajo. Con un perfil de rutas, lo que queda
+        # fuera de él no se materializó: se toma tal cual de la última versión.
+        # Vale el perfil con que se materializó la carpeta (anotado en el índice),
+        # no el guardado: "sparse" cambia el perfil sin aplicarlo hasta el update.
+        repo_path = os.path.join(self.base_repo, usuario_destino)
+        index = WorkIndex(repo_path, temp_path)
+        archivos, _ = index.refresh(self.workers)
+        if index.perfil is not None:
+            profile = SparseProfile(index.perfil)
+        else:
+            profile = load_profile(repo_path, usuario_actual)
+        if profile and head:
+            for rel, entry in head["archivos"].items():
+                if rel not in archivos and not profile.matches(rel):
+                    archivos[rel] = entry
+        return archivos, index
+
+    def _mark_complete(self, usuario, work_path):
+        # La carpeta se copió entera: en el índice queda sin perfil de rutas
+        index = WorkIndex(os.path.join(self.base_repo, usuario), work_path)
+        index.refresh(self.workers)
+        index.perfil = []
+        index.save()
+
+    def _head_manifest(self, usuario):
+        # Las versiones antiguas (copia completa del árbol) no tienen manifiesto
+        for entrada in reversed(self._log(usuario).entries()):
+            if entrada["manifiesto"]:
+                return self._load_manifest(usuario, entrada["version"])
+        return None
+
+    @metrics.timed("version_control")
     def commit(self):
         ctx = self.ctx.get_context()
         if not ctx:
@@ -21,14 +105,11 @@ class VersionControl:
         usuario_destino = ctx["usuario_destino"]
         temp_path = ctx["path"]
 
-        users = self.um.load_users()
-        if usuario_destino not in users:
+        if not self.um.user_exists(usuario_destino):
             print(f"El usuario destino '{usuario_destino}' no existe.")
             return
 
-        permisos = users[usuario_destino].get("permisos", {})
-        permiso = permisos.get(usuario_actual)
-        if usuario_actual != usuario_destino and permiso != "write":
+        if not self.um.has_write_permission(usuario_actual, usuario_destino):
             print(f"No tienes permisos de escritura sobre el usuario '{usuario_destino}'.")
             return
 
@@ -39,21 +120,88 @@ class VersionControl:
             print(f"No se encontró la carpeta temporal de trabajo: {temp_path}")
             return
 
-        os.makedirs(perm_path, exist_ok=True)
         os.makedirs(version_path, exist_ok=True)
 
-        if os.path.exists(perm_path):
-            shutil.rmtree(perm_path)
-        shutil.copytree(temp_path, perm_path)
-
-        timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
-        version_dir = os.path.join(version_path, f"v_{timestamp}")
-        shutil.copytree(perm_path, version_dir)
-
-        print(f"Commit realizado sobre {usuario_destino}. Versión guardada: v_{timestamp}")
-
+        store = self._store(usuario_destino)
+        head = self._head_manifest(usuario_destino)
+        archivos, index = self._work_tree(usuario_actual, usuario_destino, temp_path, head)
+        anteriores = head["archivos"] if head else {}
+        cambios = compare_trees(archivos, anteriores)
+        # Solo se leen y almacenan los archivos cuyo contenido difiere del último
+        # commit; un mismo contenido en varias rutas se guarda una sola vez.
+        por_hash = {}
+        for rel in cambios["nuevos"] + cambios["modificados"]:
+            por_hash.setdefault(archivos[rel]["hash"], rel)
+        try:
+            parallel_map(
+                lambda item: store.store_file(from_rel(temp_path, item[1]), item[0]),
+                por_hash.items(),
+                self.workers,
+            )
+        except ContentChangedError as e:
+            # Se editó un archivo durante el commit: no se escribe la versión
+            logging.warning(f"Commit sobre {usuario_destino} cancelado: {e}")
+            print(f"Commit cancelado: {e} Vuelva a intentarlo.")
+            return
+        metrics.add_files("version_control", len(archivos), "commit")
+
+        self._checkout(usuario_destino, archivos, perm_path, perfil=[])
+
+        now = datetime.datetime.now()
+        version_name = f"v_{now.strftime('%Y%m%d%H%M%S')}"
+        sufijo = 1
+        while os.path.exists(self._manifest_path(usuario_destino, version_name)):
+            version_name = f"v_{now.strftime('%Y%m%d%H%M%S')}_{sufijo}"
+            sufijo += 1
+        manifest = {
+            "version": version_name,
+            "autor": usuario_actual,
+            "fecha": now.isoformat(timespec="seconds"),
+            "archivos": archivos,
+            "directorios": tree_hashes(archivos),
+        }
+        write_manifest(self._manifest_path(usuario_destino, version_name), manifest)
+        self._log(usuario_destino).append(manifest)
+        index.save()
+        logging.info(f"Commit {version_name} sobre {usuario_destino}: {len(archivos)} archivos")
+
+        print(f"Commit realizado sobre {usuario_destino}. Versión guardada: {version_name}")
+        return version_name
+
+
+    @metrics.timed("version_control")
+    def status(self):
+        ctx = self.ctx.get_context()
+        if not ctx:
+            print("No hay contexto activo.")
+            return None
 
-    def update(self):
+        usuario_destino = ctx["usuario_destino"]
+        temp_path = ctx["path"]
+        if not os.path.exists(temp_path):
+            print(f"No se encontró la carpeta temporal de trabajo: {temp_path}")
+            return None
+
+        head = self._head_manifest(usuario_destino)
+        archivos, index = self._work_tree(ctx["usuario_actual"], usuario_destino, temp_path, head)
+        index.save()
+        cambios = compare_trees(archivos, head["archivos"] if head else {})
+
+        if not any(cambios.values()):
+            print("No hay cambios respecto a la última versión.")
+            return cambios
+
+        etiquetas = (("nuevos", "Nuevo"), ("modificados", "Modificado"), ("eliminados", "Eliminado"))
+        for clave, etiqueta in etiquetas:
+            for rel in cambios[clave]:
+                print(f"{etiqueta}: {rel}")
+        return cambios
+
+    @metrics.timed("version_control")
+    def update(self, patrones=None):
+        # patrones: rutas o globs a traer; se guardan como perfil de rutas del
+        # usuario (sparse), que usan también los siguientes update y commit.
+        # Sin patrones se usa el perfil guardado; sin perfil se trae todo.
         ctx = self.ctx.get_context()
         if not ctx:
             print("No hay contexto activo.")
@@ -67,14 +215,11 @@ class VersionControl:
             return
 
         # Verificar permisos
-        users = self.um.load_users()
-        if target_user not in users:
+        if not self.um.user_exists(target_user):
             print(f"El usuario destino '{target_user}' no existe.")
             return
 
-        permisos = users[target_user].get("permisos", {})
-        permiso = permisos.get(current_user)
-        if current_user != target_user and permiso not in ["read", "write"]:
+        if not self.um.has_read_permission(current_user, target_user):
             print(f"No tienes permisos sobre el usuario '{target_user}'.")
             return
 
@@ -85,6 +230,26 @@ class VersionControl:
             f"temp_{current_user}" if current_user != target_user else "temporal"
         )
 
+        head = self._head_manifest(target_user)
+        if head is not None:
+            repo_path = os.path.join(self.base_repo, target_user)
+            if patrones:
+                profile = SparseProfile(patrones)
+                save_profile(repo_path, current_user, profile)
+            else:
+                profile = load_profile(repo_path, current_user)
+            archivos = profile.filter(head["archivos"])
+            try:
+                escritos, eliminados = self._checkout(target_user, archivos, temp_dest, perfil=profile.patrones)
+            except (OSError, ValueError) as e:
+                logging.error(f"Update de {target_user} hacia {temp_dest} fallido: {e}")
+                print(f"No se pudo actualizar '{temp_dest}': {e}")
+                return
+            parcial = f", {len(archivos)} de {len(head['archivos'])} archivos según el perfil" if profile else ""
+            print(f"Update realizado desde '{head['version']}' hacia '{temp_dest}' "
+                  f"({escritos} archivos actualizados, {eliminados} eliminados{parcial}).")
+            return True
+
         if not os.path.exists(perm_path):
             print("No hay carpeta permanente para copiar.")
             return
@@ -92,9 +257,39 @@ class VersionControl:
         if os.path.exists(temp_dest):
             shutil.rmtree(temp_dest)
         shutil.copytree(perm_path, temp_dest)
+        self._mark_complete(target_user, temp_dest)
 
         print(f"Update realizado desde '{perm_path}' hacia '{temp_dest}'.")
+        return True
+
+    @metrics.timed("version_control")
+    def sparse(self, patrones=None, limpiar=False):
+        # Perfil de rutas del usuario actual en el repositorio destino. Sin
+        # argumentos solo lo muestra.
+        ctx = self.ctx.get_context()
+        if not ctx:
+            print("No hay contexto activo.")
+            return None
+
+        repo_path = os.path.join(self.base_repo, ctx["usuario_destino"])
+        if limpiar:
+            save_profile(repo_path, ctx["usuario_actual"], SparseProfile())
+            print("Perfil de rutas eliminado: el próximo update traerá todos los archivos.")
+            return []
+        if patrones:
+            profile = SparseProfile(patrones)
+            save_profile(repo_path, ctx["usuario_actual"], profile)
+            print("Perfil de rutas guardado. Ejecute update para aplicarlo.")
+        else:
+            profile = load_profile(repo_path, ctx["usuario_actual"])
+
+        if not profile:
+            print("Sin perfil de rutas: se trabaja con todos los archivos.")
+        for patron in profile.patrones:
+            print(f"- {patron}")
+        return profile.patrones
 
+    @metrics.timed("version_control")
     def list_versions(self):
         ctx = self.ctx.get_context()
         if not ctx:
@@ -102,13 +297,12 @@ class VersionControl:
             return []
 
         usuario_destino = ctx["usuario_destino"]
-        version_dir = os.path.join(self.base_repo, usuario_destino, "versiones")
+        versions = self._version_names(usuario_destino)
 
-        if not os.path.exists(version_dir):
+        if versions is None:
             print("No hay versiones.")
             return []
 
-        versions = sorted(os.listdir(version_dir))
         if not versions:
             print("No hay versiones registradas.")
             return []
@@ -117,7 +311,38 @@ class VersionControl:
         for i, v in enumerate(versions, 1):
             print(f"{i}. {v}")
         return versions
+
+    def _print_entries(self, entradas):
+        if not entradas:
+            print("No hay versiones en ese rango.")
+            return []
+        print("\n--- Versiones ---")
+        for i, e in enumerate(entradas, 1):
+            autor = e["autor"] or "-"
+            print(f"{i}. {e['version']}  {e['fecha'] or '-'}  {autor}  {e['archivos']} archivos, {e['bytes']} bytes")
+        return [e["version"] for e in entradas]
+
+    @metrics.timed("version_control")
+    def latest_versions(self, n):
+        ctx = self.ctx.get_context()
+        if not ctx:
+            print("No hay contexto activo.")
+            return []
+        return self._print_entries(self._log(ctx["usuario_destino"]).latest(n))
+
+    @metrics.timed("version_control")
+    def versions_between(self, desde=None, hasta=None):
+        # desde / hasta: fechas ISO ("2025-05-01" o "2025-05-01T12:00:00")
+        ctx = self.ctx.get_context()
+        if not ctx:
+            print("No hay contexto activo.")
+            return []
+        if hasta and len(hasta) == 10:
+            # Una fecha sin hora incluye el día completo
+            hasta = hasta + "T23:59:59"
+        return self._print_entries(self._log(ctx["usuario_destino"]).between(desde, hasta))
     
+    @metrics.timed("version_control")
     def list_files_in_version(self, version_name):
         ctx = self.ctx.get_context()
         if not ctx:
@@ -125,6 +350,13 @@ class VersionControl:
             return []
 
         usuario_destino = ctx["usuario_destino"]
+        manifest = self._load_manifest(usuario_destino, version_name)
+        if manifest is not None:
+            return sorted(manifest["archivos"])
+
+        if not self._log(usuario_destino).has(version_name):
+            print("La versión no existe.")
+            return []
         version_dir = os.path.join(self.base_repo, usuario_destino, "versiones", version_name)
 
         if not os.path.exists(version_dir):
@@ -140,7 +372,254 @@ class VersionControl:
         return files
 
 
-    def recover(self, version_name, file_name=None, is_file=False):
+    @metrics.timed("version_control")
+    def diff(self, version_a, version_b=None, ruta=None, contenido=True):
+        # Compara dos versiones, o una versión con la carpeta temporal si
+        # version_b es None. ruta limita la comparación a un archivo o carpeta.
+        ctx = self.ctx.get_context()
+        if not ctx:
+            print("No hay contexto activo.")
+            return None
+
+        usuario_destino = ctx["usuario_destino"]
+        temp_path = ctx["path"]
+        store = self._store(usuario_destino)
+
+        antes = self._load_manifest(usuario_destino, version_a)
+        if antes is None:
+            print(f"La versión '{version_a}' no existe o no tiene manifiesto.")
+            return None
+
+        if version_b is not None:
+            despues = self._load_manifest(usuario_destino, version_b)
+            if despues is None:
+                print(f"La versión '{version_b}' no existe o no tiene manifiesto.")
+                return None
+            archivos_b = despues["archivos"]
+            dirs_b = despues.get("directorios")
+            abrir_b = lambda rel: store.open(archivos_b[rel]["hash"])
+            nombre_b = version_b
+        else:
+            if not os.path.exists(temp_path):
+                print(f"No se encontró la carpeta temporal de trabajo: {temp_path}")
+                return None
+            head = self._head_manifest(usuario_destino)
+            archivos_b, index = self._work_tree(ctx["usuario_actual"], usuario_destino, temp_path, head)
+            index.save()
+            dirs_b = None
+            abrir_b = lambda rel: open(from_rel(temp_path, rel), "rb")
+            nombre_b = "temporal"
+
+        archivos_a = antes["archivos"]
+        if ruta:
+            prefijo = ruta.replace(os.sep, "/").strip("/")
+            dentro = lambda rel: rel == prefijo or rel.startswith(prefijo + "/")
+            archivos_a = {rel: e for rel, e in archivos_a.items() if dentro(rel)}
+            archivos_b = {rel: e for rel, e in archivos_b.items() if dentro(rel)}
+            dirs_a = dirs_b = None
+        else:
+            dirs_a = antes.get("directorios")
+
+        cambios = diff_trees(archivos_a, archivos_b, dirs_a, dirs_b)
+        if not any(cambios.values()):
+            print(f"No hay diferencias entre '{version_a}' y '{nombre_b}'.")
+            return cambios
+
+        etiquetas = (("nuevos", "Nuevo"), ("modificados", "Modificado"), ("eliminados", "Eliminado"))
+        for clave, etiqueta in etiquetas:
+            for rel in cambios[clave]:
+                print(f"{etiqueta}: {rel}")
+
+        if contenido:
+            # Los archivos se abren en lugar de leerse: diff_files mira el
+            # comienzo y no carga binarios ni archivos demasiado grandes.
+            abrir_a = lambda rel: store.open(archivos_a[rel]["hash"])
+            for rel in sorted(cambios["nuevos"] + cambios["modificados"] + cambios["eliminados"]):
+                lado_a = (lambda rel=rel: abrir_a(rel)) if rel in archivos_a else None
+                lado_b = (lambda rel=rel: abrir_b(rel)) if rel in archivos_b else None
+                nombre_a = f"{version_a}/{rel}" if rel in archivos_a else "/dev/null"
+                nombre_final = f"{nombre_b}/{rel}" if rel in archivos_b else "/dev/null"
+                for linea in diff_files(lado_a, lado_b, nombre_a, nombre_final):
+                    print(linea, end="")
+        return cambios
+
+    @metrics.timed("version_control")
+    def search(self, texto, alcance="todas", ignorar_mayusculas=False):
+        # alcance: "todas" (todo el historial), "ultima" o "temporal" (carpeta
+        # de trabajo). Devuelve una lista de {ruta, linea, texto, versiones}.
+        ctx = self.ctx.get_context()
+        if not ctx:
+            print("No hay contexto activo.")
+            return None
+        if not texto:
+            print("Debe indicar un texto a buscar.")
+            return None
+
+        usuario_destino = ctx["usuario_destino"]
+        # El índice (y sqlite3) solo se carga al buscar
+        from core.search_index import SearchIndex, matching_lines
+
+        store = self._store(usuario_destino)
+        index = SearchIndex(store, os.path.join(self.base_repo, usuario_destino))
+        index.update()
+
+        if alcance == "temporal":
+            temp_path = ctx["path"]
+            if not os.path.exists(temp_path):
+                print(f"No se encontró la carpeta temporal de trabajo: {temp_path}")
+                return None
+            work = WorkIndex(os.path.join(self.base_repo, usuario_destino), temp_path)
+            archivos, _ = work.refresh(self.workers)
+            work.save()
+            # El contenido nuevo de la carpeta de trabajo se indexa también por hash
+            por_hash = {}
+            for rel, entry in archivos.items():
+                por_hash.setdefault(entry["hash"], rel)
+            faltan = index.missing(por_hash)
+            index.add_files({h: from_rel(temp_path, por_hash[h]) for h in faltan})
+            candidatos = index.candidates(texto)
+            ocurrencias = [(e["hash"], rel, ["temporal"]) for rel, e in archivos.items() if e["hash"] in candidatos]
+            abrir = lambda digest: open(from_rel(temp_path, por_hash[digest]), "rb")
+        else:
+            candidatos = index.candidates(texto)
+            ocurrencias = index.occurrences(candidatos, solo_ultima=(alcance == "ultima"))
+            abrir = store.open
+
+        # Cada contenido distinto se lee y se revisa una sola vez
+        hashes = sorted({digest for digest, _, _ in ocurrencias})
+
+        def revisar(digest):
+            # Por bloques: los archivos grandes (no indexados) no se cargan enteros
+            try:
+                with abrir(digest) as f:
+                    return matching_lines(f, texto, ignorar_mayusculas)
+            except FileNotFoundError:
+                return []
+
+        lineas = dict(zip(hashes, parallel_map(revisar, hashes, self.workers)))
+        resultados = []
+        for digest, ruta, versiones in sorted(ocurrencias, key=lambda o: o[1]):
+            for numero, linea in lineas[digest]:
+                resultados.append({"ruta": ruta, "linea": numero, "texto": linea, "versiones": versiones})
+
+        if not resultados:
+            print(f"No se encontró '{texto}'.")
+        for r in resultados:
+            versiones = r["versiones"]
+            donde = versiones[0] if len(versiones) == 1 else f"{versiones[0]} .. {versiones[-1]} ({len(versiones)} versiones)"
+            print(f"{r['ruta']}:{r['linea']}: {r['texto'].strip()}  [{donde}]")
+        return resultados
+
+    def _readable_tree(self):
+        # Vista de solo lectura de las versiones del repositorio destino
+        ctx = self.ctx.get_context()
+        if not ctx:
+            print("No hay contexto activo.")
+            return None
+        usuario_destino = ctx["usuario_destino"]
+        if not self.um.has_read_permission(ctx["usuario_actual"], usuario_destino):
+            print(f"No tienes permisos de lectura sobre el usuario '{usuario_destino}'.")
+            return None
+        if usuario_destino not in self._trees:
+            from core.version_tree import VersionTree
+
+            repo_path = os.path.join(self.base_repo, usuario_destino)
+            self._trees[usuario_destino] = VersionTree(self._store(usuario_destino), repo_path)
+        return self._trees[usuario_destino]
+
+    @metrics.timed("version_control")
+    def stat_file(self, version_name, ruta=""):
+        tree = self._readable_tree()
+        if tree is None:
+            return None
+        info = tree.stat(version_name, ruta)
+        if info is None:
+            print(f"'{ruta}' no existe en la versión '{version_name}'.")
+        return info
+
+    def open_file(self, version_name, ruta):
+        # Archivo binario de solo lectura de la versión, sin pasar por temporal
+        tree = self._readable_tree()
+        if tree is None:
+            return None
+        try:
+            return tree.open(version_name, ruta)
+        except FileNotFoundError:
+            print(f"'{ruta}' no existe en la versión '{version_name}'.")
+            return None
+
+    @metrics.timed("version_control")
+    def read_file(self, version_name, ruta, offset=0, size=-1):
+        tree = self._readable_tree()
+        if tree is None:
+            return None
+        try:
+            return tree.read(version_name, ruta, offset, size)
+        except FileNotFoundError:
+            print(f"'{ruta}' no existe en la versión '{version_name}'.")
+            return None
+
+    @metrics.timed("version_control")
+    def show(self, version_name, ruta="", salida=None):
+        # Muestra un archivo de una versión (o lo copia a salida) o lista una
+        # carpeta. El archivo se lee por bloques, sin recuperar la versión.
+        tree = self._readable_tree()
+        if tree is None:
+            return None
+        info = tree.stat(version_name, ruta)
+        if info is None:
+            print(f"'{ruta}' no existe en la versión '{version_name}'.")
+            return None
+
+        if info["tipo"] == "directorio":
+            hijos = tree.listdir(version_name, ruta)
+            for nombre, tipo in hijos:
+                print(nombre + "/" if tipo == "directorio" else nombre)
+            return hijos
+
+        with tree.open(version_name, ruta) as f:
+            if salida:
+                with open(salida, "wb") as destino:
+                    while True:
+                        bloque = f.read(CHUNK_SIZE)
+                        if not bloque:
+                            break
+                        destino.write(bloque)
+                print(f"'{ruta}' de '{version_name}' guardado en {salida} ({info['size']} bytes).")
+                return info
+            inicio = f.read(BINARY_SNIFF)
+            if is_binary(inicio):
+                print(f"Archivo binario ({info['size']} bytes). Use --salida para guardarlo.")
+                return info
+            print(inicio.decode("utf-8", errors="replace"), end="")
+            while True:
+                bloque = f.read(CHUNK_SIZE)
+                if not bloque:
+                    break
+                print(bloque.decode("utf-8", errors="replace"), end="")
+        metrics.add_bytes("version_tree", leidos=info["size"])
+        return info
+
+    def mount(self, punto):
+        # Monta las versiones del repositorio destino como carpetas de solo
+        # lectura (requiere fusepy). Bloquea hasta que se desmonta.
+        tree = self._readable_tree()
+        if tree is None:
+            return None
+        if not os.path.isdir(punto):
+            print(f"El punto de montaje no existe: {punto}")
+            return None
+        from core.version_tree import mount
+
+        try:
+            mount(tree, punto)
+        except RuntimeError as e:
+            print(e)
+            return None
+        return True
+
+    @metrics.timed("version_control")
+    def recover(self, version_name, file_name=None, is_file=False, patrones=None):
         ctx = self.ctx.get_context()
         if not ctx:
             print("No hay contexto activo.")
@@ -149,21 +628,244 @@ class VersionControl:
         usuario_destino = ctx["usuario_destino"]
         temp_path = ctx["path"] 
 
+        if not self._log(usuario_destino).has(version_name):
+            print("Versión no encontrada.")
+            return
+        manifest = self._load_manifest(usuario_destino, version_name)
+        if manifest is not None:
+            return self._recover_from_manifest(usuario_destino, manifest, temp_path, file_name, is_file, patrones)
+
         version_dir = os.path.join(self.base_repo, usuario_destino, "versiones", version_name)
         if not os.path.exists(version_dir):
             print("Versión no encontrada.")
             return
 
+        if patrones:
+            profile = SparseProfile(patrones)
+            recuperados = 0
+            for root, _, filenames in os.walk(version_dir):
+                for name in filenames:
+                    source = os.path.join(root, name)
+                    rel = os.path.relpath(source, version_dir).replace(os.sep, "/")
+                    if profile.matches(rel):
+                        dest = from_rel(temp_path, rel)
+                        os.makedirs(os.path.dirname(dest), exist_ok=True)
+                        shutil.copy2(source, dest)
+                        recuperados += 1
+            print(f"{recuperados} archivos de '{version_name}' recuperados en temporal.")
+            return True
+
         if is_file and file_name:
             source = os.path.join(version_dir, file_name)
             dest = os.path.join(temp_path, file_name)
-            if not os.path.exists(source):
+            dentro = os.path.abspath(version_dir) + os.sep
+            if not os.path.abspath(source).startswith(dentro) or not os.path.exists(source):
                 print("Archivo no existe en la versión.")
                 return
             os.makedirs(os.path.dirname(dest), exist_ok=True)
             shutil.copy2(source, dest)
             print(f"Archivo '{file_name}' recuperado en temporal.")
+            return True
         else:
             shutil.rmtree(temp_path, ignore_errors=True)
             shutil.copytree(version_dir, temp_path)
+            self._mark_complete(usuario_destino, temp_path)
             print(f"Versión '{version_name}' restaurada completamente en temporal.")
+            return True
+
+    def _recover_from_manifest(self, usuario_destino, manifest, temp_path, file_name, is_file, patrones=None):
+        # Un objeto faltante o dañado en el almacén se informa, sin traceback
+        try:
+            return self._materialize_version(usuario_destino, manifest, temp_path, file_name, is_file, patrones)
+        except (OSError, ValueError) as e:
+            logging.error(f"Recuperación de {manifest['version']} de {usuario_destino} fallida: {e}")
+            print(f"No se pudo recuperar '{manifest['version']}': {e}")
+            return None
+
+    def _materialize_version(self, usuario_destino, manifest, temp_path, file_name, is_file, patrones=None):
+        archivos = manifest["archivos"]
+        version_name = manifest["version"]
+
+        if patrones:
+            # Las rutas elegidas quedan como en la versión; el resto no se toca
+            profile = SparseProfile(patrones)
+            elegidos = profile.filter(archivos)
+            escritos, eliminados = self._checkout(usuario_destino, elegidos, temp_path, alcance=profile.matches)
+            print(f"{len(elegidos)} archivos de '{version_name}' recuperados en temporal "
+                  f"({escritos} escritos, {eliminados} eliminados).")
+            return True
+
+        if is_file and file_name:
+            entry = archivos.get(file_name.replace(os.sep, "/"))
+            if entry is None:
+                print("Archivo no existe en la versión.")
+                return
+            materializer = Materializer(self._store(usuario_destino), self.materialize_mode, self.workers)
+            materializer.place(entry["hash"], from_rel(temp_path, file_name))
+            print(f"Archivo '{file_name}' recuperado en temporal.")
+            return True
+        else:
+            self._checkout(usuario_destino, archivos, temp_path, perfil=[])
+            print(f"Versión '{version_name}' restaurada completamente en temporal.")
+            return True
+
+    def _convert_legacy_version(self, usuario, version_name):
+        # Pasa una versión guardada como copia completa a blobs + manifiesto
+        version_dir = os.path.join(self.base_repo, usuario, "versiones", version_name)
+        store = self._store(usuario)
+        archivos = {}
+        for root, _, filenames in os.walk(version_dir):
+            for name in filenames:
+                full = os.path.join(root, name)
+                rel = os.path.relpath(full, version_dir).replace(os.sep, "/")
+                archivos[rel] = {"hash": store.store_file(full), "size": os.path.getsize(full)}
+
+        try:
+            fecha = datetime.datetime.strptime(version_name[2:16], "%Y%m%d%H%M%S").isoformat()
+        except ValueError:
+            fecha = None
+        manifest = {
+            "version": version_name,
+            "autor": None,
+            "fecha": fecha,
+            "archivos": archivos,
+            "directorios": tree_hashes(archivos),
+        }
+        write_manifest(self._manifest_path(usuario, version_name), manifest)
+        shutil.rmtree(version_dir)
+        logging.info(f"Versión antigua {version_name} de {usuario} convertida a manifiesto.")
+
+    def _pack_repository(self, usuario, keep_recent):
+        antiguas = [name for name in self._version_names(usuario) or [] if self._load_manifest(usuario, name) is None]
+        for name in antiguas:
+            self._convert_legacy_version(usuario, name)
+        if antiguas:
+            # Las entradas convertidas ahora apuntan a su manifiesto
+            self._log(usuario).rebuild()
+        manifests = [self._load_manifest(usuario, name) for name in self._version_names(usuario) or []]
+        empaquetados = pack_objects(self._store(usuario), manifests, keep_recent)
+        logging.info(f"Pack de {usuario}: {empaquetados} objetos empaquetados.")
+        return empaquetados
+
+    @metrics.timed("version_control")
+    def pack(self, keep_recent=1, background=False):
+        ctx = self.ctx.get_context()
+        if not ctx:
+            print("No hay contexto activo.")
+            return None
+
+        usuario_actual = ctx["usuario_actual"]
+        usuario_destino = ctx["usuario_destino"]
+        if not self.um.has_write_permission(usuario_actual, usuario_destino):
+            print(f"No tienes permisos de escritura sobre el usuario '{usuario_destino}'.")
+            return None
+
+        if background:
+            hilo = threading.Thread(
+                target=self._pack_repository,
+                args=(usuario_destino, keep_recent),
+                name=f"pack-{usuario_destino}",
+            )
+            hilo.start()
+            print(f"Empaquetando el historial de {usuario_destino} en segundo plano.")
+            return hilo
+
+        empaquetados = self._pack_repository(usuario_destino, keep_recent)
+        print(f"Historial de {usuario_destino} empaquetado: {empaquetados} objetos.")
+        return empaquetados
+
+
+    @metrics.timed("version_control")
+    def prune(self, policy=None, simular=False, guardar=False, recolectar=True):
+        # Elimina las versiones que la política no conserva y, después, los
+        # objetos que ya no usa ninguna versión. Sin política se usa la guardada
+        # en repo_root/<usuario>/retencion.json.
+        ctx = self.ctx.get_context()
+        if not ctx:
+            print("No hay contexto activo.")
+            return None
+
+        usuario_actual = ctx["usuario_actual"]
+        usuario_destino = ctx["usuario_destino"]
+        if not self.um.has_write_permission(usuario_actual, usuario_destino):
+            print(f"No tienes permisos de escritura sobre el usuario '{usuario_destino}'.")
+            return None
+
+        repo_path = os.path.join(self.base_repo, usuario_destino)
+        if policy is None:
+            policy = load_policy(repo_path)
+        elif guardar:
+            save_policy(repo_path, policy)
+        if policy.is_empty():
+            print("No hay política de retención definida.")
+            return []
+
+        log = self._log(usuario_destino)
+        entradas = log.entries()
+        manifiestos = {}
+
+        def archivos_de(nombre):
+            if nombre not in manifiestos:
+                manifest = self._load_manifest(usuario_destino, nombre)
+                manifiestos[nombre] = manifest["archivos"] if manifest else None
+            return manifiestos[nombre]
+
+        eliminar = policy.select(entradas, archivos_de=archivos_de)
+        if simular:
+            for nombre in eliminar:
+                print(f"Se eliminaría: {nombre}")
+            print(f"{len(eliminar)} de {len(entradas)} versiones se eliminarían.")
+            return eliminar
+
+        # Primero el registro: ninguna lectura vuelve a ver las versiones
+        # eliminadas, aunque el borrado de sus archivos se interrumpa.
+        descartadas = set(eliminar)
+        log.rewrite([e for e in entradas if e["version"] not in descartadas])
+        for nombre in eliminar:
+            manifest_path = self._manifest_path(usuario_destino, nombre)
+            if os.path.exists(manifest_path):
+                os.remove(manifest_path)
+            else:
+                shutil.rmtree(os.path.join(repo_path, "versiones", nombre), ignore_errors=True)
+        logging.info(f"Poda de {usuario_destino}: {len(eliminar)} versiones eliminadas.")
+        print(f"{len(eliminar)} versiones eliminadas de {usuario_destino}.")
+
+        if recolectar and eliminar:
+            self._collect(usuario_destino)
+        return eliminar
+
+    def _collect(self, usuario, presupuesto=None, max_unidades=None):
+        from core.garbage import GarbageCollector
+
+        collector = GarbageCollector(self._store(usuario), os.path.join(self.base_repo, usuario))
+        resultado = collector.run(presupuesto, max_unidades)
+        estado = "completa" if resultado["completo"] else "parcial (continúa en la próxima ejecución)"
+        print(f"Recolección {estado}: {resultado['objetos']} objetos y {resultado['manifiestos']} "
+              f"manifiestos eliminados, {resultado['bytes']} bytes liberados.")
+        return resultado
+
+    @metrics.timed("version_control")
+    def gc(self, presupuesto=None, max_unidades=None, background=False):
+        # presupuesto: segundos como máximo por llamada; la pasada sigue donde
+        # quedó en la siguiente llamada.
+        ctx = self.ctx.get_context()
+        if not ctx:
+            print("No hay contexto activo.")
+            return None
+
+        usuario_actual = ctx["usuario_actual"]
+        usuario_destino = ctx["usuario_destino"]
+        if not self.um.has_write_permission(usuario_actual, usuario_destino):
+            print(f"No tienes permisos de escritura sobre el usuario '{usuario_destino}'.")
+            return None
+
+        if background:
+            hilo = threading.Thread(
+                target=self._collect,
+                args=(usuario_destino, presupuesto, max_unidades),
+                name=f"gc-{usuario_destino}",
+            )
+            hilo.start()
+            print(f"Recolectando objetos de {usuario_destino} en segundo plano.")
+            return hilo
+        return self._collect(usuario_destino, presupuesto, max_unidades)
@@ -0,0 +1,194 @@
+import os
+import json
+import bisect
+import logging
+import threading
+from core.object_store import read_manifest
+from utils.atomic_io import atomic_write
+from utils import metrics
+
+LOG_FILE = "historial.jsonl"
+
+# Registro por repositorio en memoria; solo se leen los bytes añadidos desde
+# la última lectura (el archivo es de solo anexado).
+_logs = {}
+_logs_lock = threading.Lock()
+
+
+class VersionLog:
+    def __init__(self, repo_path):
+        self.repo_path = repo_path
+        self.path = os.path.join(repo_path, LOG_FILE)
+        self.version_dir = os.path.join(repo_path, "versiones")
+
+    def _state(self):
+        with _logs_lock:
+            estado = _logs.setdefault(self.path, {"ino": None, "offset": 0, "entradas": [], "por_nombre": {}})
+            if not os.path.exists(self.path):
+                if os.path.isdir(self.version_dir) and os.listdir(self.version_dir):
+                    self._rebuild_locked(estado)
+                else:
+                    estado.update(ino=None, offset=0, entradas=[], por_nombre={})
+                return estado
+
+            st = os.stat(self.path)
+            if st.st_ino != estado["ino"] or st.st_size < estado["offset"]:
+                # El registro fue reescrito (poda o reconstrucción): se relee entero
+                estado.update(ino=st.st_ino, offset=0, entradas=[], por_nombre={})
+            if st.st_size > estado["offset"]:
+                metrics.cache("historial", fallos=1)
+                self._read_tail(estado)
+            else:
+                metrics.cache("historial", aciertos=1)
+            return estado
+
+    def _read_tail(self, estado):
+        with open(self.path, "rb") as f:
+            f.seek(estado["offset"])
+            data = f.read()
+        # Una línea sin "\n" final es una escritura a medias: se ignora por ahora
+        completo = data[:data.rfind(b"\n") + 1]
+        for linea in completo.splitlines():
+            if not linea.strip():
+                continue
+            entrada = json.loads(linea)
+            estado["por_nombre"][entrada["version"]] = len(estado["entradas"])
+            estado["entradas"].append(entrada)
+        estado["offset"] += len(completo)
+
+    def _rebuild_locked(self, estado):
+        # Reconstruye el registro a partir de la carpeta versiones (repos antiguos)
+        nombres = set()
+        for entry in os.listdir(self.version_dir):
+            if entry.startswith("v_") and entry.endswith(".json"):
+                nombres.add(entry[:-len(".json")])
+            elif entry.startswith("v_") and os.path.isdir(os.path.join(self.version_dir, entry)):
+                nombres.add(entry)
+
+        entradas = []
+        for nombre in nombres:
+            manifest_path = os.path.join(self.version_dir, nombre + ".json")
+            if os.path.exists(manifest_path):
+                manifest = read_manifest(manifest_path)
+                entradas.append(make_entry(manifest))
+            else:
+                entradas.append(_legacy_entry(os.path.join(self.version_dir, nombre), nombre))
+        entradas.sort(key=entry_order)
+        self._write_all(entradas)
+        st = os.stat(self.path)
+        estado.update(
+            ino=st.st_ino,
+            offset=st.st_size,
+            entradas=entradas,
+            por_nombre={e["version"]: i for i, e in enumerate(entradas)},
+        )
+        logging.info(f"Registro de versiones reconstruido: {self.path} ({len(entradas)} versiones)")
+
+    def _write_all(self, entradas):
+        os.makedirs(self.repo_path, exist_ok=True)
+        data = "".join(json.dumps(entrada, sort_keys=True) + "\n" for entrada in entradas)
+        atomic_write(self.path, data.encode("utf-8"), journal=False)
+
+    def rebuild(self):
+        with _logs_lock:
+            estado = _logs.setdefault(self.path, {})
+            self._rebuild_locked(estado)
+
+    def rewrite(self, entradas):
+        with _logs_lock:
+            self._write_all(entradas)
+            _logs.pop(self.path, None)
+
+    def append(self, manifest):
+        estado = self._state()
+        if manifest["version"] in estado["por_nombre"]:
+            # Ya incluida al reconstruir el registro desde la carpeta versiones
+            return self.get(manifest["version"])
+        entrada = make_entry(manifest)
+        with _logs_lock:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entrada, sort_keys=True) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        return entrada
+
+    def entries(self):
+        return list(self._state()["entradas"])
+
+    def names(self):
+        return [e["version"] for e in self._state()["entradas"]]
+
+    def has(self, version_name):
+        # Solo los nombres registrados; se comprueba antes de armar cualquier ruta
+        return valid_name(version_name) and version_name in self._state()["por_nombre"]
+
+    def get(self, version_name):
+        estado = self._state()
+        i = estado["por_nombre"].get(version_name)
+        return estado["entradas"][i] if i is not None else None
+
+    def latest(self, n):
+        entradas = self._state()["entradas"]
+        return entradas[-n:] if n > 0 else []
+
+    def head(self):
+        entradas = self._state()["entradas"]
+        return entradas[-1] if entradas else None
+
+    def between(self, desde=None, hasta=None):
+        # Las fechas ISO se ordenan como texto y el registro está en orden cronológico
+        entradas = self._state()["entradas"]
+        fecha = lambda e: e["fecha"] or ""
+        inicio = bisect.bisect_left(entradas, desde, key=fecha) if desde else 0
+        fin = bisect.bisect_right(entradas, hasta, key=fecha) if hasta else len(entradas)
+        return entradas[inicio:fin]
+
+
+def valid_name(nombre):
+    # Un nombre de versión es un nombre de archivo: sin separadores ni ".."
+    return (isinstance(nombre, str) and bool(nombre) and ".." not in nombre
+            and "/" not in nombre and "\\" not in nombre)
+
+
+def version_order(nombre):
+    # v_<aaaammddhhmmss>[_n]: los commits del mismo segundo llevan un sufijo
+    # numérico y deben quedar en orden numérico (_2 antes que _10).
+    marca, _, sufijo = nombre[2:].partition("_")
+    return marca, int(sufijo) if sufijo.isdigit() else 0
+
+
+def entry_order(entrada):
+    return entrada["fecha"] or "", version_order(entrada["version"])
+
+
+def make_entry(manifest):
+    archivos = manifest["archivos"]
+    return {
+        "version": manifest["version"],
+        "autor": manifest.get("autor"),
+        "fecha": manifest.get("fecha"),
+        "archivos": len(archivos),
+        "bytes": sum(e["size"] for e in archivos.values()),
+        "manifiesto": f"versiones/{manifest['version']}.json",
+    }
+
+
+def _legacy_entry(version_dir, nombre):
+    total = 0
+    cantidad = 0
+    for root, _, filenames in os.walk(version_dir):
+        for name in filenames:
+            total += os.path.getsize(os.path.join(root, name))
+            cantidad += 1
+    fecha = None
+    if len(nombre) >= 16 and nombre[2:16].isdigit():
+        n = nombre[2:16]
+        fecha = f"{n[0:4]}-{n[4:6]}-{n[6:8]}T{n[8:10]}:{n[10:12]}:{n[12:14]}"
+    return {
+        "version": nombre,
+        "autor": None,
+        "fecha": fecha,
+        "archivos": cantidad,
+        "bytes": total,
+        "manifiesto": None,
+    }
@@ -0,0 +1,201 @@
+import os
+import stat
+import errno
+import logging
+import datetime
+import threading
+from collections import OrderedDict
+from core.object_store import from_rel, read_manifest
+from core.version_log import VersionLog
+from utils import metrics
+
+# Manifiestos (y su lista de carpetas) que se mantienen en memoria por vista
+MAX_CACHED_VERSIONS = 32
+
+
+def _normalize(ruta):
+    return (ruta or "").replace(os.sep, "/").strip("/")
+
+
+class VersionTree:
+    # Vista de solo lectura de todas las versiones de un repositorio, leída
+    # directamente del almacén de objetos: "<versión>/<ruta>". No materializa
+    # nada; abrir un archivo cuesta solo los bytes que se leen.
+    def __init__(self, store, repo_path):
+        self.store = store
+        self.repo_path = repo_path
+        self.log = VersionLog(repo_path)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def versions(self):
+        return self.log.names()
+
+    def _load(self, version):
+        # (archivos, carpetas, fecha) de la versión, o None si no existe.
+        # carpetas: ruta -> {nombre: "archivo" | "directorio"}
+        with self._lock:
+            if version in self._cache:
+                self._cache.move_to_end(version)
+                vista = self._cache[version]
+            else:
+                vista = None
+        if vista is not None:
+            metrics.cache("vista_versiones", aciertos=1)
+            return vista
+
+        if not self.log.has(version):
+            return None
+        path = os.path.join(self.repo_path, "versiones", version + ".json")
+        legacy_dir = os.path.join(self.repo_path, "versiones", version)
+        if os.path.exists(path):
+            manifest = read_manifest(path)
+            archivos = manifest["archivos"]
+            fecha = manifest.get("fecha")
+        elif os.path.isdir(legacy_dir):
+            # Versión antigua guardada como copia completa: se lee del disco
+            archivos = {}
+            for root, _, filenames in os.walk(legacy_dir):
+                for name in filenames:
+                    full = os.path.join(root, name)
+                    rel = os.path.relpath(full, legacy_dir).replace(os.sep, "/")
+                    archivos[rel] = {"hash": None, "size": os.path.getsize(full)}
+            fecha = None
+        else:
+            return None
+
+        carpetas = {"": {}}
+        for rel in archivos:
+            parent, _, name = rel.rpartition("/")
+            carpetas.setdefault(parent, {})[name] = "archivo"
+            while parent:
+                abuelo, _, nombre = parent.rpartition("/")
+                hijos = carpetas.setdefault(abuelo, {})
+                if nombre in hijos:
+                    break
+                hijos[nombre] = "directorio"
+                parent = abuelo
+        try:
+            mtime = datetime.datetime.fromisoformat(fecha).timestamp() if fecha else None
+        except ValueError:
+            mtime = None
+
+        vista = (archivos, carpetas, mtime)
+        with self._lock:
+            self._cache[version] = vista
+            while len(self._cache) > MAX_CACHED_VERSIONS:
+                self._cache.popitem(last=False)
+        metrics.cache("vista_versiones", fallos=1)
+        return vista
+
+    def stat(self, version, ruta=""):
+        # {"tipo": "archivo" | "directorio", "size", "hash", "fecha"} o None
+        vista = self._load(version)
+        if vista is None:
+            return None
+        archivos, carpetas, mtime = vista
+        rel = _normalize(ruta)
+        if rel in archivos:
+            entry = archivos[rel]
+            return {"tipo": "archivo", "size": entry["size"], "hash": entry["hash"], "fecha": mtime}
+        if rel in carpetas:
+            return {"tipo": "directorio", "size": len(carpetas[rel]), "hash": None, "fecha": mtime}
+        return None
+
+    def listdir(self, version, ruta=""):
+        # [(nombre, tipo)] de una carpeta de la versión, o None
+        vista = self._load(version)
+        if vista is None:
+            return None
+        hijos = vista[1].get(_normalize(ruta))
+        return None if hijos is None else sorted(hijos.items())
+
+    def open(self, version, ruta):
+        # Archivo binario de solo lectura. Los objetos sueltos y los fragmentados
+        # se leen del disco a medida que se piden; los empaquetados se
+        # reconstruyen en memoria.
+        vista = self._load(version)
+        rel = _normalize(ruta)
+        if vista is None or rel not in vista[0]:
+            raise FileNotFoundError(f"'{rel}' no existe en la versión '{version}'")
+        digest = vista[0][rel]["hash"]
+        if digest is None:
+            return open(from_rel(os.path.join(self.repo_path, "versiones", version), rel), "rb")
+        return self.store.open(digest)
+
+    def read(self, version, ruta, offset=0, size=-1):
+        with self.open(version, ruta) as f:
+            if offset:
+                f.seek(offset)
+            data = f.read(size)
+        metrics.add_bytes("version_tree", leidos=len(data))
+        return data
+
+    def split(self, path):
+        # "v_x/docs/a.txt" -> ("v_x", "docs/a.txt"); la raíz es (None, "")
+        version, _, rel = _normalize(path).partition("/")
+        return (version or None), rel
+
+
+def mount(tree, punto, foreground=True):
+    # Monta la vista con FUSE: <punto>/<versión>/<ruta>. Requiere fusepy.
+    try:
+        from fuse import FUSE, FuseOSError, Operations
+    except ImportError:
+        raise RuntimeError("Montar las versiones requiere el paquete fusepy (pip install fusepy).")
+
+    class _Operations(Operations):
+        def __init__(self):
+            self.abiertos = {}
+            self.siguiente = 0
+            self.lock = threading.Lock()
+
+        def getattr(self, path, fh=None):
+            version, rel = tree.split(path)
+            if version is None:
+                return {"st_mode": stat.S_IFDIR | 0o555, "st_nlink": 2}
+            info = tree.stat(version, rel)
+            if info is None:
+                raise FuseOSError(errno.ENOENT)
+            fecha = info["fecha"] or 0
+            if info["tipo"] == "directorio":
+                return {"st_mode": stat.S_IFDIR | 0o555, "st_nlink": 2, "st_mtime": fecha}
+            return {"st_mode": stat.S_IFREG | 0o444, "st_nlink": 1, "st_size": info["size"], "st_mtime": fecha}
+
+        def readdir(self, path, fh):
+            version, rel = tree.split(path)
+            if version is None:
+                return [".", ".."] + tree.versions()
+            hijos = tree.listdir(version, rel)
+            if hijos is None:
+                raise FuseOSError(errno.ENOENT)
+            return [".", ".."] + [nombre for nombre, _ in hijos]
+
+        def open(self, path, flags):
+            if flags & (os.O_WRONLY | os.O_RDWR):
+                raise FuseOSError(errno.EROFS)
+            version, rel = tree.split(path)
+            try:
+                f = tree.open(version, rel)
+            except FileNotFoundError:
+                raise FuseOSError(errno.ENOENT)
+            with self.lock:
+                self.siguiente += 1
+                self.abiertos[self.siguiente] = (f, threading.Lock())
+                return self.siguiente
+
+        def read(self, path, size, offset, fh):
+            f, lock = self.abiertos[fh]
+            with lock:
+                f.seek(offset)
+                data = f.read(size)
+            metrics.add_bytes("version_tree", leidos=len(data))
+            return data
+
+        def release(self, path, fh):
+            with self.lock:
+                f, _ = self.abiertos.pop(fh)
+            f.close()
+
+    logging.info(f"Versiones de {tree.repo_path} montadas en {punto}")
+    FUSE(_Operations(), punto, foreground=foreground, ro=True, nothreads=False)
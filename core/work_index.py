@@ -0,0 +1,110 @@
+import os
+import json
+import time
+import logging
+from core.object_store import hash_file
+from core.pipeline import DEFAULT_WORKERS, parallel_map
+from utils.atomic_io import atomic_write_json
+from utils import metrics
+
+INDEX_DIR = "indices"
+
+
+def scan_tree(base_path):
+    # Un único recorrido con os.scandir: devuelve ruta relativa -> stat
+    resultado = {}
+    pendientes = [("", base_path)]
+    while pendientes:
+        prefijo, carpeta = pendientes.pop()
+        with os.scandir(carpeta) as it:
+            for entry in it:
+                rel = f"{prefijo}{entry.name}"
+                if entry.is_dir(follow_symlinks=False):
+                    pendientes.append((rel + "/", entry.path))
+                elif entry.is_file(follow_symlinks=False):
+                    resultado[rel] = entry.stat(follow_symlinks=False)
+    return resultado
+
+
+class WorkIndex:
+    def __init__(self, repo_path, work_path):
+        self.work_path = work_path
+        nombre = os.path.basename(os.path.normpath(work_path))
+        self.index_path = os.path.join(repo_path, INDEX_DIR, f"{nombre}.json")
+        self.entradas = {}
+        self.escrito_ns = 0
+        # Patrones del perfil de rutas con que se materializó la carpeta ([] =
+        # todo el árbol); None si no se sabe (índices anteriores)
+        self.perfil = None
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, "r") as f:
+                data = json.load(f)
+            self.entradas = data.get("entradas", {})
+            self.escrito_ns = data.get("escrito_ns", 0)
+            self.perfil = data.get("perfil")
+        except (json.JSONDecodeError, OSError) as e:
+            logging.error(f"Índice dañado en {self.index_path}, se reconstruirá: {e}")
+            self.entradas = {}
+            self.escrito_ns = 0
+            self.perfil = None
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        self.escrito_ns = time.time_ns()
+        # El índice es reconstruible: no necesita journal
+        data = {"escrito_ns": self.escrito_ns, "entradas": self.entradas}
+        if self.perfil is not None:
+            data["perfil"] = self.perfil
+        atomic_write_json(self.index_path, data, journal=False)
+
+    def _vigente(self, entrada, st):
+        size, mtime_ns, ino, _ = entrada
+        if size != st.st_size or mtime_ns != st.st_mtime_ns or ino != st.st_ino:
+            return False
+        # Un archivo modificado en el mismo instante en que se escribió el índice
+        # podría cambiar sin alterar el mtime: se vuelve a leer por seguridad.
+        return mtime_ns < self.escrito_ns
+
+    def record(self, rel, st, digest):
+        self.entradas[rel] = [st.st_size, st.st_mtime_ns, st.st_ino, digest]
+
+    def refresh(self, workers=DEFAULT_WORKERS):
+        # Devuelve (archivos, cambiados): el árbol actual ruta -> {hash, size}
+        # y las rutas que hubo que volver a leer porque su stat cambió.
+        archivos = {}
+        cambiados = []
+        stats = scan_tree(self.work_path)
+        for rel, st in stats.items():
+            entrada = self.entradas.get(rel)
+            if entrada is not None and self._vigente(entrada, st):
+                archivos[rel] = {"hash": entrada[3], "size": st.st_size}
+            else:
+                cambiados.append(rel)
+
+        rutas = [os.path.join(self.work_path, *rel.split("/")) for rel in cambiados]
+        for rel, digest in zip(cambiados, parallel_map(hash_file, rutas, workers)):
+            st = stats[rel]
+            self.record(rel, st, digest)
+            archivos[rel] = {"hash": digest, "size": st.st_size}
+
+        for rel in list(self.entradas):
+            if rel not in stats:
+                del self.entradas[rel]
+        metrics.cache("indice_stat", aciertos=len(stats) - len(cambiados), fallos=len(cambiados))
+        metrics.add_bytes("work_index", leidos=sum(stats[rel].st_size for rel in cambiados))
+        return archivos, cambiados
+
+
+def compare_trees(archivos, previos):
+    nuevos = sorted(rel for rel in archivos if rel not in previos)
+    eliminados = sorted(rel for rel in previos if rel not in archivos)
+    modificados = sorted(
+        rel for rel, entry in archivos.items()
+        if rel in previos and previos[rel]["hash"] != entry["hash"]
+    )
+    return {"nuevos": nuevos, "modificados": modificados, "eliminados": eliminados}
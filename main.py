@@ -1,21 +1,28 @@
 import logging
+import argparse
+import shlex
+import sys
 from users.user_manager import UserManager
-from core.context_manager import ContextManager
+from core.context_manager import Session
 from core.version_control import VersionControl
-from utils import file_ops
+from core.retention import RetentionPolicy
+from utils import file_ops, metrics
+from utils.atomic_io import CorruptFileError
 import os
 
-# Configuración de logging
+PAGE_LINES = 40
+
+# Configuración de logging: el archivo se abre con el primer mensaje, no al iniciar
 logging.basicConfig(
-    filename='logfile.log',
+    handlers=[logging.FileHandler('logfile.log', delay=True)],
     level=logging.INFO,
     format='%(asctime)s [%(levelname)s] %(message)s'
 )
 
-def main():
-    user_manager = UserManager()
-    context_manager = ContextManager()
-    version_control = VersionControl()
+def main(user_manager=None, session=None, version_control=None):
+    user_manager = user_manager or UserManager()
+    session = session or Session.load()
+    version_control = version_control or VersionControl(session, user_manager)
 
     while True:
         print("\n--- Menú Principal ---")
@@ -34,10 +41,25 @@ def main():
         print("13. Ver archivo")
         print("14. Editar archivo")
         print("15. Eliminar archivo")
-        print("16. Salir")
+        print("16. Estado del área de trabajo")
+        print("17. Empaquetar historial")
+        print("18. Buscar versiones por fecha")
+        print("19. Comparar versiones")
+        print("20. Ver métricas")
+        print("21. Podar versiones antiguas")
+        print("22. Rutas de trabajo (update parcial)")
+        print("23. Buscar texto en las versiones")
+        print("24. Ver archivo de una versión")
+        print("25. Importar usuarios y permisos desde archivo")
+        print("26. Grupos, proyectos y reglas")
+        print("27. Salir")
 
         opcion = input("Seleccione una opción: ").strip()
-        os.system('cls' if os.name == 'nt' else 'clear')
+        if os.name == 'nt':
+            os.system('cls')
+        else:
+            # Secuencia ANSI: limpia la pantalla sin lanzar un proceso "clear"
+            print("\033[2J\033[H", end="", flush=True)
         logging.info(f"Opción seleccionada: {opcion}")
 
         if opcion == "1":
@@ -64,11 +86,7 @@ def main():
             usuario_actual = input("¿Con qué usuario deseas ingresar? ").strip()
             usuario_destino = input("¿A qué usuario deseas acceder (dueño de carpeta)?: ").strip()
 
-            if usuario_actual not in user_manager.load_users() or usuario_destino not in user_manager.load_users():
-                print("Uno de los usuarios no existe.")
-                continue
-
-            if usuario_actual not in user_manager.load_users() or usuario_destino not in user_manager.load_users():
+            if not user_manager.user_exists(usuario_actual) or not user_manager.user_exists(usuario_destino):
                 print("Uno de los usuarios no existe.")
                 continue
 
@@ -76,7 +94,7 @@ def main():
                 print(f"No tienes permisos para acceder al repositorio de {usuario_destino}.")
                 continue
 
-            context_manager.set_context(usuario_actual, usuario_destino)
+            session.set_context(usuario_actual, usuario_destino)
             
         elif opcion == "6":
             version_control.commit()
@@ -118,7 +136,7 @@ def main():
                     print("Índice de versión inválido.")
 
         elif opcion == "11":
-            ctx = context_manager.get_context()
+            ctx = session.get_context()
             if not ctx:
                 print("No hay contexto seleccionado.")
                 continue
@@ -131,7 +149,7 @@ def main():
             file_ops.create_file(ctx["path"], filename)
 
         elif opcion == "12":
-            ctx = context_manager.get_context()
+            ctx = session.get_context()
             if not ctx:
                 print("No hay contexto seleccionado.")
                 continue
@@ -143,7 +161,7 @@ def main():
             file_ops.list_files(ctx["path"])
 
         elif opcion == "13":
-            ctx = context_manager.get_context()
+            ctx = session.get_context()
             if not ctx:
                 print("No hay contexto seleccionado.")
                 continue
@@ -154,13 +172,20 @@ def main():
                 continue
             file_ops.list_files(ctx["path"])
             filename = input("Archivo a leer: ")
-            content = file_ops.read_file(ctx["path"], filename)
-            if content:
-                print("\n--- Contenido del archivo ---\n")
-                print(content)
+            if not os.path.isfile(file_ops.get_temp_path(ctx["path"], filename)):
+                print("Archivo no encontrado.")
+                continue
+            print("\n--- Contenido del archivo ---\n")
+            for page in file_ops.iter_pages(ctx["path"], filename, PAGE_LINES):
+                print("".join(page), end="")
+                if len(page) == PAGE_LINES:
+                    seguir = input("\n-- Enter para continuar, 'q' para salir -- ").strip().lower()
+                    if seguir == "q":
+                        break
+            print()
 
         elif opcion == "14":
-            ctx = context_manager.get_context()
+            ctx = session.get_context()
             if not ctx:
                 print("No hay contexto seleccionado.")
                 continue
@@ -171,11 +196,15 @@ def main():
                 continue
             file_ops.list_files(ctx["path"])
             filename = input("Archivo a editar: ")
+            modo = input("¿Reemplazar (r) o añadir al final (a)? [r]: ").strip().lower()
             content = input("Nuevo contenido: ")
-            file_ops.update_file(ctx["path"], filename, content)
+            if modo == "a":
+                file_ops.append_file(ctx["path"], filename, content + "\n")
+            else:
+                file_ops.update_file(ctx["path"], filename, content)
 
         elif opcion == "15":
-            ctx = context_manager.get_context()
+            ctx = session.get_context()
             if not ctx:
                 print("No hay contexto seleccionado.")
                 continue
@@ -189,11 +218,389 @@ def main():
             file_ops.delete_file(ctx["path"], filename)
 
         elif opcion == "16":
+            version_control.status()
+
+        elif opcion == "17":
+            version_control.pack(background=True)
+
+        elif opcion == "18":
+            desde = input("Desde (AAAA-MM-DD, vacío = sin límite): ").strip()
+            hasta = input("Hasta (AAAA-MM-DD, vacío = sin límite): ").strip()
+            version_control.versions_between(desde or None, hasta or None)
+
+        elif opcion == "19":
+            version_control.list_versions()
+            version_a = input("Versión base: ").strip()
+            version_b = input("Versión a comparar (vacío = carpeta temporal): ").strip()
+            ruta = input("Archivo o carpeta (vacío = todo): ").strip()
+            version_control.diff(version_a, version_b or None, ruta or None)
+
+        elif opcion == "20":
+            metrics.print_summary()
+
+        elif opcion == "21":
+            ultimas = input("Versiones recientes a conservar: ").strip()
+            diarias = input("Conservar además una por día durante (días, vacío = no): ").strip()
+            if not ultimas.isdigit() or (diarias and not diarias.isdigit()):
+                print("Debe ingresar números.")
+                continue
+            policy = RetentionPolicy(ultimas=int(ultimas), diarias=int(diarias) if diarias else None)
+            version_control.prune(policy, simular=True)
+            if input("¿Eliminar estas versiones? (s/n): ").strip().lower() == "s":
+                version_control.prune(policy, guardar=True)
+
+        elif opcion == "22":
+            version_control.sparse()
+            rutas = input("Rutas o patrones separados por espacios (vacío = todo el repositorio): ").split()
+            if rutas:
+                version_control.sparse(rutas)
+            else:
+                version_control.sparse(limpiar=True)
+            version_control.update()
+
+        elif opcion == "23":
+            texto = input("Texto a buscar: ")
+            alcance = input("Buscar en (t)odas las versiones, la (u)ltima o la carpeta (c)temporal: ").strip().lower()
+            alcances = {"t": "todas", "u": "ultima", "c": "temporal"}
+            version_control.search(texto, alcances.get(alcance[:1], "todas"))
+
+        elif opcion == "24":
+            versions = version_control.list_versions()
+            if versions:
+                index = input("Seleccione número de versión: ").strip()
+                if not index.isdigit() or not 1 <= int(index) <= len(versions):
+                    print("Índice de versión inválido.")
+                    continue
+                version = versions[int(index) - 1]
+                ruta = ""
+                while True:
+                    info = version_control.show(version, ruta)
+                    if info is None or isinstance(info, dict):
+                        print()
+                        break
+                    entrada = input(f"\n{version}/{ruta} > archivo o carpeta ('..' = subir, vacío = salir): ").strip().strip("/")
+                    if not entrada:
+                        break
+                    if entrada == "..":
+                        ruta = ruta.rpartition("/")[0]
+                    else:
+                        ruta = f"{ruta}/{entrada}" if ruta else entrada
+
+        elif opcion == "25":
+            archivo = input("Archivo CSV o JSONL (columnas accion, usuario, dueno, permiso): ").strip()
+            if user_manager.import_file(archivo, simular=True) is not None:
+                if input("¿Aplicar estos cambios? (s/n): ").strip().lower() == "s":
+                    user_manager.import_file(archivo)
+
+        elif opcion == "26":
+            user_manager.list_groups()
+            accion = input("\n(g) definir grupo, (p) definir proyecto, (r) otorgar a un grupo, (q) quitar regla, vacío = volver: ").strip().lower()
+            if accion == "g":
+                nombre = input("Nombre del grupo: ").strip()
+                miembros = input("Miembros separados por espacios ('@grupo' incluye otro grupo): ").split()
+                user_manager.define_group(nombre, miembros)
+            elif accion == "p":
+                nombre = input("Nombre del proyecto: ").strip()
+                repos = input("Repositorios (dueños) separados por espacios: ").split()
+                user_manager.define_project(nombre, repos)
+            elif accion in ("r", "q"):
+                grupo = input("Grupo: ").strip()
+                destino = input("Repositorio, o 'proyecto:NOMBRE' ('*' = todos los repositorios): ").strip()
+                proyecto = destino[len("proyecto:"):] if destino.startswith("proyecto:") else None
+                repo = None if proyecto else destino
+                if accion == "r":
+                    rol = input("Rol (read/write o un rol definido): ").strip()
+                    user_manager.grant_group(grupo, rol, repo, proyecto)
+                else:
+                    user_manager.revoke_group(grupo, repo, proyecto)
+
+        elif opcion == "27":
             logging.info("Aplicación finalizada.")
             break
 
         else:
             print("Opción inválida.")
 
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="main.py",
+        description="Control de versiones con usuarios y permisos. Sin argumentos abre el menú interactivo.",
+    )
+    parser.add_argument(
+        "--metricas", metavar="ARCHIVO",
+        help="Al terminar, guardar las métricas en formato Prometheus ('-' = pantalla)",
+    )
+    parser.add_argument("--profile", action="store_true", help="Perfilar la operación con cProfile (resumen por stderr)")
+    parser.add_argument("--profile-salida", metavar="ARCHIVO", help="Guardar el perfil para pstats en lugar de resumirlo")
+    sub = parser.add_subparsers(dest="comando")
+
+    p = sub.add_parser("user-add", help="Crear usuarios")
+    p.add_argument("nombres", nargs="+")
+    sub.add_parser("users", help="Listar usuarios")
+    sub.add_parser("groups", help="Listar grupos, roles, proyectos y reglas")
+    p = sub.add_parser("group", help="Definir (o eliminar) un grupo de usuarios")
+    p.add_argument("nombre")
+    p.add_argument("miembros", nargs="*", help="Usuarios; '@grupo' incluye otro grupo")
+    p.add_argument("--eliminar", action="store_true")
+    p = sub.add_parser("role", help="Definir un rol como nombre de un permiso")
+    p.add_argument("nombre")
+    p.add_argument("permiso", choices=("read", "write"))
+    p = sub.add_parser("project", help="Definir un proyecto como conjunto de repositorios")
+    p.add_argument("nombre")
+    p.add_argument("repos", nargs="+", help="Dueños de los repositorios")
+    for nombre, ayuda in (("group-grant", "Dar un rol a un grupo"), ("group-revoke", "Quitar la regla de un grupo")):
+        p = sub.add_parser(nombre, help=ayuda + " sobre un repositorio o un proyecto")
+        p.add_argument("grupo")
+        if nombre == "group-grant":
+            p.add_argument("rol", help="read, write o un rol definido")
+        destino = p.add_mutually_exclusive_group(required=True)
+        destino.add_argument("--repo", help="Dueño del repositorio ('*' = todos)")
+        destino.add_argument("--proyecto")
+    p = sub.add_parser("import", help="Crear usuarios y asignar permisos en lote desde un CSV o JSONL")
+    p.add_argument("archivo", help="Una fila por operación: accion (user|grant|revoke), usuario, dueno, permiso")
+    p.add_argument("--simular", action="store_true", help="Solo validar y mostrar el resumen")
+    p = sub.add_parser("grant", help="Otorgar permiso sobre un repositorio")
+    p.add_argument("dueno")
+    p.add_argument("usuario")
+    p.add_argument("permiso", choices=("read", "write"))
+    p = sub.add_parser("revoke", help="Quitar permiso sobre un repositorio")
+    p.add_argument("dueno")
+    p.add_argument("usuario")
+    p.add_argument("permiso", choices=("read", "write"))
+
+    p = sub.add_parser("use", help="Cambiar de usuario actual y repositorio")
+    p.add_argument("usuario_actual")
+    p.add_argument("usuario_destino", nargs="?")
+
+    sub.add_parser("commit", help="Guardar la carpeta de trabajo como nueva versión")
+    p = sub.add_parser("update", help="Traer la última versión a la carpeta de trabajo")
+    p.add_argument("--rutas", nargs="+", help="Traer solo estas rutas o patrones (se guardan como perfil)")
+    p = sub.add_parser("sparse", help="Ver o definir las rutas de trabajo del usuario en el repositorio")
+    p.add_argument("patrones", nargs="*", help="Prefijos o globs; '!patrón' excluye")
+    p.add_argument("--limpiar", action="store_true", help="Volver a trabajar con todo el repositorio")
+    sub.add_parser("status", help="Cambios de la carpeta de trabajo")
+    p = sub.add_parser("log", help="Listar versiones")
+    p.add_argument("--ultimas", type=int, help="Solo las últimas N versiones")
+    p.add_argument("--desde", help="Fecha inicial (AAAA-MM-DD)")
+    p.add_argument("--hasta", help="Fecha final (AAAA-MM-DD)")
+    p = sub.add_parser("files", help="Archivos de una versión")
+    p.add_argument("version")
+    p = sub.add_parser("recover", help="Recuperar una versión o un archivo")
+    p.add_argument("version")
+    p.add_argument("--archivo", help="Recuperar solo este archivo")
+    p.add_argument("--rutas", nargs="+", help="Recuperar solo estas rutas o patrones")
+    p = sub.add_parser("diff", help="Diferencias entre versiones o con la carpeta de trabajo")
+    p.add_argument("version_a")
+    p.add_argument("version_b", nargs="?", help="Por defecto, la carpeta de trabajo")
+    p.add_argument("--ruta", help="Limitar a un archivo o carpeta")
+    p.add_argument("--resumen", action="store_true", help="Solo la lista de archivos cambiados")
+    p = sub.add_parser("prune", help="Eliminar versiones según la política de retención")
+    p.add_argument("--ultimas", type=int, help="Conservar las últimas N versiones")
+    p.add_argument("--diarias", type=int, help="Conservar la última versión de cada uno de los últimos N días")
+    p.add_argument("--semanales", type=int, help="Ídem por semanas")
+    p.add_argument("--mensuales", type=int, help="Ídem por meses")
+    p.add_argument("--max-dias", type=int, help="Eliminar las versiones con más de N días")
+    p.add_argument("--max-bytes", type=int, help="Eliminar las versiones más antiguas hasta ocupar como mucho N bytes")
+    p.add_argument("--guardar", action="store_true", help="Guardar la política para las próximas podas")
+    p.add_argument("--simular", action="store_true", help="Solo mostrar qué se eliminaría")
+    p.add_argument("--sin-gc", action="store_true", help="No recolectar los objetos sin usar")
+    p = sub.add_parser("gc", help="Eliminar los objetos que no usa ninguna versión")
+    p.add_argument("--presupuesto", type=float, help="Segundos como máximo; la siguiente ejecución continúa")
+    p = sub.add_parser("search", help="Buscar texto en el historial o en la carpeta de trabajo")
+    p.add_argument("texto")
+    p.add_argument("--en", choices=("todas", "ultima", "temporal"), default="todas", help="Dónde buscar")
+    p.add_argument("-i", "--ignorar-mayusculas", action="store_true")
+    p = sub.add_parser("show", help="Ver un archivo o una carpeta de una versión sin recuperarla")
+    p.add_argument("version")
+    p.add_argument("ruta", nargs="?", default="")
+    p.add_argument("--salida", help="Guardar el archivo aquí en lugar de mostrarlo")
+    p = sub.add_parser("mount", help="Montar las versiones como carpetas de solo lectura (requiere fusepy)")
+    p.add_argument("punto")
+    p = sub.add_parser("pack", help="Empaquetar el historial antiguo")
+    p.add_argument("--mantener", type=int, default=1, help="Versiones recientes que no se empaquetan")
+
+    p = sub.add_parser("serve", help="Servidor multiusuario (una petición JSON por línea)")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--unix", help="Escuchar en un socket Unix en lugar de TCP")
+    p.add_argument("--hilos", type=int, default=16, help="Operaciones simultáneas como máximo")
+
+    p = sub.add_parser("batch", help="Ejecutar operaciones desde un archivo (una por línea, '-' = stdin)")
+    p.add_argument("archivo")
+    p.add_argument("--detener", action="store_true", help="Detenerse en la primera operación fallida")
+    return parser
+
+
+def run_command(args, user_manager, session, version_control):
+    # Devuelve True si la operación terminó bien
+    comando = args.comando
+    if comando == "user-add":
+        return user_manager.create_users(args.nombres) is not None
+    if comando == "groups":
+        user_manager.list_groups()
+        return True
+    if comando == "group":
+        if args.eliminar:
+            return bool(user_manager.delete_group(args.nombre))
+        return bool(user_manager.define_group(args.nombre, args.miembros))
+    if comando == "role":
+        return bool(user_manager.define_role(args.nombre, args.permiso))
+    if comando == "project":
+        return bool(user_manager.define_project(args.nombre, args.repos))
+    if comando == "group-grant":
+        return bool(user_manager.grant_group(args.grupo, args.rol, args.repo, args.proyecto))
+    if comando == "group-revoke":
+        return bool(user_manager.revoke_group(args.grupo, args.repo, args.proyecto))
+    if comando == "import":
+        return user_manager.import_file(args.archivo, args.simular) is not None
+    if comando == "users":
+        user_manager.list_users()
+        return True
+    if comando == "grant":
+        return bool(user_manager.assign_permission(args.dueno, args.usuario, args.permiso))
+    if comando == "revoke":
+        return bool(user_manager.remove_permission(args.dueno, args.usuario, args.permiso))
+    if comando == "use":
+        destino = args.usuario_destino or args.usuario_actual
+        if not user_manager.user_exists(args.usuario_actual) or not user_manager.user_exists(destino):
+            print("Uno de los usuarios no existe.")
+            return False
+        if not user_manager.has_any_permission(args.usuario_actual, destino):
+            print(f"No tienes permisos para acceder al repositorio de {destino}.")
+            return False
+        session.set_context(args.usuario_actual, destino)
+        return True
+    if comando == "commit":
+        return version_control.commit() is not None
+    if comando == "update":
+        return bool(version_control.update(args.rutas))
+    if comando == "sparse":
+        return version_control.sparse(args.patrones, args.limpiar) is not None
+    if comando == "status":
+        return version_control.status() is not None
+    if comando == "log":
+        if args.ultimas:
+            version_control.latest_versions(args.ultimas)
+        elif args.desde or args.hasta:
+            version_control.versions_between(args.desde, args.hasta)
+        else:
+            version_control.list_versions()
+        return True
+    if comando == "files":
+        for archivo in version_control.list_files_in_version(args.version):
+            print(archivo)
+        return True
+    if comando == "recover":
+        if args.rutas:
+            return bool(version_control.recover(args.version, patrones=args.rutas))
+        if args.archivo:
+            return bool(version_control.recover(args.version, args.archivo, is_file=True))
+        return bool(version_control.recover(args.version))
+    if comando == "diff":
+        cambios = version_control.diff(args.version_a, args.version_b, args.ruta, contenido=not args.resumen)
+        return cambios is not None
+    if comando == "prune":
+        valores = {k: getattr(args, k) for k in ("ultimas", "diarias", "semanales", "mensuales", "max_dias", "max_bytes")}
+        policy = RetentionPolicy(**valores) if any(v is not None for v in valores.values()) else None
+        eliminadas = version_control.prune(policy, args.simular, args.guardar, recolectar=not args.sin_gc)
+        return eliminadas is not None
+    if comando == "gc":
+        return version_control.gc(args.presupuesto) is not None
+    if comando == "search":
+        return version_control.search(args.texto, args.en, args.ignorar_mayusculas) is not None
+    if comando == "show":
+        return version_control.show(args.version, args.ruta, args.salida) is not None
+    if comando == "mount":
+        return bool(version_control.mount(args.punto))
+    if comando == "pack":
+        return version_control.pack(keep_recent=args.mantener) is not None
+    raise ValueError(f"Comando desconocido: {comando}")
+
+
+def run_batch(source, parser, user_manager, session, version_control, detener=False):
+    # Todas las operaciones se ejecutan en este proceso con los mismos gestores
+    stream = sys.stdin if source == "-" else open(source, "r", encoding="utf-8")
+    fallidas = 0
+    try:
+        for numero, linea in enumerate(stream, 1):
+            linea = linea.strip()
+            if not linea or linea.startswith("#"):
+                continue
+            try:
+                args = parser.parse_args(shlex.split(linea))
+                if args.comando in (None, "batch", "serve", "mount"):
+                    raise ValueError("Operación no permitida en modo batch.")
+                ok = run_command(args, user_manager, session, version_control)
+            except SystemExit:
+                ok = False
+            except Exception as e:
+                logging.exception(f"Error en la línea {numero} del batch")
+                print(f"Error en la línea {numero}: {e}")
+                ok = False
+            if not ok:
+                fallidas += 1
+                print(f"Operación fallida (línea {numero}): {linea}")
+                if detener:
+                    break
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    return fallidas == 0
+
+
+def run_profiled(funcion, destino):
+    import cProfile
+    import pstats
+
+    perfil = cProfile.Profile()
+    perfil.enable()
+    try:
+        return funcion()
+    finally:
+        perfil.disable()
+        if destino is None:
+            pstats.Stats(perfil, stream=sys.stderr).sort_stats("cumulative").print_stats(30)
+        else:
+            perfil.dump_stats(destino)
+            print(f"Perfil guardado en {destino} (python -m pstats {destino})", file=sys.stderr)
+
+
+def cli(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    user_manager = UserManager()
+    session = Session.load()
+    version_control = VersionControl(session, user_manager)
+
+    def ejecutar():
+        if args.comando is None:
+            main(user_manager, session, version_control)
+            return True
+        if args.comando == "serve":
+            from core.server import serve
+            serve(args.host, args.port, args.unix, args.hilos)
+            return True
+        if args.comando == "batch":
+            return run_batch(args.archivo, parser, user_manager, session, version_control, args.detener)
+        return run_command(args, user_manager, session, version_control)
+
+    try:
+        if args.profile or args.profile_salida:
+            ok = run_profiled(ejecutar, args.profile_salida)
+        else:
+            ok = ejecutar()
+    except CorruptFileError as e:
+        # users.json o groups.json dañado: no se sigue como si estuvieran vacíos
+        print(e)
+        ok = False
+
+    if args.metricas == "-":
+        print(metrics.render_prometheus(), end="")
+    elif args.metricas:
+        metrics.write_prometheus(args.metricas)
+    return 0 if ok else 1
+
+
 if __name__ == "__main__":
-    main()
+    sys.exit(cli())
@@ -0,0 +1,43 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import object_store, version_log
+from core.context_manager import Session
+from core.object_store import ObjectStore
+from core.version_control import VersionControl
+from users.user_manager import UserManager
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # data/ y repo_root/ son rutas relativas: cada prueba trabaja en su carpeta
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("VCS_USERS_BACKEND", "json")
+    monkeypatch.delenv("VCS_MATERIALIZE", raising=False)
+    # Cachés por proceso indexadas por ruta relativa
+    version_log._logs.clear()
+    object_store._pack_readers.clear()
+    return tmp_path
+
+
+@pytest.fixture
+def vc(workdir):
+    um = UserManager()
+    um.create_user("ana")
+    return VersionControl(Session("ana", "ana"), um)
+
+
+@pytest.fixture
+def store(vc):
+    return ObjectStore(os.path.join("repo_root", "ana"))
+
+
+def write(vc, rel, contenido):
+    path = os.path.join(vc.ctx.get_context()["path"], *rel.split("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(contenido)
+    return path
@@ -0,0 +1,49 @@
+import os
+import pytest
+from utils import atomic_io
+from utils.atomic_io import CorruptFileError, atomic_write, read_json
+from users.user_manager import UserManager
+
+
+def test_lenient_read_moves_damaged_file_aside(tmp_path):
+    path = tmp_path / "gc.json"
+    path.write_text("{roto")
+    assert read_json(str(path), {"defecto": 1}) == {"defecto": 1}
+    assert not path.exists()
+    assert [n for n in os.listdir(tmp_path) if n.startswith("gc.json.corrupto-")]
+
+
+def test_strict_read_keeps_damaged_file(tmp_path):
+    path = tmp_path / "users.json"
+    path.write_text("{roto")
+    for _ in range(2):
+        with pytest.raises(CorruptFileError):
+            read_json(str(path), {}, strict=True)
+    assert path.read_text() == "{roto"
+
+
+def test_damaged_users_file_is_never_overwritten(workdir):
+    um = UserManager()
+    um.create_user("ana")
+    with open(os.path.join("data", "users.json"), "w") as f:
+        f.write('{"ana": {"permisos"')
+    with pytest.raises(CorruptFileError):
+        UserManager().create_user("beto")
+    with open(os.path.join("data", "users.json")) as f:
+        assert f.read() == '{"ana": {"permisos"'
+
+
+def test_write_tolerates_journal_replayed_by_another_process(tmp_path, monkeypatch):
+    path = str(tmp_path / "users.json")
+    fsync_dir = atomic_io._fsync_dir
+
+    def y_otro_proceso(destino):
+        fsync_dir(destino)
+        # Otro proceso lee el archivo, aplica el journal y lo borra antes que este
+        monkeypatch.setattr(atomic_io, "_fsync_dir", fsync_dir)
+        assert atomic_io._replay_journal(path, path + atomic_io.JOURNAL_EXT)
+
+    monkeypatch.setattr(atomic_io, "_fsync_dir", y_otro_proceso)
+    atomic_write(path, b'{"a": 1}')
+    assert read_json(path, None) == {"a": 1}
+    assert not os.path.exists(path + atomic_io.JOURNAL_EXT)
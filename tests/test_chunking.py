@@ -0,0 +1,115 @@
+import io
+import os
+import random
+import hashlib
+import pytest
+from core import chunking, object_store
+from core.chunking import CHUNK_MAX, CHUNK_MIN, ChunkedFile, compress_chunk, decompress_chunk, split_chunks
+from core.object_store import ObjectStore
+
+
+@pytest.fixture
+def pequenos(monkeypatch):
+    # Fragmentos de pocos KB: cortan en cada candidato pasado CHUNK_MIN
+    monkeypatch.setattr(chunking, "CHUNK_MIN", 4096)
+    monkeypatch.setattr(chunking, "CHUNK_MAX", 64 * 1024)
+    monkeypatch.setattr(chunking, "READ_SIZE", 16 * 1024)
+    monkeypatch.setattr(chunking, "CUT_MASK", 0)
+
+
+def csv(filas, inicio=0):
+    r = random.Random(inicio)
+    return "".join(f"{i},{r.randint(0, 10 ** 6)},cliente_{r.randint(0, 999)},{r.random():.4f}\n"
+                   for i in range(inicio, inicio + filas)).encode()
+
+
+@pytest.mark.parametrize("size", [0, 1, CHUNK_MAX, CHUNK_MAX + CHUNK_MIN + 1])
+def test_split_roundtrip(size):
+    data = os.urandom(size)
+    fragmentos = list(split_chunks(io.BytesIO(data)))
+    assert b"".join(fragmentos) == data
+    assert all(len(f) <= CHUNK_MAX for f in fragmentos)
+    assert all(len(f) >= CHUNK_MIN for f in fragmentos[:-1])
+
+
+def test_uniform_data_is_cut_at_chunk_max(pequenos):
+    fragmentos = list(split_chunks(io.BytesIO(bytes(200 * 1024))))
+    assert [len(f) for f in fragmentos] == [64 * 1024] * 3 + [8 * 1024]
+
+
+def test_cuts_are_content_defined_on_text(pequenos):
+    data = csv(20000)
+    fragmentos = list(split_chunks(io.BytesIO(data)))
+    assert len(fragmentos) > 50
+    # Ningún corte forzado: en texto también aparecen candidatos
+    assert max(len(f) for f in fragmentos) < 64 * 1024
+
+
+def test_insertion_only_changes_nearby_chunks(pequenos):
+    data = csv(20000)
+    editado = data[:len(data) // 2] + b"fila,insertada,a,mano\n" + data[len(data) // 2:]
+    antes = {hashlib.sha256(f).digest() for f in split_chunks(io.BytesIO(data))}
+    despues = [hashlib.sha256(f).digest() for f in split_chunks(io.BytesIO(editado))]
+    assert len([h for h in despues if h not in antes]) <= 2
+
+
+@pytest.mark.parametrize("modo", ["zlib", "none"])
+def test_compress_roundtrip(modo):
+    for data in (b"", b"texto " * 1000, os.urandom(100 * 1024)):
+        assert decompress_chunk(compress_chunk(data, modo)) == data
+
+
+def test_incompressible_chunks_are_stored_raw():
+    data = os.urandom(100 * 1024)
+    assert compress_chunk(data, "zlib")[:1] == chunking.RAW
+    assert compress_chunk(b"a" * 100 * 1024, "zlib")[:1] == chunking.ZLIB
+
+
+def test_unknown_chunk_format():
+    with pytest.raises(ValueError):
+        decompress_chunk(b"Xdatos")
+
+
+def test_chunked_file_seek_and_read():
+    partes = [b"a" * 10, b"b" * 5, b"c" * 20]
+    leidos = []
+
+    def leer(digest):
+        leidos.append(digest)
+        return partes[digest]
+
+    raw = ChunkedFile([(i, len(p)) for i, p in enumerate(partes)], leer)
+    # Una lectura cruda termina en el borde del fragmento
+    assert raw.read(12) == b"a" * 10
+    f = io.BufferedReader(raw, 4)
+    f.seek(0)
+    assert f.read() == b"".join(partes)
+    assert f.seek(-22, io.SEEK_END) == 13
+    assert f.read(4) == b"bbcc"
+    f.seek(2, io.SEEK_CUR)
+    assert f.read(3) == b"ccc"
+    assert f.seek(100) == 100 and f.read(1) == b""
+    # Los fragmentos se leen de a uno y solo cuando hace falta
+    leidos.clear()
+    f.seek(12)
+    assert f.read(4) == b"bbbc" and leidos == [1, 2]
+
+
+def test_store_chunked_roundtrip_and_dedup(workdir, pequenos, monkeypatch):
+    monkeypatch.setattr(object_store, "CHUNKED_MIN_SIZE", 1024)
+    store = ObjectStore(str(workdir / "repo"))
+    data = csv(20000)
+    (workdir / "a.csv").write_bytes(data)
+    digest = store.store_file(str(workdir / "a.csv"))
+    assert store.is_chunked(digest) and not store.is_loose(digest)
+    assert store.read(digest) == data
+    with store.open(digest) as f:
+        f.seek(len(data) // 2)
+        assert f.read(100) == data[len(data) // 2:len(data) // 2 + 100]
+
+    fragmentos = {h for h, _ in store.recipe(digest)["fragmentos"]}
+    editado = data[:1000] + b"x" + data[1000:]
+    (workdir / "b.csv").write_bytes(editado)
+    nuevo = store.store_file(str(workdir / "b.csv"))
+    assert store.read(nuevo) == editado
+    assert len({h for h, _ in store.recipe(nuevo)["fragmentos"]} - fragmentos) <= 2
@@ -0,0 +1,161 @@
+import io
+import random
+import difflib
+import pytest
+from conftest import write
+from core import diff
+from core.diff import diff_contents, diff_files, diff_trees, opcodes, tree_hashes, unified_diff
+
+
+def apply_ops(a, b, ops):
+    # Reconstruye b a partir de a y las operaciones, comprobando que sean contiguas
+    resultado = []
+    i = j = 0
+    for tag, i1, i2, j1, j2 in ops:
+        assert (i1, j1) == (i, j)
+        if tag == "equal":
+            assert a[i1:i2] == b[j1:j2]
+        resultado += a[i1:i2] if tag == "equal" else b[j1:j2]
+        i, j = i2, j2
+    assert (i, j) == (len(a), len(b))
+    return resultado
+
+
+def test_opcodes_roundtrip_random():
+    r = random.Random(1)
+    for _ in range(500):
+        a = [r.choice("abcde") for _ in range(r.randint(0, 40))]
+        b = [r.choice("abcde") for _ in range(r.randint(0, 40))]
+        assert apply_ops(a, b, opcodes(a, b)) == b
+
+
+def test_opcodes_are_minimal():
+    # Myers da la secuencia de edición más corta: tantas líneas iguales como la LCS
+    r = random.Random(2)
+    for _ in range(200):
+        a = [r.choice("abc") for _ in range(r.randint(0, 15))]
+        b = [r.choice("abc") for _ in range(r.randint(0, 15))]
+        iguales = sum(i2 - i1 for tag, i1, i2, _, _ in opcodes(a, b) if tag == "equal")
+        lcs = [[0] * (len(b) + 1) for _ in range(len(a) + 1)]
+        for x in range(len(a)):
+            for y in range(len(b)):
+                lcs[x + 1][y + 1] = lcs[x][y] + 1 if a[x] == b[y] else max(lcs[x][y + 1], lcs[x + 1][y])
+        assert iguales == lcs[len(a)][len(b)]
+
+
+def test_large_rewrite_falls_back_to_difflib(monkeypatch):
+    monkeypatch.setattr(diff, "MAX_EDIT_DISTANCE", 10)
+    a = [f"a{i}\n" for i in range(200)]
+    b = [f"b{i}\n" if i % 3 else f"a{i}\n" for i in range(200)]
+    assert apply_ops(a, b, opcodes(a, b)) == b
+
+
+@pytest.mark.parametrize("n", [0, 1, 3])
+def test_unified_diff_matches_difflib(n):
+    r = random.Random(3)
+    for _ in range(200):
+        a = [f"{r.choice('abcdef')}\n" for _ in range(r.randint(0, 30))]
+        b = list(a)
+        for _ in range(r.randint(0, 4)):
+            i = r.randint(0, len(b))
+            if b and r.random() < 0.5:
+                del b[min(i, len(b) - 1)]
+            else:
+                b.insert(i, "nueva\n")
+        nuestro = list(unified_diff(a, b, "a", "b", n))
+        esperado = list(difflib.unified_diff(a, b, "a", "b", n=n, lineterm="\n"))
+        # Las dos herramientas pueden elegir distintas líneas iguales; los
+        # bloques deben aplicarse igual: se compara el resultado de aplicarlos.
+        assert bool(nuestro) == bool(esperado)
+        assert _aplicar(a, nuestro) == b
+
+
+def _aplicar(a, parche):
+    # Aplica un diff unificado (sin "\ No newline") sobre a
+    resultado = []
+    pos = 0
+    for linea in parche[2:]:
+        if linea.startswith("@@"):
+            inicio = int(linea.split()[1][1:].split(",")[0])
+            largo = linea.split()[1].split(",")
+            inicio = inicio - 1 if len(largo) == 1 or largo[1] != "0" else inicio
+            resultado += a[pos:inicio]
+            pos = inicio
+        elif linea[0] == " ":
+            resultado.append(linea[1:])
+            pos += 1
+        elif linea[0] == "-":
+            pos += 1
+        elif linea[0] == "+":
+            resultado.append(linea[1:])
+    return resultado + a[pos:]
+
+
+def test_unified_diff_hunk_headers():
+    a = [f"{i}\n" for i in range(20)]
+    b = list(a)
+    b[2] = "x\n"
+    b[17] = "y\n"
+    lineas = list(unified_diff(a, b, "a", "b"))
+    assert [l for l in lineas if l.startswith("@@")] == ["@@ -1,6 +1,6 @@\n", "@@ -15,6 +15,6 @@\n"]
+
+
+def test_missing_newline_is_marked():
+    lineas = list(diff_contents(b"a\nb", b"a\nc", "x", "y"))
+    assert "-b\n\\ No newline at end of file\n" in lineas
+
+
+def test_binary_contents():
+    assert list(diff_contents(b"\0\1", b"\0\2", "x", "y")) == ["Los archivos binarios x y y son distintos\n"]
+
+
+def test_diff_trees_skips_equal_subtrees():
+    antes = {"a/1": {"hash": "h1"}, "a/2": {"hash": "h2"}, "b/1": {"hash": "h3"}}
+    despues = {"a/1": {"hash": "h1"}, "a/2": {"hash": "h2"}, "b/1": {"hash": "h4"}, "c": {"hash": "h5"}}
+    assert tree_hashes(antes)["a"] == tree_hashes(despues)["a"]
+    assert diff_trees(antes, despues) == {"nuevos": ["c"], "modificados": ["b/1"], "eliminados": []}
+    assert diff_trees(antes, antes) == {"nuevos": [], "modificados": [], "eliminados": []}
+
+
+class Contado(io.BytesIO):
+    # Cuenta los bytes leídos
+    leidos = 0
+
+    def read(self, n=-1):
+        data = super().read(n)
+        Contado.leidos += len(data)
+        return data
+
+
+def test_diff_files_sniffs_binaries_before_reading():
+    Contado.leidos = 0
+    binario = b"\0" + b"x" * (1 << 20)
+    lineas = list(diff_files(lambda: Contado(binario), lambda: Contado(b"texto\n"), "a", "b"))
+    assert lineas == ["Los archivos binarios a y b son distintos\n"]
+    assert Contado.leidos <= 2 * diff.BINARY_SNIFF
+
+
+def test_diff_files_skips_large_text(monkeypatch):
+    monkeypatch.setattr(diff, "MAX_DIFF_SIZE", 100)
+    lineas = list(diff_files(lambda: io.BytesIO(b"a\n" * 100), None, "a", "/dev/null"))
+    assert lineas == ["Los archivos a y /dev/null son distintos (demasiado grandes para compararlos)\n"]
+
+
+def test_diff_files_matches_diff_contents():
+    a, b = b"uno\ndos\ntres\n", b"uno\nDOS\ntres\n"
+    assert list(diff_files(lambda: io.BytesIO(a), lambda: io.BytesIO(b), "x", "y")) == \
+        list(diff_contents(a, b, "x", "y"))
+    assert list(diff_files(None, lambda: io.BytesIO(b), "/dev/null", "y")) == \
+        list(diff_contents(b"", b, "/dev/null", "y"))
+
+
+def test_version_diff_against_working_folder(vc, capsys):
+    write(vc, "a.txt", "uno\n")
+    write(vc, "b.bin", "\0binario")
+    version = vc.commit()
+    write(vc, "a.txt", "dos\n")
+    write(vc, "b.bin", "\0otro")
+    assert vc.diff(version)["modificados"] == ["a.txt", "b.bin"]
+    salida = capsys.readouterr().out
+    assert "-uno\n+dos\n" in salida
+    assert f"Los archivos binarios {version}/b.bin y temporal/b.bin son distintos" in salida
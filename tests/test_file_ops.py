@@ -0,0 +1,23 @@
+from utils import file_ops
+from utils.file_ops import LINE_LIMIT, iter_pages
+
+
+def test_pages_are_bounded_without_newlines(tmp_path):
+    (tmp_path / "largo.txt").write_text("x" * (LINE_LIMIT * 5 + 10))
+    paginas = list(iter_pages(str(tmp_path), "largo.txt", page_lines=2))
+    assert [sum(len(l) for l in p) for p in paginas] == [LINE_LIMIT * 2, LINE_LIMIT * 2, LINE_LIMIT + 10]
+    assert "".join("".join(p) for p in paginas) == "x" * (LINE_LIMIT * 5 + 10)
+
+
+def test_pages_keep_short_lines(tmp_path):
+    (tmp_path / "notas.txt").write_text("".join(f"{i}\n" for i in range(5)))
+    assert list(iter_pages(str(tmp_path), "notas.txt", page_lines=2)) == [["0\n", "1\n"], ["2\n", "3\n"], ["4\n"]]
+
+
+def test_update_file_does_not_touch_linked_copies(tmp_path):
+    (tmp_path / "a.txt").write_text("compartido")
+    (tmp_path / "b.txt").hardlink_to(tmp_path / "a.txt")
+    file_ops.update_file(str(tmp_path), "b.txt", "nuevo")
+    file_ops.append_file(str(tmp_path), "a.txt", "!")
+    assert (tmp_path / "a.txt").read_text() == "compartido!"
+    assert (tmp_path / "b.txt").read_text() == "nuevo"
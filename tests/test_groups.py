@@ -0,0 +1,86 @@
+import pytest
+from users import groups
+from users.groups import CompiledACL, flatten_groups
+from users.user_manager import UserManager
+
+
+def test_flatten_nested_groups():
+    grupos = {"core": ["dani", "eva"], "team": ["beto", "@core"], "todos": ["@team", "ana"]}
+    assert flatten_groups(grupos) == {
+        "core": {"dani", "eva"},
+        "team": {"beto", "dani", "eva"},
+        "todos": {"ana", "beto", "dani", "eva"},
+    }
+
+
+def test_flatten_ignores_cycles_and_missing_groups():
+    miembros = flatten_groups({"a": ["x", "@b"], "b": ["y", "@a", "@fantasma"]})
+    assert miembros["a"] == {"x", "y"}
+    assert miembros["b"] == {"x", "y"}
+
+
+def test_compiled_levels_for_repo_project_and_all():
+    acl = CompiledACL(
+        {"core": ["dani"], "team": ["beto", "@core"]},
+        [
+            {"grupo": "team", "rol": "read", "repo": "*"},
+            {"grupo": "core", "rol": "mantenedor", "proyecto": "X"},
+            {"grupo": "team", "rol": "write", "repo": "carla"},
+        ],
+        {"X": {"repos": ["ana", "fede"]}},
+        {"mantenedor": "write"},
+    )
+    assert acl.level("beto", "cualquiera") == "read"
+    assert acl.level("dani", "ana") == "write"
+    assert acl.level("beto", "ana") == "read"
+    assert acl.level("beto", "carla") == "write"
+    assert acl.level("ajeno", "ana") is None
+    # Los repositorios del proyecto tienen las mismas reglas y comparten la tabla
+    assert acl.repos["ana"] == acl.repos["fede"]
+    assert len(acl.tablas) == 3
+
+
+def test_rules_with_unknown_role_or_group_are_ignored():
+    acl = CompiledACL({"g": ["ana"]}, [{"grupo": "g", "rol": "nada", "repo": "*"},
+                                       {"grupo": "otro", "rol": "write", "repo": "*"}], {})
+    assert acl.level("ana", "beto") is None
+
+
+@pytest.fixture
+def um(workdir):
+    groups._acls.clear()
+    um = UserManager()
+    for nombre in ("ana", "beto", "carla", "dani"):
+        um.create_user(nombre)
+    return um
+
+
+def test_group_grants_combine_with_direct_permissions(um):
+    assert um.define_group("core", ["dani"])
+    assert um.define_group("team", ["beto", "@core"])
+    assert um.define_project("X", ["ana", "carla"])
+    assert um.define_role("mantenedor", "write")
+    assert um.grant_group("team", "read", repo="*")
+    assert um.grant_group("core", "mantenedor", proyecto="X")
+    assert um.permission_level("dani", "carla") == "write"
+    assert um.permission_level("beto", "carla") == "read"
+    assert um.permission_level("carla", "ana") is None
+
+    um.assign_permission("ana", "beto", "write")
+    assert um.permission_level("beto", "ana") == "write"
+    assert um.direct_level("dani", "carla") is None
+
+
+def test_acl_recompiles_when_groups_change(um):
+    um.define_group("team", ["beto"])
+    um.grant_group("team", "write", repo="ana")
+    assert um.permission_level("beto", "ana") == "write"
+    assert um.revoke_group("team", repo="ana")
+    assert um.permission_level("beto", "ana") is None
+
+
+def test_group_cannot_contain_itself(um):
+    um.define_group("a", ["ana"])
+    um.define_group("b", ["@a"])
+    assert not um.define_group("a", ["@b"])
+    assert um.groups.load()["grupos"]["a"] == ["ana"]
@@ -0,0 +1,79 @@
+import os
+import shutil
+from conftest import write
+from core import object_store
+from core.object_store import hash_file
+
+TEMPORAL = os.path.join("repo_root", "ana", "temporal")
+PERMANENTE = os.path.join("repo_root", "ana", "permanente")
+
+
+def test_commit_file_to_directory_and_back(vc):
+    write(vc, "x", "archivo\n")
+    v1 = vc.commit()
+    os.remove(os.path.join(TEMPORAL, "x"))
+    write(vc, "x/y", "dentro\n")
+    v2 = vc.commit()
+    assert v2 is not None
+    assert os.path.isfile(os.path.join(PERMANENTE, "x", "y"))
+
+    vc.recover(v1)
+    assert os.path.isfile(os.path.join(TEMPORAL, "x"))
+    vc.recover(v2)
+    with open(os.path.join(TEMPORAL, "x", "y")) as f:
+        assert f.read() == "dentro\n"
+
+
+def test_update_replaces_file_sitting_where_a_directory_goes(vc):
+    write(vc, "docs/a.txt", "a\n")
+    vc.commit()
+    shutil.rmtree(os.path.join(TEMPORAL, "docs"))
+    write(vc, "docs", "estorbo\n")
+    vc.update()
+    with open(os.path.join(TEMPORAL, "docs", "a.txt")) as f:
+        assert f.read() == "a\n"
+
+
+def test_auto_mode_never_shares_inode_with_store(vc, store):
+    path = write(vc, "a.txt", "uno\n")
+    digest = hash_file(path)
+    version = vc.commit()
+    os.remove(path)
+    vc.update()
+    assert os.stat(path).st_ino != os.stat(store.object_path(digest)).st_ino
+    # Una escritura en sitio no altera el historial
+    with open(path, "a") as f:
+        f.write("dos\n")
+    assert store.read(digest) == b"uno\n"
+    assert vc.read_file(version, "a.txt") == b"uno\n"
+
+
+def test_hardlink_mode_links_to_copy_outside_store(vc, store):
+    vc.materialize_mode = "hardlink"
+    path = write(vc, "a.txt", "uno\n")
+    digest = hash_file(path)
+    vc.commit()
+    os.remove(path)
+    vc.update()
+    st = os.stat(path)
+    assert st.st_nlink > 1
+    assert st.st_ino != os.stat(store.object_path(digest)).st_ino
+    with open(path, "a") as f:
+        f.write("dos\n")
+    assert store.read(digest) == b"uno\n"
+
+
+def test_missing_packed_object_leaves_no_temp_file(vc, store, capsys):
+    write(vc, "a.txt", "primera\n")
+    v1 = vc.commit()
+    write(vc, "a.txt", "segunda\n")
+    vc.commit()
+    assert vc.pack(keep_recent=1) == 1
+    shutil.rmtree(store.pack_dir)
+    object_store._pack_readers.clear()
+
+    assert vc.recover(v1) is None
+    assert "No se pudo recuperar" in capsys.readouterr().out
+    assert not [n for n in os.listdir(TEMPORAL) if n.endswith(".tmp")]
+    with open(os.path.join(TEMPORAL, "a.txt")) as f:
+        assert f.read() == "segunda\n"
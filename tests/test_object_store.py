@@ -0,0 +1,52 @@
+import os
+import hashlib
+import pytest
+from conftest import write
+from core import chunking, object_store
+from core.object_store import ContentChangedError, ObjectStore, hash_file
+from core.work_index import WorkIndex
+
+
+def test_store_rejects_content_that_no_longer_matches(tmp_path):
+    store = ObjectStore(str(tmp_path / "repo"))
+    src = tmp_path / "a.txt"
+    src.write_bytes(b"antes")
+    digest = hash_file(str(src))
+    src.write_bytes(b"despues")
+    with pytest.raises(ContentChangedError):
+        store.store_file(str(src), digest)
+    assert not store.has(digest)
+    assert not os.listdir(os.path.join(store.root, digest[:2]))
+
+
+def test_chunked_store_rejects_changed_content(tmp_path, monkeypatch):
+    monkeypatch.setattr(object_store, "CHUNKED_MIN_SIZE", 1024)
+    monkeypatch.setattr(chunking, "CHUNK_MIN", 1024)
+    store = ObjectStore(str(tmp_path / "repo"))
+    src = tmp_path / "grande.bin"
+    src.write_bytes(os.urandom(64 * 1024))
+    esperado = hashlib.sha256(b"otro contenido").hexdigest()
+    with pytest.raises(ContentChangedError):
+        store.store_file(str(src), esperado)
+    assert not store.is_chunked(esperado)
+    assert store.store_file(str(src)) == hash_file(str(src))
+
+
+def test_commit_is_cancelled_if_a_file_changes_while_storing(vc, store, monkeypatch, capsys):
+    path = write(vc, "a.txt", "uno\n")
+    refresh = WorkIndex.refresh
+
+    def y_editar(self, *args, **kwargs):
+        resultado = refresh(self, *args, **kwargs)
+        # Edición entre el hash del índice y la copia al almacén
+        with open(path, "w") as f:
+            f.write("dos\n")
+        return resultado
+
+    monkeypatch.setattr(WorkIndex, "refresh", y_editar)
+    assert vc.commit() is None
+    assert "Commit cancelado" in capsys.readouterr().out
+    assert vc.list_versions() in (None, [])
+    monkeypatch.setattr(WorkIndex, "refresh", refresh)
+    version = vc.commit()
+    assert vc.read_file(version, "a.txt") == b"dos\n"
@@ -0,0 +1,103 @@
+import os
+import random
+import hashlib
+import pytest
+from conftest import write
+from core.object_store import read_manifest
+from core.pack import (
+    OBJ_DELTA, OBJ_FULL, PackReader, PackWriter, _read_varint, _write_varint, apply_delta, create_delta,
+)
+
+
+def sha(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+@pytest.mark.parametrize("n", [0, 1, 127, 128, 300, 2 ** 32, 2 ** 63 + 5])
+def test_varint_roundtrip(n):
+    codificado = _write_varint(n)
+    assert _read_varint(b"x" + codificado + b"y", 1) == (n, 1 + len(codificado))
+
+
+def test_delta_roundtrip_with_edits():
+    r = random.Random(0)
+    base = bytes(r.randrange(256) for _ in range(20000))
+    for _ in range(50):
+        target = bytearray(base)
+        for _ in range(r.randint(0, 5)):
+            i = r.randrange(len(target) + 1)
+            if r.random() < 0.5:
+                target[i:i] = bytes(r.randrange(256) for _ in range(r.randint(1, 100)))
+            else:
+                del target[i:i + r.randint(1, 100)]
+        target = bytes(target)
+        delta = create_delta(base, target)
+        assert apply_delta(base, delta) == target
+        assert len(delta) < len(target) // 2
+
+
+@pytest.mark.parametrize("base,target", [(b"", b""), (b"", b"abc"), (b"abc", b""), (b"a" * 15, b"a" * 40)])
+def test_delta_roundtrip_small(base, target):
+    assert apply_delta(base, create_delta(base, target)) == target
+
+
+def test_apply_delta_rejects_wrong_base():
+    delta = create_delta(b"0123456789abcdef" * 4, b"0123456789abcdef" * 5)
+    with pytest.raises(ValueError):
+        apply_delta(b"otra base", delta)
+
+
+def test_pack_writer_and_reader(tmp_path):
+    base = os.urandom(4096)
+    objetos = {sha(d): d for d in (b"uno", b"dos", base)}
+    editado = base[:100] + b"cambio" + base[100:]
+
+    writer = PackWriter(str(tmp_path))
+    for digest, data in objetos.items():
+        writer.add(digest, data)
+    assert writer.add(sha(editado), editado, sha(base), base)
+    pack_path = writer.finish()
+
+    reader = PackReader(pack_path)
+    assert reader.count == 4
+    assert list(reader.digests()) == sorted(list(objetos) + [sha(editado)])
+    for digest, data in objetos.items():
+        assert reader.read_entry(reader.find(digest)) == (OBJ_FULL, None, data)
+    tipo, base_digest, delta = reader.read_entry(reader.find(sha(editado)))
+    assert (tipo, base_digest) == (OBJ_DELTA, sha(base))
+    assert apply_delta(base, delta) == editado
+    assert reader.find(sha(b"ausente")) is None
+
+
+def test_pack_rewrite_copies_raw_entries(tmp_path):
+    writer = PackWriter(str(tmp_path))
+    writer.add(sha(b"conservar"), b"conservar")
+    writer.add(sha(b"descartar"), b"descartar")
+    reader = PackReader(writer.finish())
+
+    nuevo = PackWriter(str(tmp_path))
+    nuevo.add_raw(sha(b"conservar"), *reader.raw_entry(reader.find(sha(b"conservar"))))
+    copia = PackReader(nuevo.finish())
+    assert copia.count == 1
+    assert copia.read_entry(copia.find(sha(b"conservar")))[2] == b"conservar"
+
+
+def test_empty_writer_writes_nothing(tmp_path):
+    writer = PackWriter(str(tmp_path / "pack"))
+    assert writer.finish() is None
+    assert not os.path.exists(tmp_path / "pack")
+
+
+def test_pack_keeps_history_readable(vc, store):
+    versiones = []
+    for i in range(5):
+        write(vc, "a.txt", "línea común\n" * 200 + f"revisión {i}\n")
+        write(vc, f"solo_{i}.txt", f"{i}\n")
+        versiones.append(vc.commit())
+    assert vc.pack() > 0
+    assert os.listdir(store.pack_dir)
+    for i, version in enumerate(versiones):
+        manifest = read_manifest(os.path.join("repo_root", "ana", "versiones", version + ".json"))
+        for rel, entry in manifest["archivos"].items():
+            assert hashlib.sha256(store.read(entry["hash"])).hexdigest() == entry["hash"]
+        assert vc.read_file(version, "a.txt").endswith(f"revisión {i}\n".encode())
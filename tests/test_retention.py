@@ -0,0 +1,106 @@
+import os
+import hashlib
+import datetime
+from conftest import write
+from core.retention import RetentionPolicy
+
+AHORA = datetime.datetime(2025, 6, 30, 12, 0)
+
+
+def entradas_cada(horas, cantidad, bytes_=10):
+    # Versiones en orden cronológico, la última en AHORA
+    return [
+        {"version": f"v{i}", "fecha": (AHORA - datetime.timedelta(hours=horas * (cantidad - 1 - i))).isoformat(),
+         "bytes": bytes_}
+        for i in range(cantidad)
+    ]
+
+
+def conservadas(policy, entradas, **kwargs):
+    eliminar = set(policy.select(entradas, ahora=AHORA, **kwargs))
+    return [e["version"] for e in entradas if e["version"] not in eliminar]
+
+
+def test_empty_policy_keeps_everything():
+    entradas = entradas_cada(24, 10)
+    assert RetentionPolicy().is_empty()
+    assert RetentionPolicy().select(entradas, ahora=AHORA) == []
+    assert RetentionPolicy().select([]) == []
+
+
+def test_ultimas():
+    assert conservadas(RetentionPolicy(ultimas=3), entradas_cada(1, 10)) == ["v7", "v8", "v9"]
+
+
+def test_diarias_keep_latest_of_each_day():
+    # Cada 6 horas: el último día va de v7 (0:00) a v9 (12:00) y v6 es de las 18:00 del anterior
+    entradas = entradas_cada(6, 10)
+    assert conservadas(RetentionPolicy(diarias=2), entradas) == ["v6", "v9"]
+
+
+def test_semanales_and_mensuales():
+    entradas = entradas_cada(24 * 10, 12)
+    semanas = conservadas(RetentionPolicy(semanales=3), entradas)
+    assert semanas == ["v9", "v10", "v11"]
+    meses = conservadas(RetentionPolicy(mensuales=2), entradas)
+    fechas = [datetime.datetime.fromisoformat(e["fecha"]) for e in entradas if e["version"] in meses]
+    assert len({(f.year, f.month) for f in fechas}) == 2
+    assert meses[-1] == "v11"
+
+
+def test_rules_are_added():
+    entradas = entradas_cada(6, 10)
+    assert conservadas(RetentionPolicy(ultimas=2, diarias=2), entradas) == ["v6", "v8", "v9"]
+
+
+def test_max_dias_discards_old_but_keeps_head():
+    entradas = entradas_cada(24, 10)
+    assert conservadas(RetentionPolicy(ultimas=10, max_dias=3), entradas) == ["v6", "v7", "v8", "v9"]
+    viejas = entradas_cada(24, 3)
+    for e in viejas:
+        e["fecha"] = (AHORA - datetime.timedelta(days=100)).isoformat()
+    assert conservadas(RetentionPolicy(ultimas=3, max_dias=1), viejas) == ["v2"]
+
+
+def test_head_is_always_kept():
+    entradas = entradas_cada(24, 5)
+    entradas[-1]["fecha"] = None
+    # Sin fecha no cuenta para ningún día, pero sigue siendo la última versión
+    assert conservadas(RetentionPolicy(diarias=2), entradas) == ["v2", "v3", "v4"]
+    assert conservadas(RetentionPolicy(max_bytes=0, ultimas=5), entradas) == ["v4"]
+
+
+def test_max_bytes_counts_shared_objects_once():
+    entradas = entradas_cada(24, 4)
+    comun = {"comun.bin": {"hash": "c", "size": 100}}
+    archivos = {f"v{i}": dict(comun, **{f"{i}.txt": {"hash": f"h{i}", "size": 10}}) for i in range(4)}
+    policy = RetentionPolicy(ultimas=4, max_bytes=120)
+    assert conservadas(policy, entradas, archivos_de=archivos.get) == ["v2", "v3"]
+    # Sin manifiesto se usa el tamaño del registro
+    assert conservadas(policy, entradas_cada(24, 4, bytes_=50)) == ["v2", "v3"]
+
+
+def test_policy_dict_roundtrip():
+    policy = RetentionPolicy(ultimas=5, mensuales=12)
+    assert policy.to_dict() == {"ultimas": 5, "mensuales": 12}
+    assert RetentionPolicy.from_dict(policy.to_dict()).to_dict() == policy.to_dict()
+
+
+def test_reused_packed_content_survives_prune(vc, store):
+    path = write(vc, "reusado.txt", "contenido que vuelve\n")
+    vc.commit()
+    os.remove(path)
+    write(vc, "otro.txt", "otro\n")
+    vc.commit()
+    vc.pack(keep_recent=1)
+    assert store.is_packed(hashlib.sha256(b"contenido que vuelve\n").hexdigest())
+    write(vc, "reusado.txt", "contenido que vuelve\n")
+    # Un commit en curso ya guardó el objeto pero todavía no escribió su manifiesto
+    digest = store.store_file(path)
+    assert store.is_loose(digest)
+    vc.prune(RetentionPolicy(ultimas=1))
+    # La poda reescribió el pack sin ese contenido: solo queda la copia suelta
+    store.refresh_packs()
+    assert not store.is_packed(digest) and store.is_loose(digest)
+    version = vc.commit()
+    assert vc.read_file(version, "reusado.txt") == b"contenido que vuelve\n"
@@ -0,0 +1,91 @@
+import io
+import os
+import random
+import pytest
+from conftest import write
+from core import search_index, version_log
+from core.retention import RetentionPolicy
+from core.search_index import matching_lines
+
+
+def esperado(data, texto, ignorar_mayusculas=False):
+    lineas = data.decode("utf-8", errors="replace").split("\n")
+    if ignorar_mayusculas:
+        texto = texto.lower()
+    return [(i, l.rstrip("\r")) for i, l in enumerate(lineas, 1)
+            if texto in (l.lower() if ignorar_mayusculas else l)]
+
+
+@pytest.mark.parametrize("bloque", [1, 2, 7, 64])
+def test_matches_across_block_boundaries(monkeypatch, bloque):
+    monkeypatch.setattr(search_index, "SCAN_BLOCK", bloque)
+    r = random.Random(bloque)
+    for _ in range(100):
+        data = "".join(r.choice(["a", "b", "ñ", "TO", "do", "\n", "\r\n"]) for _ in range(r.randint(0, 80)))
+        data = data.encode()
+        for texto, i in (("todo", True), ("ab", False), ("ñb", False), ("a", False)):
+            assert matching_lines(io.BytesIO(data), texto, i) == esperado(data, texto, i)
+
+
+def test_long_lines_are_truncated(monkeypatch):
+    monkeypatch.setattr(search_index, "SCAN_BLOCK", 100)
+    monkeypatch.setattr(search_index, "MAX_LINE", 50)
+    data = b"x" * 1000 + b"aguja" + b"y" * 1000 + b"\notra\naguja\n"
+    assert matching_lines(io.BytesIO(data), "aguja") == [(1, "x" * 50), (3, "aguja")]
+
+
+def test_search_in_versions_and_working_folder(vc):
+    write(vc, "notas.txt", "uno\nTODO: revisar\n")
+    primera = vc.commit()
+    write(vc, "notas.txt", "uno\ndos\n")
+    write(vc, "otro.txt", "pendiente: todo\n")
+    vc.commit()
+    resultados = vc.search("TODO")
+    assert [(r["ruta"], r["linea"]) for r in resultados] == [("notas.txt", 2)]
+    assert resultados[0]["versiones"] == [primera]
+    temporal = vc.search("todo", alcance="temporal", ignorar_mayusculas=True)
+    assert sorted(r["ruta"] for r in temporal) == ["otro.txt"]
+
+
+def test_case_insensitive_search_with_accents(vc):
+    write(vc, "notas.txt", "AÑO NUEVO\nÉpoca\n")
+    vc.commit()
+    assert [r["linea"] for r in vc.search("año", ignorar_mayusculas=True)] == [1]
+    assert [r["linea"] for r in vc.search("época", ignorar_mayusculas=True)] == [2]
+    assert vc.search("año") == []
+
+
+def test_converted_legacy_version_keeps_history_order(vc):
+    write(vc, "a.txt", "buscado\n")
+    v1 = vc.commit()
+    write(vc, "a.txt", "otra cosa\n")
+    v2 = vc.commit()
+    assert [r["versiones"] for r in vc.search("buscado")] == [[v1]]
+
+    # Una versión antigua (copia completa) anterior a las demás, que pack convierte
+    antigua = "v_20000101000000"
+    os.makedirs(os.path.join("repo_root", "ana", "versiones", antigua))
+    with open(os.path.join("repo_root", "ana", "versiones", antigua, "a.txt"), "w") as f:
+        f.write("buscado antes\n")
+    os.remove(os.path.join("repo_root", "ana", "historial.jsonl"))
+    version_log._logs.clear()
+    vc.pack()
+    assert vc.list_versions()[0] == antigua
+
+    resultados = vc.search("buscado")
+    assert sorted(r["versiones"] for r in resultados) == [[antigua], [v1]]
+    assert vc.search("buscado", alcance="ultima") == []
+    assert vc.search("otra", alcance="ultima")[0]["versiones"] == [v2]
+
+
+def test_search_after_prune(vc):
+    versiones = []
+    write(vc, "fija.txt", "fija\n")
+    for i in range(3):
+        write(vc, "a.txt", f"revisión {i}\n")
+        versiones.append(vc.commit())
+    assert vc.search("fija")[0]["versiones"] == versiones
+    vc.prune(RetentionPolicy(ultimas=2), recolectar=False)
+    assert vc.search("fija")[0]["versiones"] == versiones[1:]
+    assert vc.search("fija", alcance="ultima")[0]["versiones"] == versiones[2:]
+    assert [r["versiones"] for r in vc.search("revisión 1")] == [[versiones[1]]]
@@ -0,0 +1,62 @@
+import os
+import pytest
+from conftest import write
+from core.object_store import read_manifest
+from core.sparse import SparseProfile
+
+TEMPORAL = os.path.join("repo_root", "ana", "temporal")
+
+
+def archivos(version):
+    return read_manifest(os.path.join("repo_root", "ana", "versiones", version + ".json"))["archivos"]
+
+
+def test_profile_matching():
+    profile = SparseProfile(["docs", "src/**/*.py", "!src/viejo"])
+    assert profile.matches("docs/a.md")
+    assert profile.matches("src/app.py") and profile.matches("src/x/y.py")
+    assert not profile.matches("src/viejo/z.py")
+    assert not profile.matches("documentos/a.md")
+    assert SparseProfile().matches("cualquier/cosa")
+
+
+@pytest.fixture
+def repo(vc):
+    write(vc, "docs/a.md", "a\n")
+    write(vc, "src/app.py", "app\n")
+    write(vc, "README", "léame\n")
+    vc.commit()
+    return vc
+
+
+def test_commit_keeps_files_outside_profile(repo):
+    repo.update(["docs"])
+    assert not os.path.exists(os.path.join(TEMPORAL, "src"))
+    write(repo, "docs/a.md", "a2\n")
+    assert set(archivos(repo.commit())) == {"docs/a.md", "src/app.py", "README"}
+
+
+@pytest.mark.parametrize("cambio", [{"patrones": ["src"]}, {"limpiar": True}])
+def test_unapplied_profile_change_does_not_drop_files(repo, cambio):
+    # update --rutas docs, luego sparse src (o --limpiar) sin update: el commit
+    # debe completar con el perfil aplicado, no con el guardado
+    repo.update(["docs"])
+    repo.sparse(**cambio)
+    write(repo, "docs/b.md", "b\n")
+    assert set(archivos(repo.commit())) == {"docs/a.md", "docs/b.md", "src/app.py", "README"}
+    assert repo.status() == {"nuevos": [], "modificados": [], "eliminados": []}
+
+
+def test_update_applies_new_profile(repo):
+    repo.update(["docs"])
+    repo.sparse(["src"])
+    repo.update()
+    assert os.path.exists(os.path.join(TEMPORAL, "src", "app.py"))
+    assert not os.path.exists(os.path.join(TEMPORAL, "docs"))
+    assert set(archivos(repo.commit())) == {"docs/a.md", "src/app.py", "README"}
+
+
+def test_deleting_inside_profile_is_committed(repo):
+    repo.update(["docs"])
+    os.remove(os.path.join(TEMPORAL, "docs", "a.md"))
+    assert set(archivos(repo.commit())) == {"src/app.py", "README"}
@@ -0,0 +1,39 @@
+import os
+from conftest import write
+from core.version_log import LOG_FILE, VersionLog, version_order
+
+REPO = os.path.join("repo_root", "ana")
+
+
+def test_version_order_is_numeric_on_suffix():
+    nombres = ["v_20250101120000_10", "v_20250101120000_2", "v_20250101120000", "v_20250101115959_11"]
+    assert sorted(nombres, key=version_order) == [
+        "v_20250101115959_11", "v_20250101120000", "v_20250101120000_2", "v_20250101120000_10",
+    ]
+
+
+def test_same_second_commits_survive_pack_and_rebuild(vc):
+    # Más de diez commits en el mismo segundo reciben los sufijos _1 ... _11
+    for i in range(12):
+        write(vc, "a.txt", f"rev {i}\n")
+        ultima = vc.commit()
+    assert vc.pack() >= 0
+    assert VersionLog(REPO).head()["version"] == ultima
+
+    os.remove(os.path.join(REPO, LOG_FILE))
+    assert VersionLog(REPO).head()["version"] == ultima
+
+    os.remove(os.path.join(REPO, "temporal", "a.txt"))
+    vc.update()
+    with open(os.path.join(REPO, "temporal", "a.txt")) as f:
+        assert f.read() == "rev 11\n"
+
+
+def test_pack_does_not_rewrite_existing_log(vc):
+    write(vc, "a.txt", "uno\n")
+    vc.commit()
+    write(vc, "a.txt", "dos\n")
+    vc.commit()
+    antes = os.stat(os.path.join(REPO, LOG_FILE)).st_ino
+    vc.pack()
+    assert os.stat(os.path.join(REPO, LOG_FILE)).st_ino == antes
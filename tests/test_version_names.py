@@ -0,0 +1,46 @@
+import os
+import pytest
+from conftest import write
+from core.context_manager import Session
+from core.version_control import VersionControl
+from core.version_log import valid_name
+
+
+@pytest.mark.parametrize("nombre", ["", "..", "../x", "a/b", "a\\b", "v_1/../../x", None])
+def test_invalid_names(nombre):
+    assert not valid_name(nombre)
+
+
+@pytest.fixture
+def beto(vc):
+    # carol tiene una versión privada; beto solo puede leer el repositorio de ana
+    um = vc.um
+    for nombre in ("beto", "carol"):
+        um.create_user(nombre)
+    um.assign_permission("ana", "beto", "read")
+    carol = VersionControl(Session("carol", "carol"), um)
+    write(carol, "privado.txt", "secreto\n")
+    privada = carol.commit()
+    write(vc, "publico.txt", "hola\n")
+    vc.commit()
+    return VersionControl(Session("beto", "ana"), um), f"../../carol/versiones/{privada}"
+
+
+def test_files_rejects_other_repositories(beto):
+    vc, nombre = beto
+    assert vc.list_files_in_version(nombre) == []
+
+
+def test_recover_rejects_other_repositories(beto):
+    vc, nombre = beto
+    temporal = vc.ctx.get_context()["path"]
+    assert vc.recover(nombre) is None
+    assert vc.recover(nombre, "privado.txt", is_file=True) is None
+    assert not os.path.exists(temporal) or not any("privado" in n for n in os.listdir(temporal))
+
+
+def test_read_views_reject_other_repositories(beto):
+    vc, nombre = beto
+    assert vc.stat_file(nombre) is None
+    assert vc.read_file(nombre, "privado.txt") is None
+    assert vc.diff(nombre) is None
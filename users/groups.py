@@ -0,0 +1,161 @@
+import os
+import threading
+from utils.atomic_io import atomic_write_json, read_json
+from utils import metrics
+
+GROUPS_FILE = "data/groups.json"
+PROJECTS_FILE = "data/projects.json"
+
+# Nivel numérico de cada permiso; en las tablas compiladas 0 = sin permiso
+LEVELS = {None: 0, "read": 1, "write": 2}
+LEVEL_NAMES = (None, "read", "write")
+BASE_ROLES = {"read": "read", "write": "write"}
+ALL_REPOS = "*"
+
+# ACL compiladas, una por archivo de grupos; se recompilan cuando cambia la
+# firma (stat) de groups.json o projects.json.
+_acls = {}
+_acl_lock = threading.Lock()
+
+
+def _signature(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def flatten_groups(grupos):
+    # grupo -> conjunto de usuarios, resolviendo los grupos anidados ("@otro")
+    resueltos = {}
+
+    def resolver(nombre, camino):
+        # Devuelve (usuarios, completo). Si se cortó un ciclo (groups.json
+        # editado a mano) el resultado depende del camino y no se guarda.
+        if nombre in resueltos:
+            return resueltos[nombre], True
+        usuarios = set()
+        completo = True
+        for miembro in grupos.get(nombre, ()):
+            if not miembro.startswith("@"):
+                usuarios.add(miembro)
+            elif miembro[1:] in camino:
+                completo = False
+            elif miembro[1:] in grupos:
+                anidados, anidado_completo = resolver(miembro[1:], camino | {miembro[1:]})
+                usuarios |= anidados
+                completo = completo and anidado_completo
+        if completo:
+            resueltos[nombre] = usuarios
+        return usuarios, completo
+
+    for nombre in grupos:
+        if nombre not in resueltos:
+            resueltos[nombre] = resolver(nombre, {nombre})[0]
+    return resueltos
+
+
+class CompiledACL:
+    # Permisos que se obtienen por grupos. Cada usuario miembro de algún grupo
+    # tiene un número y cada conjunto distinto de reglas, una tabla (bytearray)
+    # con el nivel de cada usuario. Los repositorios con las mismas reglas, por
+    # ejemplo todos los de un proyecto, comparten la tabla: consultar un
+    # permiso son dos búsquedas en diccionarios y un acceso por índice.
+    def __init__(self, grupos, reglas, proyectos, roles=None):
+        roles = dict(BASE_ROLES, **(roles or {}))
+        miembros = flatten_groups(grupos)
+        self.ids = {}
+        for nombre in sorted(miembros):
+            for usuario in sorted(miembros[nombre]):
+                self.ids.setdefault(usuario, len(self.ids))
+
+        compiladas = []
+        por_repo = {}
+        generales = []
+        for regla in reglas:
+            nivel = LEVELS.get(roles.get(regla.get("rol")))
+            usuarios = miembros.get(regla.get("grupo"))
+            if not nivel or not usuarios:
+                continue
+            indice = len(compiladas)
+            compiladas.append(([self.ids[u] for u in usuarios], nivel))
+            if regla.get("repo") == ALL_REPOS:
+                generales.append(indice)
+            elif regla.get("proyecto"):
+                for repo in proyectos.get(regla["proyecto"], {}).get("repos", ()):
+                    por_repo.setdefault(repo, []).append(indice)
+            elif regla.get("repo"):
+                por_repo.setdefault(regla["repo"], []).append(indice)
+
+        self.tablas = []
+        claves = {}
+
+        def tabla(indices):
+            clave = tuple(sorted(set(indices)))
+            if clave not in claves:
+                niveles = bytearray(len(self.ids))
+                for i in clave:
+                    uids, nivel = compiladas[i]
+                    for uid in uids:
+                        if niveles[uid] < nivel:
+                            niveles[uid] = nivel
+                claves[clave] = len(self.tablas)
+                self.tablas.append(niveles)
+            return claves[clave]
+
+        self.general = tabla(generales)
+        self.repos = {repo: tabla(indices + generales) for repo, indices in por_repo.items()}
+
+    def level(self, usuario, repo):
+        uid = self.ids.get(usuario)
+        if uid is None:
+            return None
+        return LEVEL_NAMES[self.tablas[self.repos.get(repo, self.general)][uid]]
+
+
+class GroupStore:
+    # data/groups.json: {"grupos": {nombre: [usuario | "@grupo", ...]},
+    #                    "roles": {nombre: "read" | "write"},
+    #                    "reglas": [{"grupo", "rol", "repo" | "proyecto"}, ...]}
+    # data/projects.json: {nombre: {"repos": [dueño, ...]}}
+    def __init__(self, path=GROUPS_FILE, projects_path=PROJECTS_FILE):
+        self.path = path
+        self.projects_path = projects_path
+        self.key = os.path.abspath(path)
+
+    def signature(self):
+        return (_signature(self.path), _signature(self.projects_path))
+
+    def load(self):
+        datos = read_json(self.path, {}, strict=True)
+        return {
+            "grupos": datos.get("grupos", {}),
+            "roles": datos.get("roles", {}),
+            "reglas": datos.get("reglas", []),
+        }
+
+    def load_projects(self):
+        return read_json(self.projects_path, {}, strict=True) or {}
+
+    def save(self, datos):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        atomic_write_json(self.path, datos, indent=2)
+
+    def save_projects(self, proyectos):
+        os.makedirs(os.path.dirname(self.projects_path) or ".", exist_ok=True)
+        atomic_write_json(self.projects_path, proyectos, indent=2)
+
+
+def compiled_acl(store):
+    firma = store.signature()
+    # Leer una entrada del dict es atómico: no hace falta el lock para consultar
+    actual = _acls.get(store.key)
+    if actual is not None and actual[0] == firma:
+        return actual[1]
+    datos = store.load()
+    acl = CompiledACL(datos["grupos"], datos["reglas"], store.load_projects(), datos["roles"])
+    with _acl_lock:
+        _acls[store.key] = (firma, acl)
+    metrics.inc("acl_compilaciones")
+    return acl
@@ -0,0 +1,189 @@
+import os
+import json
+import logging
+import threading
+from utils.atomic_io import atomic_write_json, read_json
+
+DATA_FILE = "data/users.json"
+DB_FILE = "data/users.db"
+BACKEND_ENV = "VCS_USERS_BACKEND"
+
+# Serializa la creación (y migración) de la base entre hilos
+_schema_lock = threading.RLock()
+
+
+class JsonUserStorage:
+    def __init__(self, path=DATA_FILE):
+        # Sin usuarios todavía el archivo no existe: se crea con la primera
+        # escritura. read_json completa una escritura interrumpida por una caída.
+        self.path = path
+
+    @property
+    def key(self):
+        return ("json", os.path.abspath(self.path))
+
+    def signature(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def load(self):
+        return read_json(self.path, {}, strict=True)
+
+    def save_all(self, users):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        atomic_write_json(self.path, users, indent=2)
+
+    # El archivo JSON no admite escrituras parciales: cada cambio lo reescribe
+    def add_user(self, username):
+        users = self.load()
+        users[username] = {"permisos": {}}
+        self.save_all(users)
+
+    def set_permission(self, target, user, level):
+        users = self.load()
+        users[target]["permisos"][user] = level
+        self.save_all(users)
+
+    def delete_permission(self, target, user):
+        users = self.load()
+        users[target]["permisos"].pop(user, None)
+        self.save_all(users)
+
+    def apply_batch(self, nuevos, permisos):
+        # nuevos: usuarios a crear; permisos: (destino, usuario, nivel o None
+        # para quitarlo). Una sola lectura y una sola escritura del archivo.
+        users = self.load()
+        for username in nuevos:
+            users.setdefault(username, {"permisos": {}})
+        for target, user, level in permisos:
+            if level is None:
+                users[target]["permisos"].pop(user, None)
+            else:
+                users[target]["permisos"][user] = level
+        self.save_all(users)
+
+
+class SqliteUserStorage:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            name TEXT PRIMARY KEY
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS permissions (
+            target TEXT NOT NULL,
+            user TEXT NOT NULL,
+            level TEXT NOT NULL CHECK (level IN ('read', 'write')),
+            PRIMARY KEY (target, user)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS permissions_user ON permissions(user);
+    """
+
+    def __init__(self, path=DB_FILE, migrate_from=DATA_FILE):
+        # La base se abre (y se crea o migra) con la primera consulta
+        self.path = path
+        self.migrate_from = migrate_from
+        self._local = threading.local()
+
+    @property
+    def key(self):
+        return ("sqlite", os.path.abspath(self.path))
+
+    def _conn(self):
+        # Una conexión por hilo; WAL permite lectores concurrentes con un escritor
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            import sqlite3
+
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with _schema_lock:
+                nueva = not os.path.exists(self.path)
+                conn = sqlite3.connect(self.path, timeout=30)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                with conn:
+                    conn.executescript(self.SCHEMA)
+                self._local.conn = conn
+                if nueva and self.migrate_from and os.path.exists(self.migrate_from):
+                    migrate_json_to_sqlite(self.migrate_from, self)
+        return conn
+
+    def signature(self):
+        # Cada commit en modo WAL modifica el archivo -wal y cada checkpoint la base
+        firma = []
+        for path in (self.path, self.path + "-wal"):
+            try:
+                st = os.stat(path)
+                firma.append((st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                firma.append(None)
+        return tuple(firma)
+
+    def load(self):
+        conn = self._conn()
+        users = {name: {"permisos": {}} for (name,) in conn.execute("SELECT name FROM users")}
+        for target, user, level in conn.execute("SELECT target, user, level FROM permissions"):
+            users.setdefault(target, {"permisos": {}})["permisos"][user] = level
+        return users
+
+    def _write(self, statements):
+        with self._conn() as conn:
+            for sql, params in statements:
+                conn.execute(sql, params)
+
+    def save_all(self, users):
+        statements = [("DELETE FROM permissions", ()), ("DELETE FROM users", ())]
+        statements += [("INSERT INTO users(name) VALUES (?)", (name,)) for name in users]
+        for target, data in users.items():
+            for user, level in data.get("permisos", {}).items():
+                statements.append(
+                    ("INSERT INTO permissions(target, user, level) VALUES (?, ?, ?)", (target, user, level))
+                )
+        self._write(statements)
+
+    def add_user(self, username):
+        self._write([("INSERT OR IGNORE INTO users(name) VALUES (?)", (username,))])
+
+    def set_permission(self, target, user, level):
+        self._write([(
+            "INSERT INTO permissions(target, user, level) VALUES (?, ?, ?) "
+            "ON CONFLICT(target, user) DO UPDATE SET level = excluded.level",
+            (target, user, level),
+        )])
+
+    def delete_permission(self, target, user):
+        self._write([("DELETE FROM permissions WHERE target = ? AND user = ?", (target, user))])
+
+    def apply_batch(self, nuevos, permisos):
+        # Todo en una transacción: o se aplica el lote completo o nada. Cada
+        # par (destino, usuario) aparece una sola vez en permisos.
+        with self._conn() as conn:
+            conn.executemany("INSERT OR IGNORE INTO users(name) VALUES (?)", ((u,) for u in nuevos))
+            conn.executemany(
+                "INSERT INTO permissions(target, user, level) VALUES (?, ?, ?) "
+                "ON CONFLICT(target, user) DO UPDATE SET level = excluded.level",
+                [p for p in permisos if p[2] is not None],
+            )
+            conn.executemany(
+                "DELETE FROM permissions WHERE target = ? AND user = ?",
+                [(target, user) for target, user, level in permisos if level is None],
+            )
+
+
+def migrate_json_to_sqlite(json_path=DATA_FILE, storage=None):
+    storage = storage or SqliteUserStorage(migrate_from=None)
+    with open(json_path, "r") as f:
+        users = json.load(f)
+    storage.save_all(users)
+    logging.info(f"Migrados {len(users)} usuarios de {json_path} a {storage.path}")
+    return storage
+
+
+def make_storage(backend=None):
+    backend = backend or os.environ.get(BACKEND_ENV, "json")
+    if backend == "json":
+        return JsonUserStorage()
+    if backend == "sqlite":
+        return SqliteUserStorage()
+    raise ValueError(f"Backend de usuarios desconocido: {backend}")
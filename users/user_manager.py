@@ -1,60 +1,183 @@
 import os
+import copy
 import json
 import logging
 import shutil
+import threading
+from users.storage import make_storage
+from users.groups import LEVELS, ALL_REPOS, GroupStore, compiled_acl, flatten_groups
+from utils import metrics
 
-DATA_FILE = "data/users.json"
 REPO_ROOT = "repo_root"
 
+# Cachés compartidas por todas las instancias del proceso, una por almacenamiento.
+# Se invalidan cuando cambia la firma (stat) del archivo de datos.
+_caches = {}
+_cache_lock = threading.Lock()
+
+
+@metrics.register
+def _cache_metrics():
+    with _cache_lock:
+        aciertos = sum(c["aciertos"] for c in _caches.values())
+        fallos = sum(c["fallos"] for c in _caches.values())
+    return [
+        ("cache", {"cache": "usuarios", "resultado": "acierto"}, aciertos),
+        ("cache", {"cache": "usuarios", "resultado": "fallo"}, fallos),
+    ]
+
+
+def _same_rule(regla, grupo, destino):
+    return regla.get("grupo") == grupo and all(regla.get(k) == v for k, v in destino.items())
+
+
+# Errores de validación que se muestran de un lote rechazado
+MAX_ERRORS_SHOWN = 20
+
+
+def _invalid_name(nombre):
+    if not nombre or not nombre.strip():
+        return "nombre vacío"
+    if nombre != nombre.strip() or nombre in (".", "..") or "/" in nombre or os.sep in nombre:
+        return "nombre inválido"
+    return None
+
+
+def _read_rows(path):
+    if path.lower().endswith(".csv"):
+        import csv
+
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            return list(csv.DictReader(f))
+    filas = []
+    with open(path, "r", encoding="utf-8") as f:
+        for numero, linea in enumerate(f, 1):
+            if not linea.strip():
+                continue
+            fila = json.loads(linea)
+            if not isinstance(fila, dict):
+                raise ValueError(f"línea {numero}: se esperaba un objeto")
+            filas.append(fila)
+    return filas
+
+
+def _create_skeletons(nuevos, compartidas, eliminadas):
+    # Carpetas de los usuarios nuevos y temporales compartidas en una sola
+    # pasada: mkdir directo, sin que makedirs revise cada nivel de la ruta.
+    os.makedirs(REPO_ROOT, exist_ok=True)
+    carpetas = []
+    for nombre in nuevos:
+        base = os.path.join(REPO_ROOT, nombre)
+        carpetas += [base] + [os.path.join(base, sub) for sub in ("permanente", "temporal", "versiones")]
+    carpetas += [os.path.join(REPO_ROOT, dueno, f"temp_{usuario}") for dueno, usuario in compartidas]
+    for carpeta in carpetas:
+        try:
+            os.mkdir(carpeta)
+        except FileExistsError:
+            pass
+        except FileNotFoundError:
+            # Usuario antiguo sin carpeta propia
+            os.makedirs(carpeta, exist_ok=True)
+    for dueno, usuario in eliminadas:
+        shutil.rmtree(os.path.join(REPO_ROOT, dueno, f"temp_{usuario}"), ignore_errors=True)
+
+
+def _build_index(users):
+    # destino -> usuario -> nivel ("read" / "write"); comparte los dicts de users
+    return {target: data.setdefault("permisos", {}) for target, data in users.items()}
+
 class UserManager:
-    def __init__(self):
-        os.makedirs("data", exist_ok=True)
-        os.makedirs(REPO_ROOT, exist_ok=True)
-        if not os.path.exists(DATA_FILE):
-            with open(DATA_FILE, "w") as f:
-                json.dump({}, f)
-        logging.info("Inicializado UserManager con estructura de carpetas.")
+    def __init__(self, storage=None, groups=None):
+        # Las carpetas de repo_root se crean al dar de alta usuarios o permisos
+        self.storage = storage or make_storage()
+        self.groups = groups or GroupStore()
+
+    def _cached(self):
+        firma = self.storage.signature()
+        with _cache_lock:
+            cache = _caches.setdefault(
+                self.storage.key, {"firma": None, "users": {}, "indice": {}, "aciertos": 0, "fallos": 0}
+            )
+            if firma is None or firma != cache["firma"]:
+                cache["fallos"] += 1
+                users = self.storage.load()
+                cache["users"] = users
+                cache["indice"] = _build_index(users)
+                cache["firma"] = firma
+            else:
+                cache["aciertos"] += 1
+            return cache
+
+    def _write(self, operacion, aplicar):
+        # Ejecuta la escritura en el almacenamiento y aplica el mismo cambio a la
+        # caché, siempre que estuviera al día antes de escribir.
+        cache = self._cached()
+        firma_previa = cache["firma"]
+        operacion()
+        with _cache_lock:
+            if firma_previa is not None and firma_previa == cache["firma"]:
+                aplicar(cache)
+                cache["firma"] = self.storage.signature()
+            else:
+                cache["firma"] = None
 
     def load_users(self):
-        try:
-            with open(DATA_FILE, "r") as f:
-                return json.load(f)
-        except json.JSONDecodeError as e:
-            logging.error(f"Error cargando usuarios: {e}")
-            return {}
+        # Copia para que quien la modifique antes de save_users no altere la caché
+        return copy.deepcopy(self._cached()["users"])
 
+    @metrics.timed("user_manager")
     def save_users(self, users):
-        with open(DATA_FILE, "w") as f:
-            json.dump(users, f, indent=2)
+        def aplicar(cache):
+            cache["users"] = copy.deepcopy(users)
+            cache["indice"] = _build_index(cache["users"])
+
+        self._write(lambda: self.storage.save_all(users), aplicar)
         logging.info("Usuarios guardados exitosamente.")
 
+    def user_exists(self, username):
+        return username in self._cached()["users"]
+
+    def direct_level(self, current_user, target_user):
+        # Solo el permiso asignado directamente, sin contar los grupos
+        return self._cached()["indice"].get(target_user, {}).get(current_user)
+
+    def permission_level(self, current_user, target_user):
+        # El mayor entre el permiso directo y el que dan los grupos
+        directo = self._cached()["indice"].get(target_user, {}).get(current_user)
+        if directo == "write":
+            return directo
+        por_grupo = compiled_acl(self.groups).level(current_user, target_user)
+        return por_grupo if LEVELS[por_grupo] > LEVELS[directo] else directo
+
+    @metrics.timed("user_manager")
     def create_user(self, username):
-        users = self.load_users()
-        if username in users:
+        if self.user_exists(username):
             print(f"El usuario '{username}' ya existe.")
             return
 
-        users[username] = {
-            "permisos": {}
-        }
-
         base_path = os.path.join(REPO_ROOT, username)
         os.makedirs(os.path.join(base_path, "permanente"), exist_ok=True)
         os.makedirs(os.path.join(base_path, "temporal"), exist_ok=True)
         os.makedirs(os.path.join(base_path, "versiones"), exist_ok=True)
 
-        self.save_users(users)
+        def aplicar(cache):
+            cache["users"][username] = {"permisos": {}}
+            cache["indice"][username] = cache["users"][username]["permisos"]
+
+        self._write(lambda: self.storage.add_user(username), aplicar)
+        logging.info(f"Usuario '{username}' creado.")
         print(f"Usuario '{username}' creado con éxito.")
+        return True
 
     def list_users(self):
-        users = self.load_users()
+        users = self._cached()["users"]
         print("Usuarios registrados:")
         for u in users:
             print(f"- {u}")
 
+    @metrics.timed("user_manager")
     def assign_permission(self, from_user, to_user, permiso):
-        users = self.load_users()
-        if from_user not in users or to_user not in users:
+        if not self.user_exists(from_user) or not self.user_exists(to_user):
             print("Uno o ambos usuarios no existen.")
             return
         if from_user == to_user:
@@ -64,38 +187,42 @@ class UserManager:
             print("Permiso inválido. Use 'read' o 'write'.")
             return
 
-        users[from_user]["permisos"][to_user] = permiso
-        self.save_users(users)
+        def aplicar(cache):
+            cache["indice"][from_user][to_user] = permiso
+
+        self._write(lambda: self.storage.set_permission(from_user, to_user, permiso), aplicar)
 
         # Crear carpeta temporal compartida
         temp_folder = os.path.join(REPO_ROOT, from_user, f"temp_{to_user}")
         os.makedirs(temp_folder, exist_ok=True)
 
         print(f"Permiso '{permiso}' otorgado de {from_user} a {to_user}.")
+        return True
 
+    @metrics.timed("user_manager")
     def remove_permission(self, from_user, to_user, permiso):
-        users = self.load_users()
-
         # Validaciones básicas
-        if from_user not in users:
+        if not self.user_exists(from_user):
             print(f"El usuario '{from_user}' no existe.")
             return
-        if to_user not in users:
+        if not self.user_exists(to_user):
             print(f"El usuario '{to_user}' no existe.")
             return
         if permiso not in ("read", "write"):
             print("Permiso inválido. Use 'read' o 'write'.")
             return
 
-        current_perm = users[from_user]["permisos"].get(to_user)
+        current_perm = self.direct_level(to_user, from_user)
         if not current_perm:
             print(f"{to_user} no tiene permisos sobre el repositorio de {from_user}.")
             return
 
         # Si tiene el permiso que se quiere quitar
         if current_perm == permiso:
-            del users[from_user]["permisos"][to_user]
-            self.save_users(users)
+            def aplicar(cache):
+                cache["indice"][from_user].pop(to_user, None)
+
+            self._write(lambda: self.storage.delete_permission(from_user, to_user), aplicar)
             print(f"Permiso '{permiso}' eliminado correctamente de {to_user} sobre {from_user}.")
 
             # Eliminar carpeta temporal si ya no tiene permisos
@@ -106,24 +233,289 @@ class UserManager:
                     print(f"Carpeta temporal '{temp_path}' eliminada.")
                 except Exception as e:
                     print(f"No se pudo eliminar la carpeta: {e}")
+            return True
         else:
             print(f"{to_user} tiene permiso '{current_perm}', no coincide con '{permiso}' indicado.")
 
+    @metrics.timed("user_manager")
+    def bulk(self, usuarios=(), cambios=(), simular=False):
+        # Alta de usuarios y cambios de permisos en lote. cambios: tuplas
+        # (accion, dueno, usuario, permiso) con accion "grant" o "revoke", que
+        # se aplican en orden. Todo se valida antes de escribir: si algo falla
+        # no se aplica nada. Devuelve un resumen o None.
+        cache = self._cached()
+        existentes = cache["users"]
+        indice = cache["indice"]
+        errores = []
+
+        nuevos = []
+        vistos = set()
+        for nombre in usuarios:
+            error = _invalid_name(nombre)
+            if error:
+                errores.append(f"Usuario '{nombre}': {error}.")
+            elif nombre in existentes or nombre in vistos:
+                errores.append(f"El usuario '{nombre}' ya existe.")
+            else:
+                nuevos.append(nombre)
+                vistos.add(nombre)
+
+        # Nivel final de cada par (dueño, usuario); None = sin permiso
+        finales = {}
+        for numero, (accion, dueno, usuario, permiso) in enumerate(cambios, 1):
+            donde = f"Cambio {numero} ({accion} {dueno} {usuario} {permiso})"
+            if accion not in ("grant", "revoke"):
+                errores.append(f"{donde}: acción inválida. Use 'grant' o 'revoke'.")
+            elif permiso not in ("read", "write"):
+                errores.append(f"{donde}: permiso inválido. Use 'read' o 'write'.")
+            elif not all(u in existentes or u in vistos for u in (dueno, usuario)):
+                errores.append(f"{donde}: uno o ambos usuarios no existen.")
+            elif dueno == usuario:
+                errores.append(f"{donde}: no se pueden asignar permisos sobre el propio repositorio.")
+            elif accion == "grant":
+                finales[(dueno, usuario)] = permiso
+            else:
+                actual = finales.get((dueno, usuario), indice.get(dueno, {}).get(usuario))
+                if actual != permiso:
+                    errores.append(f"{donde}: {usuario} tiene permiso '{actual}', no coincide con '{permiso}'.")
+                else:
+                    finales[(dueno, usuario)] = None
+
+        if errores:
+            for error in errores[:MAX_ERRORS_SHOWN]:
+                print(error)
+            if len(errores) > MAX_ERRORS_SHOWN:
+                print(f"... y {len(errores) - MAX_ERRORS_SHOWN} errores más.")
+            print("No se aplicó ningún cambio.")
+            return None
+
+        # Solo los pares cuyo nivel cambia de verdad
+        permisos = [(d, u, nivel) for (d, u), nivel in finales.items() if nivel != indice.get(d, {}).get(u)]
+        resumen = {
+            "usuarios": len(nuevos),
+            "otorgados": sum(1 for p in permisos if p[2] is not None),
+            "quitados": sum(1 for p in permisos if p[2] is None),
+        }
+        if simular:
+            print(f"Se crearían {resumen['usuarios']} usuarios, se otorgarían {resumen['otorgados']} "
+                  f"permisos y se quitarían {resumen['quitados']}.")
+            return resumen
+
+        def aplicar(cache):
+            for nombre in nuevos:
+                cache["users"][nombre] = {"permisos": {}}
+                cache["indice"][nombre] = cache["users"][nombre]["permisos"]
+            for dueno, usuario, nivel in permisos:
+                if nivel is None:
+                    cache["indice"][dueno].pop(usuario, None)
+                else:
+                    cache["indice"][dueno][usuario] = nivel
+
+        self._write(lambda: self.storage.apply_batch(nuevos, permisos), aplicar)
+        _create_skeletons(
+            nuevos,
+            [(d, u) for d, u, nivel in permisos if nivel is not None],
+            [(d, u) for d, u, nivel in permisos if nivel is None],
+        )
+        logging.info(f"Lote aplicado: {resumen}")
+        print(f"{resumen['usuarios']} usuarios creados, {resumen['otorgados']} permisos otorgados "
+              f"y {resumen['quitados']} quitados.")
+        return resumen
+
+    def create_users(self, nombres):
+        return self.bulk(usuarios=nombres)
+
+    def import_file(self, path, simular=False):
+        # CSV con encabezado o JSONL: una fila por operación con las columnas
+        # accion (user | grant | revoke), usuario, dueno y permiso.
+        try:
+            filas = _read_rows(path)
+        except (OSError, ValueError) as e:
+            print(f"No se pudo leer '{path}': {e}")
+            return None
+
+        usuarios = []
+        cambios = []
+        errores = []
+        for numero, fila in enumerate(filas, 1):
+            campos = {k: str(v).strip() for k, v in fila.items() if k and v is not None}
+            accion = campos.get("accion", "").lower()
+            if accion == "user":
+                usuarios.append(campos.get("usuario", ""))
+            elif accion in ("grant", "revoke"):
+                cambios.append((accion, campos.get("dueno"), campos.get("usuario"), campos.get("permiso", "").lower()))
+            else:
+                errores.append(f"Fila {numero}: acción inválida '{accion}'.")
+        if errores:
+            for error in errores[:MAX_ERRORS_SHOWN]:
+                print(error)
+            print("No se aplicó ningún cambio.")
+            return None
+        return self.bulk(usuarios, cambios, simular)
+
+    def _save_groups(self, datos, mensaje):
+        self.groups.save(datos)
+        logging.info(mensaje)
+        print(mensaje)
+        return True
+
+    @metrics.timed("user_manager")
+    def define_group(self, nombre, miembros):
+        # miembros: usuarios o "@grupo" para incluir otro grupo. Reemplaza los
+        # miembros anteriores del grupo.
+        if _invalid_name(nombre) or nombre.startswith("@"):
+            print(f"Nombre de grupo inválido: '{nombre}'.")
+            return
+        datos = self.groups.load()
+        grupos = datos["grupos"]
+        for miembro in miembros:
+            if miembro.startswith("@"):
+                if miembro[1:] not in grupos:
+                    print(f"El grupo '{miembro[1:]}' no existe.")
+                    return
+            elif not self.user_exists(miembro):
+                print(f"El usuario '{miembro}' no existe.")
+                return
+
+        propuestos = dict(grupos, **{nombre: list(dict.fromkeys(miembros))})
+        # Un grupo no puede contenerse a sí mismo, ni directa ni indirectamente
+        pendientes = [m[1:] for m in propuestos[nombre] if m.startswith("@")]
+        vistos = set()
+        while pendientes:
+            grupo = pendientes.pop()
+            if grupo == nombre:
+                print(f"El grupo '{nombre}' quedaría dentro de sí mismo.")
+                return
+            if grupo not in vistos:
+                vistos.add(grupo)
+                pendientes += [m[1:] for m in propuestos.get(grupo, ()) if m.startswith("@")]
+
+        datos["grupos"] = propuestos
+        return self._save_groups(datos, f"Grupo '{nombre}' definido con {len(propuestos[nombre])} miembros.")
+
+    @metrics.timed("user_manager")
+    def delete_group(self, nombre):
+        datos = self.groups.load()
+        if nombre not in datos["grupos"]:
+            print(f"El grupo '{nombre}' no existe.")
+            return
+        contenedores = [g for g, miembros in datos["grupos"].items() if "@" + nombre in miembros]
+        if contenedores:
+            print(f"El grupo '{nombre}' forma parte de: {', '.join(sorted(contenedores))}.")
+            return
+        del datos["grupos"][nombre]
+        datos["reglas"] = [r for r in datos["reglas"] if r.get("grupo") != nombre]
+        return self._save_groups(datos, f"Grupo '{nombre}' eliminado junto con sus reglas.")
+
+    @metrics.timed("user_manager")
+    def define_role(self, nombre, permiso):
+        # Un rol es un nombre para un nivel de permiso ("mantenedor" -> "write")
+        if permiso not in ("read", "write"):
+            print("Permiso inválido. Use 'read' o 'write'.")
+            return
+        if _invalid_name(nombre):
+            print(f"Nombre de rol inválido: '{nombre}'.")
+            return
+        datos = self.groups.load()
+        datos["roles"][nombre] = permiso
+        return self._save_groups(datos, f"Rol '{nombre}' definido como '{permiso}'.")
+
+    @metrics.timed("user_manager")
+    def define_project(self, nombre, repos):
+        # repos: dueños de los repositorios que forman el proyecto
+        if _invalid_name(nombre):
+            print(f"Nombre de proyecto inválido: '{nombre}'.")
+            return
+        faltan = [r for r in repos if not self.user_exists(r)]
+        if faltan:
+            print(f"Usuarios inexistentes: {', '.join(faltan)}.")
+            return
+        proyectos = self.groups.load_projects()
+        proyectos[nombre] = dict(proyectos.get(nombre, {}), repos=list(dict.fromkeys(repos)))
+        self.groups.save_projects(proyectos)
+        logging.info(f"Proyecto '{nombre}' definido con {len(repos)} repositorios.")
+        print(f"Proyecto '{nombre}' definido con {len(repos)} repositorios.")
+        return True
+
+    def _rule_target(self, repo, proyecto):
+        if bool(repo) == bool(proyecto):
+            print("Indique un repositorio o un proyecto.")
+            return None
+        if proyecto:
+            if proyecto not in self.groups.load_projects():
+                print(f"El proyecto '{proyecto}' no existe.")
+                return None
+            return {"proyecto": proyecto}
+        if repo != ALL_REPOS and not self.user_exists(repo):
+            print(f"El usuario '{repo}' no existe.")
+            return None
+        return {"repo": repo}
+
+    @metrics.timed("user_manager")
+    def grant_group(self, grupo, rol, repo=None, proyecto=None):
+        # rol: "read", "write" o un rol definido. repo "*" = todos los repositorios
+        datos = self.groups.load()
+        if grupo not in datos["grupos"]:
+            print(f"El grupo '{grupo}' no existe.")
+            return
+        if rol not in ("read", "write") and rol not in datos["roles"]:
+            print(f"Rol inválido: '{rol}'. Use 'read', 'write' o un rol definido.")
+            return
+        destino = self._rule_target(repo, proyecto)
+        if destino is None:
+            return
+        # Una sola regla por grupo y destino: la nueva reemplaza a la anterior
+        datos["reglas"] = [r for r in datos["reglas"] if not _same_rule(r, grupo, destino)]
+        datos["reglas"].append(dict(grupo=grupo, rol=rol, **destino))
+        donde = f"el proyecto '{proyecto}'" if proyecto else f"el repositorio '{repo}'"
+        return self._save_groups(datos, f"Rol '{rol}' otorgado al grupo '{grupo}' sobre {donde}.")
+
+    @metrics.timed("user_manager")
+    def revoke_group(self, grupo, repo=None, proyecto=None):
+        if bool(repo) == bool(proyecto):
+            print("Indique un repositorio o un proyecto.")
+            return
+        datos = self.groups.load()
+        destino = {"proyecto": proyecto} if proyecto else {"repo": repo}
+        restantes = [r for r in datos["reglas"] if not _same_rule(r, grupo, destino)]
+        if len(restantes) == len(datos["reglas"]):
+            print(f"El grupo '{grupo}' no tiene una regla sobre ese destino.")
+            return
+        datos["reglas"] = restantes
+        return self._save_groups(datos, f"Regla del grupo '{grupo}' eliminada.")
+
+    def list_groups(self):
+        datos = self.groups.load()
+        miembros = flatten_groups(datos["grupos"])
+        print("Grupos:")
+        for nombre, lista in sorted(datos["grupos"].items()):
+            print(f"- {nombre}: {', '.join(lista) or '(vacío)'} ({len(miembros[nombre])} usuarios)")
+        if datos["roles"]:
+            print("Roles:")
+            for nombre, permiso in sorted(datos["roles"].items()):
+                print(f"- {nombre}: {permiso}")
+        proyectos = self.groups.load_projects()
+        if proyectos:
+            print("Proyectos:")
+            for nombre, proyecto in sorted(proyectos.items()):
+                print(f"- {nombre}: {', '.join(proyecto.get('repos', []))}")
+        print("Reglas:")
+        for regla in datos["reglas"]:
+            donde = f"proyecto {regla['proyecto']}" if regla.get("proyecto") else f"repositorio {regla.get('repo')}"
+            print(f"- {regla['grupo']}: {regla['rol']} sobre {donde}")
+        return datos
+
     def has_write_permission(self, current_user, target_user):
-        users = self.load_users()
         if current_user == target_user:
             return True
-        return users.get(target_user, {}).get("permisos", {}).get(current_user) == "write"
+        return self.permission_level(current_user, target_user) == "write"
 
     def has_read_permission(self, current_user, target_user):
-        users = self.load_users()
         if current_user == target_user:
             return True
-        return users.get(target_user, {}).get("permisos", {}).get(current_user) in ("read", "write")
+        return self.permission_level(current_user, target_user) in ("read", "write")
 
     def has_any_permission(self, current_user, target_user):
-        users = self.load_users()
         if current_user == target_user:
             return True
-        return current_user in users.get(target_user, {}).get("permisos", {})
-
+        return self.permission_level(current_user, target_user) is not None
@@ -0,0 +1,126 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+
+JOURNAL_EXT = ".journal"
+
+
+class CorruptFileError(ValueError):
+    # Un archivo de datos que no se puede reconstruir (usuarios, grupos) está dañado
+    pass
+
+# Un mismo archivo tiene un único journal: sus escrituras se serializan
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def _lock_for(path):
+    with _locks_guard:
+        return _locks.setdefault(os.path.abspath(path), threading.Lock())
+
+
+def _fsync_dir(path):
+    # En Windows no se pueden abrir directorios para hacer fsync
+    if os.name == "nt":
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_synced(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def atomic_write(path, data, journal=True):
+    # Escribe en un temporal, lo sincroniza y lo renombra sobre el destino: el
+    # archivo siempre contiene la versión anterior o la nueva, nunca una mezcla.
+    # Con journal, antes se deja constancia de la escritura para poder
+    # completarla al arrancar si el proceso se cae a mitad de camino.
+    journal_path = path + JOURNAL_EXT
+    with _lock_for(path):
+        if journal:
+            checksum = hashlib.sha256(data).hexdigest().encode()
+            _write_synced(journal_path, checksum + b"\n" + data)
+
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        _write_synced(tmp, data)
+        os.replace(tmp, path)
+        _fsync_dir(path)
+
+        if journal:
+            _remove_journal(journal_path)
+
+
+def _remove_journal(journal_path):
+    # Un lector de otro proceso pudo haberlo aplicado y borrado ya
+    try:
+        os.remove(journal_path)
+    except FileNotFoundError:
+        pass
+
+
+def atomic_write_json(path, obj, journal=True, **dump_kwargs):
+    data = json.dumps(obj, **dump_kwargs).encode("utf-8")
+    atomic_write(path, data, journal=journal)
+
+
+def recover_journal(path):
+    journal_path = path + JOURNAL_EXT
+    if not os.path.exists(journal_path):
+        return False
+    with _lock_for(path):
+        if not os.path.exists(journal_path):
+            return False
+        return _replay_journal(path, journal_path)
+
+
+def _replay_journal(path, journal_path):
+    try:
+        with open(journal_path, "rb") as f:
+            contenido = f.read()
+    except FileNotFoundError:
+        return False
+    checksum, _, data = contenido.partition(b"\n")
+    if hashlib.sha256(data).hexdigest().encode() != checksum:
+        # El journal quedó a medias: la escritura nunca empezó sobre el destino
+        logging.warning(f"Journal incompleto descartado: {journal_path}")
+        _remove_journal(journal_path)
+        return False
+
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    _write_synced(tmp, data)
+    os.replace(tmp, path)
+    _fsync_dir(path)
+    _remove_journal(journal_path)
+    logging.warning(f"Escritura interrumpida de {path} completada desde el journal.")
+    return True
+
+
+def read_json(path, default, strict=False):
+    # strict: para datos que no se pueden reconstruir. Un archivo dañado se deja
+    # donde está y se lanza CorruptFileError: seguir con default haría que la
+    # siguiente escritura lo reemplace (p. ej. users.json sin ningún usuario).
+    recover_journal(path)
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+    except json.JSONDecodeError as e:
+        if strict:
+            logging.error(f"Archivo {path} dañado ({e}); no se modificará hasta revisarlo.")
+            raise CorruptFileError(f"El archivo {path} está dañado ({e}). Revíselo o restáurelo desde una copia.") from e
+        # No se sobrescribe el archivo dañado: se aparta para poder revisarlo
+        apartado = f"{path}.corrupto-{time.strftime('%Y%m%d%H%M%S')}"
+        os.replace(path, apartado)
+        logging.error(f"Archivo {path} dañado ({e}); movido a {apartado}.")
+        return default
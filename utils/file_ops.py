@@ -1,8 +1,35 @@
 import os
+import shutil
+from itertools import islice
+from utils import metrics
+
+CHUNK_SIZE = 1024 * 1024
+# Las líneas más largas se parten en trozos de este tamaño (en caracteres), así
+# una página ocupa como máximo page_lines * LINE_LIMIT aunque no haya saltos
+LINE_LIMIT = 4096
 
 def get_temp_path(base_path, filename):
     return os.path.join(base_path, filename)
 
+def break_link(path, keep_content=True):
+    # Los archivos materializados con hardlink comparten inodo con las demás
+    # carpetas de trabajo (vía repo_root/<dueño>/enlaces): antes de la primera
+    # escritura se separa una copia privada.
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return
+    if st.st_nlink <= 1:
+        return
+    if keep_content:
+        tmp = f"{path}.{os.getpid()}.tmp"
+        shutil.copyfile(path, tmp)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    else:
+        os.remove(path)
+
+@metrics.timed("file_ops")
 def create_file(path, filename):
     ruta = os.path.join(path, filename)
     if os.path.exists(ruta):
@@ -13,21 +40,95 @@ def create_file(path, filename):
     print("Archivo creado correctamente.")
 
 
+@metrics.timed("file_ops")
 def read_file(base_path, filename):
     path = get_temp_path(base_path, filename)
     if os.path.exists(path):
         with open(path, 'r', encoding='utf-8') as f:
-            return f.read()
+            contenido = f.read()
+        metrics.add_bytes("file_ops", leidos=len(contenido.encode("utf-8")))
+        return contenido
     else:
         print("Archivo no encontrado.")
         return None
 
+def iter_chunks(base_path, filename, chunk_size=CHUNK_SIZE):
+    path = get_temp_path(base_path, filename)
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            metrics.add_bytes("file_ops", leidos=len(chunk))
+            yield chunk
+
+def iter_lines(base_path, filename, limit=LINE_LIMIT):
+    path = get_temp_path(base_path, filename)
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        while True:
+            line = f.readline(limit)
+            if not line:
+                break
+            yield line
+
+def iter_pages(base_path, filename, page_lines=40):
+    # Páginas de page_lines líneas (o trozos de LINE_LIMIT caracteres de una línea
+    # más larga); la memoria usada no depende del tamaño del archivo
+    lines = iter_lines(base_path, filename)
+    while True:
+        page = list(islice(lines, page_lines))
+        if not page:
+            break
+        yield page
+
+@metrics.timed("file_ops")
+def read_range(base_path, filename, offset, length):
+    path = get_temp_path(base_path, filename)
+    fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        if hasattr(os, "pread"):
+            data = os.pread(fd, length, offset)
+        else:
+            os.lseek(fd, offset, os.SEEK_SET)
+            data = os.read(fd, length)
+        metrics.add_bytes("file_ops", leidos=len(data))
+        return data
+    finally:
+        os.close(fd)
+
+@metrics.timed("file_ops")
+def append_file(base_path, filename, content):
+    path = get_temp_path(base_path, filename)
+    break_link(path)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(content)
+    metrics.add_bytes("file_ops", escritos=len(content.encode("utf-8")))
+    print(f"Contenido añadido a '{filename}'.")
+
+@metrics.timed("file_ops")
+def patch_file(base_path, filename, offset, data):
+    # Sobrescribe bytes en una posición sin reescribir el resto del archivo
+    path = get_temp_path(base_path, filename)
+    if not os.path.exists(path):
+        print("Archivo no encontrado.")
+        return
+    break_link(path)
+    with open(path, 'r+b') as f:
+        f.seek(offset)
+        f.write(data)
+    metrics.add_bytes("file_ops", escritos=len(data))
+    print(f"Archivo '{filename}' modificado en la posición {offset}.")
+
+@metrics.timed("file_ops")
 def update_file(base_path, filename, content):
     path = get_temp_path(base_path, filename)
+    break_link(path, keep_content=False)
     with open(path, 'w', encoding='utf-8') as f:
         f.write(content)
+    metrics.add_bytes("file_ops", escritos=len(content.encode("utf-8")))
     print(f"Archivo '{filename}' actualizado.")
 
+@metrics.timed("file_ops")
 def delete_file(base_path, filename):
     path = get_temp_path(base_path, filename)
     if os.path.exists(path):
@@ -35,6 +136,7 @@ def delete_file(base_path, filename):
         print(f"Archivo '{filename}' eliminado.")
     else:
         print("Archivo no encontrado.")
+@metrics.timed("file_ops")
 def list_files(base_path):
     if not os.path.exists(base_path):
         print("La carpeta de trabajo no existe.")
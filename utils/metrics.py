@@ -0,0 +1,181 @@
+import time
+import threading
+import functools
+
+# Métricas del proceso: latencias por operación (histogramas), contadores de
+# bytes / archivos y aciertos de caché. Se registran siempre; registrar una
+# observación cuesta un perf_counter y un lock.
+
+PREFIX = "vcs"
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+_lock = threading.Lock()
+_histogramas = {}  # (componente, op) -> {"buckets": [...], "suma": s, "n": n}
+_contadores = {}   # (nombre, ((etiqueta, valor), ...)) -> total
+# Funciones que devuelven contadores propios al consultar las métricas; para
+# rutas muy calientes donde no compensa tomar el lock en cada llamada.
+_colectores = []
+
+
+def observe(componente, op, segundos):
+    with _lock:
+        h = _histogramas.get((componente, op))
+        if h is None:
+            h = _histogramas[(componente, op)] = {"buckets": [0] * len(BUCKETS), "suma": 0.0, "n": 0}
+        for i, limite in enumerate(BUCKETS):
+            if segundos <= limite:
+                h["buckets"][i] += 1
+                break
+        h["suma"] += segundos
+        h["n"] += 1
+
+
+def inc(nombre, valor=1, **etiquetas):
+    clave = (nombre, tuple(sorted(etiquetas.items())))
+    with _lock:
+        _contadores[clave] = _contadores.get(clave, 0) + valor
+
+
+def add_bytes(componente, leidos=0, escritos=0):
+    if leidos:
+        inc("bytes_leidos", leidos, componente=componente)
+    if escritos:
+        inc("bytes_escritos", escritos, componente=componente)
+
+
+def add_files(componente, cantidad, accion):
+    if cantidad:
+        inc("archivos", cantidad, componente=componente, accion=accion)
+
+
+def cache(nombre, aciertos=0, fallos=0):
+    if aciertos:
+        inc("cache", aciertos, cache=nombre, resultado="acierto")
+    if fallos:
+        inc("cache", fallos, cache=nombre, resultado="fallo")
+
+
+def register(colector):
+    # colector() -> [(nombre, {etiqueta: valor}, total), ...]
+    _colectores.append(colector)
+    return colector
+
+
+def _contadores_actuales():
+    with _lock:
+        contadores = dict(_contadores)
+    for colector in _colectores:
+        for nombre, etiquetas, valor in colector():
+            clave = (nombre, tuple(sorted(etiquetas.items())))
+            contadores[clave] = contadores.get(clave, 0) + valor
+    return contadores
+
+
+def timed(componente, op=None):
+    # Decorador: registra la duración de cada llamada, también si lanza excepción
+    def decorador(func):
+        nombre = op or func.__name__
+
+        @functools.wraps(func)
+        def envoltura(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(componente, nombre, time.perf_counter() - inicio)
+
+        return envoltura
+
+    return decorador
+
+
+def reset():
+    with _lock:
+        _histogramas.clear()
+        _contadores.clear()
+
+
+def snapshot():
+    with _lock:
+        operaciones = {
+            f"{componente}.{op}": {"n": h["n"], "suma": h["suma"], "buckets": list(h["buckets"])}
+            for (componente, op), h in _histogramas.items()
+        }
+    contadores = [
+        {"nombre": nombre, "etiquetas": dict(etiquetas), "valor": valor}
+        for (nombre, etiquetas), valor in _contadores_actuales().items()
+    ]
+    return {"operaciones": operaciones, "contadores": contadores}
+
+
+def _etiquetas(pares):
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pares) + "}"
+
+
+def _limite(valor):
+    return "+Inf" if valor == float("inf") else repr(valor)
+
+
+def render_prometheus():
+    # Formato de texto de Prometheus (exposition format 0.0.4)
+    with _lock:
+        histogramas = sorted((k, dict(h, buckets=list(h["buckets"]))) for k, h in _histogramas.items())
+    contadores = sorted(_contadores_actuales().items())
+
+    lineas = []
+    if histogramas:
+        nombre = f"{PREFIX}_operacion_segundos"
+        lineas.append(f"# HELP {nombre} Duración de las operaciones.")
+        lineas.append(f"# TYPE {nombre} histogram")
+        for (componente, op), h in histogramas:
+            base = (("componente", componente), ("op", op))
+            acumulado = 0
+            for limite, cantidad in zip(BUCKETS, h["buckets"]):
+                acumulado += cantidad
+                lineas.append(f"{nombre}_bucket{_etiquetas(base + (('le', _limite(limite)),))} {acumulado}")
+            lineas.append(f"{nombre}_sum{_etiquetas(base)} {h['suma']!r}")
+            lineas.append(f"{nombre}_count{_etiquetas(base)} {h['n']}")
+
+    tipos_vistos = set()
+    for (nombre, etiquetas), valor in contadores:
+        completo = f"{PREFIX}_{nombre}_total"
+        if completo not in tipos_vistos:
+            tipos_vistos.add(completo)
+            lineas.append(f"# TYPE {completo} counter")
+        lineas.append(f"{completo}{_etiquetas(etiquetas)} {valor}")
+    return "\n".join(lineas) + "\n" if lineas else ""
+
+
+def write_prometheus(path):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(render_prometheus())
+
+
+def print_summary():
+    datos = snapshot()
+    if not datos["operaciones"] and not datos["contadores"]:
+        print("No hay métricas registradas.")
+        return
+    print("\n--- Operaciones ---")
+    for nombre, h in sorted(datos["operaciones"].items()):
+        media = h["suma"] / h["n"] * 1000 if h["n"] else 0
+        print(f"{nombre:40s} {h['n']:8d} llamadas  media {media:9.2f} ms  total {h['suma']:8.3f} s")
+
+    aciertos = {}
+    print("\n--- Contadores ---")
+    for c in sorted(datos["contadores"], key=lambda c: (c["nombre"], sorted(c["etiquetas"].items()))):
+        if c["nombre"] == "cache":
+            par = aciertos.setdefault(c["etiquetas"]["cache"], [0, 0])
+            par[0 if c["etiquetas"]["resultado"] == "acierto" else 1] += c["valor"]
+            continue
+        etiquetas = " ".join(f"{k}={v}" for k, v in sorted(c["etiquetas"].items()))
+        print(f"{c['nombre']:20s} {etiquetas:40s} {c['valor']}")
+
+    if aciertos:
+        print("\n--- Cachés ---")
+        for nombre, (si, no) in sorted(aciertos.items()):
+            if not si + no:
+                continue
+            print(f"{nombre:20s} {si / (si + no) * 100:6.1f} % aciertos ({si} de {si + no})")